@@ -1,15 +1,28 @@
 import json
 from pathlib import Path
 from typing import Optional
-from utils.config import folders
-from agent.document_extraction import run_data_extraction
+from utils.config import dedup_config,folders,ocr_config
+from agent.document_extraction import DocumentExtractor
+from agent.text_splitter import get_text_splitter
+from agent.document_ocr import run_data_ocr
+from agent.document_dedup import run_data_dedup
 from agent.document_processing import run_data_processing
 from agent.document_embedding import embed_documents_chunks
+from agent.document_upsert import run_data_upsert
+from agent.embedded_batch import list_embedded_batches
+from agent.ingestion_manifest import IngestionManifest
+from agent.streaming_pipeline import StreamingPipeline
 
 
 class DocumentPipeline:
-    def __init__(self):
+    def __init__(self,progress=None):
+        """
+            Args:
+                progress : Optional progress tracker (see app.ingestion_jobs.JobProgressReporter) exposing
+                    begin(fns_input,manifest,stages) and stage_started(stage); per file progress arrives through the manifest listener.
+        """
         self.folders = folders.copy()
+        self.progress = progress
     
     # def get_folder_files(self,folder)->list[Path]:
     #     folder_path = Path(self.folders.get(folder, ""))
@@ -23,7 +36,117 @@ class DocumentPipeline:
             return []
         return [f for f in folder_path.iterdir() if f.is_file()]
 
-    def run(self,extract_files:Optional[bool],process_files:Optional[bool],embed_files:Optional[bool],upsert_files:Optional[bool]):
+    def get_stage_files(self,manifest:IngestionManifest,stage:str,folder_path:str,fns_input:list[Path]) -> dict[Path,Path]:
+        """
+            Resolves the output files a finished stage produced for the given input files, as {input file: output file}.
+            Falls back to the stage folder for outputs written before the manifest existed: <name>.jsonl first, then the
+            older <stem> naming, preferring the newest file when a legacy .json and a .jsonl output share a stem.
+        """
+        folder_files = {f.stem:f for f in sorted(self.get_folder_files(folder_path),key=lambda f:f.stat().st_mtime)}
+        stage_files = {}
+        for fn in fns_input:
+            output = manifest.stage_output(stage,fn)
+            if output is not None and Path(output).exists():
+                stage_files[fn] = Path(output)
+            elif fn.name in folder_files:
+                stage_files[fn] = folder_files[fn.name]
+            elif fn.stem in folder_files:
+                stage_files[fn] = folder_files[fn.stem]
+        return stage_files
+
+    def open_manifest(self,fns_input:list[Path],stages:list[str]) -> IngestionManifest:
+        """
+            Loads the ingestion manifest for the input files and hands it to the progress tracker, if any.
+        """
+        manifest = IngestionManifest(self.folders['manifest'])
+        manifest.prune(fns_input)
+        if self.progress is not None:
+            self.progress.begin(fns_input,manifest,stages)
+        return manifest
+
+    def extracted_pending(self,manifest:IngestionManifest,stage:str,fns_input:list[Path],extract_files:bool) -> list[Path]:
+        """
+            Files pending for a stage after extraction. When this run extracts, files whose extraction failed are left out,
+            so an output left over from an earlier version of the file is never processed in its place.
+        """
+        fns_pending = manifest.pending(stage,fns_input)
+        if extract_files:
+            fns_pending = [fn for fn in fns_pending if manifest.is_done('extracted',fn)]
+        return fns_pending
+
+    def stage_started(self,stage:str):
+        if self.progress is not None:
+            self.progress.stage_started(stage)
+
+    def run_ocr(self,manifest:IngestionManifest,fns_input:list[Path]):
+        """
+            Runs the opt-in OCR stage on extracted files that have not been OCR'd with the current config.
+            OCR rewrites the extracted file, so the stages downstream of extraction are reset for those files.
+            Files where the OCR of an image failed stay pending and are retried by the next run.
+        """
+        fns_pending = [
+            fn for fn in manifest.pending('ocr',fns_input)
+            if manifest.is_done('extracted',fn) and manifest.stage_output('extracted',fn)
+        ]
+        if not fns_pending:
+            return
+        fns_extracted = [Path(manifest.stage_output('extracted',fn)) for fn in fns_pending]
+        for fn,n_records,failed in run_data_ocr(fns_pending,fns_extracted,get_text_splitter()):
+            if failed:
+                continue
+            manifest.mark_done('ocr',fn)
+            if n_records:
+                manifest.invalidate(fn,['deduped','processed','embedded','upserted'])
+        manifest.save()
+
+    def run_dedup(self,manifest:IngestionManifest,fns_input:list[Path]):
+        """
+            Marks near-duplicate chunks of the extracted files that have not been deduplicated yet.
+            Files whose marks changed have their downstream stages reset so the duplicates are dropped from (or restored to) them.
+            Files holding duplicates of a chunk evicted by a re-ingested document are deduplicated again in a second pass.
+        """
+        while True:
+            fns_pending = [
+                fn for fn in manifest.pending('deduped',fns_input)
+                if manifest.is_done('extracted',fn) and manifest.stage_output('extracted',fn)
+            ]
+            if not fns_pending:
+                break
+            fns_extracted = [Path(manifest.stage_output('extracted',fn)) for fn in fns_pending]
+            done,orphaned = run_data_dedup(fns_pending,fns_extracted)
+            for fn,n_changed in done:
+                manifest.mark_done('deduped',fn)
+                if n_changed:
+                    manifest.invalidate(fn,['processed','embedded','upserted'])
+            # A pass over orphans evicts nothing (their hashes are current), so this runs at most twice.
+            fns_orphaned = [fn for fn in fns_input if fn.name in orphaned and manifest.is_done('deduped',fn)]
+            if not fns_orphaned:
+                break
+            for fn in fns_orphaned:
+                manifest.invalidate(fn,['deduped'])
+        manifest.save()
+
+    def run_streaming(self) -> dict:
+        """
+            Runs extraction, embedding and upsert as one pipelined pass (see StreamingPipeline),
+            so embeddings for the first files land while later files are still being extracted.
+            Returns:
+                dict : Per-stage throughput and queue depth report.
+        """
+        fns_input = self.get_folder_files(self.folders['input'])
+        stages = ['extracted']
+        stages += ['ocr'] if ocr_config['enabled'] else []
+        stages += ['deduped'] if dedup_config['enabled'] else []
+        manifest = self.open_manifest(fns_input,stages + ['embedded','upserted'])
+        self.stage_started('streaming')
+        try:
+            report = StreamingPipeline(self.folders,manifest).run(fns_input)
+        finally:
+            manifest.save()
+        print(f"Streaming pipeline report : {json.dumps(report)}")
+        return report
+
+    def run(self,extract_files:Optional[bool],process_files:Optional[bool],embed_files:Optional[bool],upsert_files:Optional[bool],streaming:Optional[bool]=False):
         """
             Runs the document processing piepline using defined configuration.
 
@@ -34,24 +157,72 @@ class DocumentPipeline:
                 process_files(Optional[bool],default=True):Flag indicatinf whether to run the data processing process.
                 embedd_files(Optional[bool],default=True):Flag indicatinf whether to run the data embedding stage.
                 upsert_files(Optional[bool],default=True):Flag indicatinf whether to upsert operations into vector databse.
+                streaming(Optional[bool],default=False):Run extraction, embedding and upsert concurrently through bounded queues (run_streaming).
+                    Used when extraction, embedding and upsert are all enabled; processing is not part of the stream.
             Returns:
                 None this method does not return any value. It executes each stage of the pipeline as configured.
+
+            Progress is tracked in an IngestionManifest keyed by file content hash and pipeline config version,
+            so files whose content and config are unchanged skip every stage they already completed.
         """
+        if streaming and extract_files and embed_files and upsert_files:
+            self.run_streaming()
+            return
         fns_input = self.get_folder_files(self.folders['input'])
+        stages = []
+        stages += ['extracted'] if extract_files else []
+        stages += ['ocr'] if extract_files and ocr_config['enabled'] else []
+        stages += ['deduped'] if extract_files and dedup_config['enabled'] else []
+        stages += ['processed'] if process_files else []
+        stages += ['embedded'] if embed_files else []
+        stages += ['upserted'] if upsert_files else []
+        manifest = self.open_manifest(fns_input,stages)
         # print("Input Folder Name:",fns_input)
         if extract_files:
-            print(f"{len(fns_input)} files are ready for extraction.")
-            fns_extracted = run_data_extraction(fns_input,self.folders['extracted'])
-        # if process_files:
-        #     if not extract_files:
-        #         fns_extracted = self.get_folder_files(self.folders['extracted'])
-        #     print(f"{len(fns_extracted)} files are ready for processing.")
-        #     fns_processed = run_data_processing(fns_extracted,self.folders['processed'])
+            self.stage_started('extracted')
+            fns_pending = manifest.pending('extracted',fns_input)
+            print(f"{len(fns_pending)} of {len(fns_input)} files are ready for extraction.")
+            if fns_pending:
+                extractor = DocumentExtractor(fns_pending,self.folders['extracted'])
+                extractor.run()
+                # Only files that extracted cleanly are marked; failed ones stay pending and are retried on the next run.
+                for fn,output in extractor.extracted_sources.items():
+                    manifest.mark_done('extracted',fn,str(output))
+            manifest.save()
+        if extract_files and ocr_config['enabled']:
+            self.stage_started('ocr')
+            self.run_ocr(manifest,fns_input)
+        if extract_files and dedup_config['enabled']:
+            self.stage_started('deduped')
+            self.run_dedup(manifest,fns_input)
+        if process_files:
+            self.stage_started('processed')
+            fns_pending = self.extracted_pending(manifest,'processed',fns_input,extract_files)
+            fns_extracted = list(self.get_stage_files(manifest,'extracted',self.folders['extracted'],fns_pending).values())
+            print(f"{len(fns_extracted)} files are ready for processing.")
+            fns_processed = run_data_processing(fns_extracted,self.folders['processed']) if fns_extracted else []
+            manifest.mark_outputs('processed',fns_pending,fns_processed)
+            manifest.save()
         if embed_files:
-            if not extract_files:
-                fns_extracted = self.get_folder_files(self.folders['extracted'])
-                print("Input Folder Name:",fns_extracted)
-            print(f"{len(fns_extracted)} files are ready for embedding.")
-            fns_embedded = embed_documents_chunks(fns_extracted,self.folders['embedded'])
-            
+            self.stage_started('embedded')
+            fns_pending = self.extracted_pending(manifest,'embedded',fns_input,extract_files)
+            extracted_by_input = self.get_stage_files(manifest,'extracted',self.folders['extracted'],fns_pending)
+            print(f"{len(extracted_by_input)} files are ready for embedding.")
+            if extracted_by_input:
+                fns_embedded,fns_failed = embed_documents_chunks(list(extracted_by_input.values()),self.folders['embedded'])
+                # Files with a batch that failed after its retries stay pending, so the next run embeds their missing chunks.
+                fns_failed = set(fns_failed)
+                for fn,fn_extracted in extracted_by_input.items():
+                    if fn_extracted not in fns_failed:
+                        manifest.mark_done('embedded',fn)
+            manifest.save()
+        if upsert_files:
+            self.stage_started('upserted')
+            fns_embedded = list_embedded_batches(self.folders['embedded'])
+            print(f"{len(fns_embedded)} embedded batches are ready for upserting.")
+            version = run_data_upsert(fns_embedded)
+            for fn in fns_input:
+                if manifest.is_done('embedded',fn):
+                    manifest.mark_done('upserted',fn,version)
+        manifest.save()
 
@@ -0,0 +1,307 @@
+import json
+import os
+import re
+import shutil
+import uuid
+import zlib
+from pathlib import Path
+from typing import Iterator,Optional
+import numpy as np
+from agent.document_embedding import document_hash,format_chunk
+from common.metadata_index import FILTER_COLUMNS,DuplicateAliases,get_duplicate_aliases
+from common.vector_db_connection import document_hash_of
+from utils.config import dedup_config
+from utils.utils import JsonlWriter,iter_records
+
+WORD_PATTERN = re.compile(r"\w+")
+NUMBER_PATTERN = re.compile(r"\d")
+# Largest prime below 2**32: a * x + b stays below 2**64 for 32 bit shingle hashes.
+HASH_PRIME = np.uint64(4294967291)
+
+
+def chunk_metadata(record:dict,extracted_file:Path,chunk_id:int,hashes:dict) -> dict:
+    """
+        Store metadata the embedding stage gives an extracted chunk (see format_chunk). Its unique_id (document name, source
+        document hash, page span and content hash) is the chunk's key in the index and the pointer stored in the duplicate_of
+        field of dropped chunks, so it resolves to the canonical chunk's row.
+    """
+    extracted_file = Path(extracted_file)
+    chunk = format_chunk(record,extracted_file.name,extracted_file.name,0,chunk_id,document_hash(record,extracted_file,hashes))
+    chunk['document_hash'] = document_hash_of(chunk['unique_id'])
+    return {col:chunk[col] if chunk[col] is not None else 0 for col in FILTER_COLUMNS}
+
+
+def key_document(key:str) -> tuple[str,str]:
+    """
+        (document_name, document hash) of a chunk key.
+    """
+    return key.rsplit("_",3)[0],document_hash_of(key)
+
+
+def numbers_fingerprint(tokens:list[str]) -> int:
+    """
+        CRC32 of the numeric tokens of a chunk, in order. Chunks are only collapsed when their fingerprints are equal.
+    """
+    return zlib.crc32("|".join(token for token in tokens if NUMBER_PATTERN.search(token)).encode("utf-8"))
+
+
+class MinHasher(object):
+    """
+        MinHash signatures over word shingles, computed with num_perm universal hash functions (a * x + b) mod p in NumPy.
+    """
+    def __init__(self,num_perm:int,shingle_size:int,seed:int=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1,int(HASH_PRIME),size=num_perm,dtype=np.uint64)
+        self.b = rng.integers(0,int(HASH_PRIME),size=num_perm,dtype=np.uint64)
+
+    def shingles(self,tokens:list[str]) -> np.ndarray:
+        k = self.shingle_size
+        grams = [" ".join(tokens[i:i+k]) for i in range(max(1,len(tokens)-k+1))]
+        return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams),dtype=np.uint64,count=len(grams)))
+
+    def signature(self,tokens:list[str]) -> np.ndarray:
+        hashes = self.shingles(tokens)
+        return ((self.a[:,None] * hashes[None,:] + self.b[:,None]) % HASH_PRIME).min(axis=1).astype(np.uint32)
+
+
+class DedupIndex(object):
+    """
+        Corpus wide LSH index of chunk MinHash signatures.
+
+        A signature is split into bands of rows; two chunks become candidates when any band matches exactly, and a candidate is
+        accepted when the share of equal signature positions (the Jaccard estimate) reaches the threshold and both chunks carry
+        the same numbers in the same order: a restated figure ($4,512 vs $3,981) barely moves the Jaccard estimate of a long
+        paragraph, but the chunks are not interchangeable.
+        The index persists across runs (path/CURRENT points to the live copy), so new files are deduplicated against everything ingested before.
+        Entries are scoped by document version (the document hash in the key): evict_document() drops the entries of the
+        earlier versions of a re-ingested document, and the documents holding duplicates of them (their referrers) are returned
+        so they can be deduplicated again. Evicted entries are skipped until the next save() leaves them out.
+    """
+    def __init__(self,config:dict=None):
+        self.config = config or dedup_config
+        self.num_perm = self.config['num_perm']
+        self.bands = self.config['bands']
+        if self.num_perm % self.bands:
+            raise ValueError(f"bands={self.bands} must divide num_perm={self.num_perm}.")
+        self.rows = self.num_perm // self.bands
+        self.threshold = self.config['threshold']
+        self.min_tokens = self.config['min_tokens']
+        self.hasher = MinHasher(self.num_perm,self.config['shingle_size'])
+        self.keys = []
+        self.key_index = {}
+        self.referrers = []
+        self.numbers = []
+        self.evicted = set()
+        self._documents = {}
+        self._signatures = []
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def __len__(self):
+        return len(self.keys) - len(self.evicted)
+
+    def _band_keys(self,signature:np.ndarray) -> list[bytes]:
+        return [signature[b*self.rows:(b+1)*self.rows].tobytes() for b in range(self.bands)]
+
+    def _insert(self,key:str,signature:np.ndarray,band_keys:list[bytes],numbers:int,referrers:set=None):
+        idx = len(self.keys)
+        self.keys.append(key)
+        self.key_index[key] = idx
+        self.referrers.append(set(referrers or ()))
+        self.numbers.append(numbers)
+        self._documents.setdefault(key_document(key)[0],[]).append(idx)
+        self._signatures.append(signature)
+        for bucket,band_key in zip(self._buckets,band_keys):
+            bucket.setdefault(band_key,[]).append(idx)
+
+    def add_referrer(self,canonical_key:str,document_name:str):
+        """
+            Records that a document holds a duplicate of the canonical chunk.
+        """
+        self.referrers[self.key_index[canonical_key]].add(document_name)
+
+    def evict_document(self,document_name:str,keep_hash:str) -> set[str]:
+        """
+            Evicts the entries of a document whose hash is not keep_hash, i.e. its earlier versions.
+            Returns:
+                set[str] : Other documents with duplicates of an evicted chunk; their duplicate_of pointers are stale.
+        """
+        orphaned = set()
+        for idx in self._documents.get(document_name,[]):
+            if idx not in self.evicted and key_document(self.keys[idx])[1] != keep_hash:
+                self.evicted.add(idx)
+                orphaned.update(self.referrers[idx])
+        orphaned.discard(document_name)
+        return orphaned
+
+    def canonical(self,key:str,text:str) -> Optional[str]:
+        """
+            Returns the key of an earlier near-duplicate of the chunk, or None after indexing it as a new canonical chunk.
+            A key already in the index (a re-run over the same file) is its own canonical chunk.
+        """
+        if key in self.key_index:
+            # A document reverted to an evicted version: its chunks are canonical again.
+            self.evicted.discard(self.key_index[key])
+            return None
+        tokens = WORD_PATTERN.findall(text.lower())
+        if len(tokens) < self.min_tokens:
+            return None
+        signature = self.hasher.signature(tokens)
+        band_keys = self._band_keys(signature)
+        numbers = numbers_fingerprint(tokens)
+        candidates = set()
+        for bucket,band_key in zip(self._buckets,band_keys):
+            candidates.update(bucket.get(band_key,()))
+        candidates = {idx for idx in candidates if idx not in self.evicted and self.numbers[idx] == numbers}
+        if candidates:
+            candidates = np.fromiter(candidates,dtype=np.int64,count=len(candidates))
+            similarity = (np.stack([self._signatures[i] for i in candidates]) == signature).mean(axis=1)
+            best = int(similarity.argmax())
+            if similarity[best] >= self.threshold:
+                return self.keys[candidates[best]]
+        self._insert(key,signature,band_keys,numbers)
+        return None
+
+    def save(self,path:str):
+        """
+            Persists the signatures, keys and referrers of the live entries in a fresh directory and atomically repoints
+            path/CURRENT to it.
+        """
+        root = Path(path)
+        root.mkdir(parents=True,exist_ok=True)
+        live = [idx for idx in range(len(self.keys)) if idx not in self.evicted]
+        name = f"index_{len(live)}_{uuid.uuid4().hex[:8]}"
+        tmp_dir = root/f".tmp_{name}"
+        tmp_dir.mkdir()
+        signatures = np.stack([self._signatures[idx] for idx in live]) if live else np.empty((0,self.num_perm),dtype=np.uint32)
+        np.save(tmp_dir/"signatures.npy",signatures)
+        with open(tmp_dir/"keys.json","w",encoding="utf-8") as f:
+            json.dump({
+                "keys":[self.keys[idx] for idx in live],
+                "referrers":[sorted(self.referrers[idx]) for idx in live],
+                "numbers":[self.numbers[idx] for idx in live],
+                "num_perm":self.num_perm,
+                "shingle_size":self.hasher.shingle_size
+            },f,ensure_ascii=False)
+        os.rename(tmp_dir,root/name)
+        tmp_pointer = root/"CURRENT.tmp"
+        tmp_pointer.write_text(name,encoding="utf-8")
+        os.replace(tmp_pointer,root/"CURRENT")
+        for old in root.glob("index_*"):
+            if old.name != name:
+                shutil.rmtree(old,ignore_errors=True)
+
+    @classmethod
+    def load(cls,path:str,config:dict=None) -> "DedupIndex":
+        """
+            Loads the index path/CURRENT points to. Returns an empty index when none was saved or the MinHash settings changed.
+        """
+        index = cls(config)
+        root = Path(path)
+        if not (root/"CURRENT").exists():
+            return index
+        index_dir = root/(root/"CURRENT").read_text(encoding="utf-8").strip()
+        with open(index_dir/"keys.json","r",encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta['num_perm'] != index.num_perm or meta['shingle_size'] != index.hasher.shingle_size:
+            print("Dedup index was built with other MinHash settings, starting a new one.")
+            return index
+        if "referrers" not in meta or "numbers" not in meta:
+            # Indexes saved before keys were store unique_ids (or before numbers were compared) cannot be trusted, the index starts over.
+            print("Dedup index uses an older format, starting a new one.")
+            return index
+        for key,signature,numbers,referrers in zip(meta['keys'],np.load(index_dir/"signatures.npy"),meta['numbers'],meta['referrers']):
+            index._insert(key,signature,index._band_keys(signature),numbers,referrers)
+        return index
+
+
+class ChunkDeduplicator(object):
+    """
+        Marks near-duplicate chunks of extracted files with a duplicate_of pointer to their canonical chunk (its vector store
+        unique_id). Marked records stay in the extracted file (so nothing is lost) and are skipped by the embedding stage.
+        The first chunk of a file evicts the index entries of the earlier versions of its document; orphaned collects the
+        documents whose duplicates pointed at an evicted chunk, which have to be deduplicated (and embedded) again.
+        The marks of each file are also recorded as DuplicateAliases, so metadata filters on the file reach the canonical rows.
+    """
+    def __init__(self,index:DedupIndex=None,index_path:str=None,aliases:DuplicateAliases=None):
+        self.index_path = index_path or dedup_config['index_path']
+        self.index = index if index is not None else DedupIndex.load(self.index_path)
+        self.aliases = aliases if aliases is not None else get_duplicate_aliases()
+        self.n_chunks = 0
+        self.n_duplicates = 0
+        self.n_changed = 0
+        self.orphaned = set()
+
+    def iter_marked(self,records,extracted_file:Path,aliases:list[dict]) -> Iterator[dict]:
+        """
+            Yields the records with their duplicate_of marks renewed, appending an alias for every marked chunk to aliases.
+        """
+        hashes = {}
+        evicted = False
+        for chunk_id,record in enumerate(records):
+            previous = record.pop('duplicate_of',None)
+            if isinstance(record.get('content'),str):
+                self.n_chunks += 1
+                metadata = chunk_metadata(record,extracted_file,chunk_id,hashes)
+                key = metadata['unique_id']
+                document_name,current_hash = key_document(key)
+                if not evicted:
+                    self.orphaned |= self.index.evict_document(document_name,current_hash)
+                    evicted = True
+                canonical = self.index.canonical(key,record['content'])
+                if canonical is not None:
+                    record['duplicate_of'] = canonical
+                    self.index.add_referrer(canonical,document_name)
+                    aliases.append({"canonical":canonical,**metadata})
+                    self.n_duplicates += 1
+            if record.get('duplicate_of') != previous:
+                self.n_changed += 1
+            yield record
+
+    def dedup_file(self,filename:Path,extracted_file:Path) -> int:
+        """
+            Rewrites an extracted file with its near-duplicate chunks marked.
+            Returns:
+                int : Number of chunks whose mark changed (newly marked, repointed or unmarked).
+        """
+        before = self.n_changed
+        aliases = []
+        with JsonlWriter(extracted_file) as writer:
+            writer.write_many(self.iter_marked(iter_records(extracted_file),Path(extracted_file),aliases))
+        self.aliases.set_document(Path(extracted_file).stem,aliases)
+        return self.n_changed - before
+
+    def save(self):
+        self.index.save(self.index_path)
+
+    def stats(self) -> dict:
+        return {
+            "chunks":self.n_chunks,
+            "duplicates":self.n_duplicates,
+            "dedup_ratio":round(self.n_duplicates / self.n_chunks,4) if self.n_chunks else 0.0,
+            "indexed":len(self.index)
+        }
+
+
+def run_data_dedup(input_files:list[Path],extracted_files:list[Path]) -> tuple[list[tuple[Path,int]],set[str]]:
+    """
+        Main function to run near-duplicate elimination over extracted files, in order.
+        Args:
+            input_files(list[Path]) : Source files.
+            extracted_files(list[Path]) : Extracted file of each source, in the same order.
+        Returns:
+            tuple[list[tuple[Path,int]],set[str]] : (source file, chunks whose mark changed) for the files that were processed,
+                                                    and the names of other documents to deduplicate again (see ChunkDeduplicator).
+    """
+    print(f"Running near-duplicate elimination for {len(input_files)} files.")
+    deduplicator = ChunkDeduplicator()
+    done = []
+    for fn,extracted in zip(input_files,extracted_files):
+        try:
+            done.append((fn,deduplicator.dedup_file(fn,extracted)))
+        except Exception as e:
+            print(f"Dedup failed for file {fn}: {e!r}")
+    deduplicator.save()
+    print(f"Dedup complete : {deduplicator.stats()}")
+    return done,deduplicator.orphaned
@@ -1,56 +1,150 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
+import hashlib
 import json
 import os
-import uuid
-from nomic import embed
+import random
+import time
+from common.embedding_connection import get_embedder
+from common.embedding_cache import get_embedding_cache
+from common.lexical_index import get_lexical_index
+from common.vector_db_config import lexical_index_config
+from common.vector_db_connection import get_vector_store
+from agent.embedded_batch import write_embedded_batch
+from agent.embedding_log import get_embedding_log
+from utils.config import embedding_config
+from utils.utils import JsonlWriter,file_content_hash,iter_records
 from dotenv import load_dotenv
 load_dotenv()
 # import os
 nomic_api_key = os.getenv("NOMIC_API_KEY")
 
 def generate_batch_embeddings(batch:list[str]) -> list:
+    """
+        Embeds a batch of texts with the backend selected in embedding_config.
+        Returns a float32 array of shape (len(batch), dimension), or an empty list if the backend failed.
+    """
     try:
-        response = embed.text(
-            texts=batch,
-            model='nomic-embed-text-v1',
-            task_type='embedding',
-        )
-        embeddings = response['embeddings']
+        embeddings = get_embedder().embed(batch)
         return embeddings
     except Exception as e:
         print(f"Error generating embeddings: {e}")
         return []
 
 def embed_batch(batch:list[dict]) ->dict:
+    """
+        Adds an 'embedding' to every chunk of the batch, a float32 numpy row kept as is until write_embedded_batch stacks
+        the rows into the vector block (no per-float Python objects).
+        Chunks whose text is already in the embedding cache reuse the stored vector, only the misses are sent to the embedder.
+        Raises RuntimeError when the embedder does not return one vector per text, so callers can retry the batch.
+    """
     batch_texts = list(map(lambda x: x['document_text'],batch))
-    try:
-        print("Batch Text: ",batch_texts)
-        batch_embeddings = generate_batch_embeddings(batch_texts)
-    except Exception as e:
-        print(f"Failed to embed batch: {e}")
-    return [
-        chunk.update({
-            "embedding":emb
-        }) for chunk,emb in zip(batch,batch_embeddings)
-    ]
-
-def generate_hybrid_unique_id(document_name:str,document_chunk:str) ->str:
-    uuid_part = str(uuid.uuid4())
-    unique_doc_id = f"{document_name}_{document_chunk}_{uuid_part}"
+    cache = get_embedding_cache()
+    model_name = get_embedder().model_name
+    batch_embeddings = cache.get_many(model_name,batch_texts) if cache else [None]*len(batch_texts)
+    miss_idx = [idx for idx,emb in enumerate(batch_embeddings) if emb is None]
+    if miss_idx:
+        miss_texts = [batch_texts[idx] for idx in miss_idx]
+        miss_embeddings = generate_batch_embeddings(miss_texts)
+        if len(miss_embeddings) != len(miss_texts):
+            raise RuntimeError(f"Embedder returned {len(miss_embeddings)} vectors for {len(miss_texts)} texts.")
+        for idx,emb in zip(miss_idx,miss_embeddings):
+            batch_embeddings[idx] = emb
+        if cache:
+            cache.put_many(model_name,miss_texts,miss_embeddings)
+    for chunk,emb in zip(batch,batch_embeddings):
+        if emb is not None:
+            chunk.update({
+                "embedding":emb
+            })
+    return batch
+
+def save_batch(batch:list[dict],created_time:datetime,batch_id:int,output_dir:str) -> Path:
+    """
+        Writes an embedded batch to its own batch directory in the embedded folder (see agent.embedded_batch.write_embedded_batch).
+        The batch is durable when this returns, so it can be logged in the EmbeddingLog.
+        Args :
+            batch (list[dict]) : Embedded chunks.
+            created_time (datetime) : Start time of the embedding run, shared by all its batches.
+            batch_id (int) : Sequence number of the batch within the run.
+            output_dir (str) : Directory for the batches.
+        Returns :
+            Path : The written batch directory.
+    """
+    return write_embedded_batch(Path(output_dir)/f"batch_{created_time:%Y%m%d_%H%M%S_%f}_{batch_id:05d}",batch)
+
+def add_to_lexical_index(batch:list[dict],lexical_index) -> None:
+    """
+        Adds the embedded chunks of a saved batch to the BM25 inverted index, keyed by unique_id.
+    """
+    embedded = [chunk for chunk in batch if chunk.get('embedding') is not None]
+    lexical_index.add_documents(
+        [chunk['unique_id'] for chunk in embedded],
+        [chunk['document_text'] for chunk in embedded]
+    )
+
+def log_batch(batch:list[dict],batch_file:Path,embedding_log) -> int:
+    """
+        Records a saved batch in the embedding write-ahead log and returns its sequence number.
+    """
+    embedded = [chunk for chunk in batch if chunk.get('embedding') is not None]
+    return embedding_log.append(
+        batch_file,
+        {chunk['document_name'] for chunk in embedded},
+        [chunk['unique_id'] for chunk in embedded]
+    )
+
+def already_embedded_check(embedding_log,lexical_index):
+    """
+        Builds the skip predicate of iter_chunk_batches: a chunk is skipped when its unique_id is in the embedding log
+        or in the published vector store. Skipped chunks are (re)added to the lexical index, which is only saved at the end of a run.
+    """
+    snapshot = get_vector_store().refresh()
+
+    def already_embedded(chunk:dict) -> bool:
+        unique_id = chunk['unique_id']
+        if embedding_log.contains(unique_id) or snapshot.find_rows([unique_id])[0] >= 0:
+            lexical_index.add_documents([unique_id],[chunk['document_text']])
+            return True
+        return False
+    return already_embedded
+
+def generate_hybrid_unique_id(document_name:str,document_hash:str,page_start:int,page_end:int,document_text:str) ->str:
+    """
+        Content derived chunk id: document name, source document hash, page span and a hash of the chunk text.
+        The same chunk of the same document always gets the same id, so re-ingesting a document reproduces its ids
+        and the upsert can skip rows the store already holds.
+    """
+    content_hash = hashlib.sha256(document_text.encode("utf-8")).hexdigest()[:16]
+    unique_doc_id = f"{document_name}_{document_hash[:16]}_{page_start}-{page_end}_{content_hash}"
     # print(f"Generated UUID: {unique_doc_id}")
     return unique_doc_id
 
-def format_chunk(chunk:dict,fn_str:str,fn_uri:str,doc_id:int,chunk_id:int) ->dict:
+def document_hash(record:dict,fn:Path,cache:dict) -> str:
+    """
+        Content hash of the source document of an extracted record, falling back to the extracted file when the source is gone.
+        Hashes are cached per path for the duration of an embedding run.
+    """
+    source = record.get('source') or record.get('metadata',{}).get('source')
+    path = Path(source) if source and Path(source).is_file() else fn
+    key = str(path)
+    if key not in cache:
+        cache[key] = file_content_hash(path)
+    return cache[key]
+
+def format_chunk(chunk:dict,fn_str:str,fn_uri:str,doc_id:int,chunk_id:int,doc_hash:str) ->dict:
     # print(chunk.keys())
     # page_numbers = [
     #     item['page'] for item in chunk if 'page' in item.keys()
     # ]
-    page_numbers = chunk.get("page", None)
-    if page_numbers ==0:
-        page_numbers = 1
-    page_numbers = [page_numbers]    
+    page_numbers = [chunk.get("page", None)]
+    # PDF text chunks that run across a page break also carry the page they end on.
+    if chunk.get("page_end") is not None:
+        page_numbers.append(chunk['page_end'])
+    page_numbers = [1 if page == 0 else page for page in page_numbers]
     chunk_prepared = {
         "document_id":doc_id,
         "document_name": f"{Path(fn_str).stem}",
@@ -67,76 +161,141 @@ def format_chunk(chunk:dict,fn_str:str,fn_uri:str,doc_id:int,chunk_id:int) ->dic
     chunk_prepared.update({
         "unique_id":generate_hybrid_unique_id(
             chunk_prepared['document_name'],
-            chunk_prepared['chunk_id']
+            doc_hash,
+            chunk_prepared['page_start'],
+            chunk_prepared['page_end'],
+            chunk_prepared['document_text']
         )
     })
     return chunk_prepared
 
+def iter_chunk_batches(data_input:list[Path],batch_size:int,first_doc_id:int=0,first_batch_id:int=0,skip=None):
+    """
+        Streams formatted chunks from the extracted files and groups them into batches.
+        The final partial batch is yielded as well, so no chunk is dropped.
+        Args :
+            data_input (list) : Extracted files to read.
+            batch_size (int) : Chunks per batch.
+            first_doc_id (int) : document_id of the first file, for callers feeding files one at a time.
+            first_batch_id (int) : batch_id of the first batch, keeps batch file names unique across calls.
+            skip (Callable[[dict],bool]) : Optional predicate on formatted chunks, True drops the chunk (see already_embedded_check).
+        Yields :
+            tuple[int,list[dict]] : (batch_id, batch) in reading order.
+    """
+    batch_id = first_batch_id
+    batch = []
+    hashes = {}
+    for doc_id,fn in enumerate(data_input,start=first_doc_id):
+        print(f"==================================")
+        print(f"Preparing document: {fn.name}")
+        # Records are streamed from the extracted file, only the current batch is kept in memory.
+        try :
+            for chunk_id,data_i in enumerate(iter_records(fn)):
+                # Near-duplicates marked by the dedup stage point at a canonical chunk and are not embedded.
+                if data_i.get('duplicate_of') is not None:
+                    continue
+                chunk = format_chunk(data_i,fn.name,fn.name,doc_id,chunk_id,document_hash(data_i,fn,hashes))
+                if skip is not None and skip(chunk):
+                    continue
+                batch.append(chunk)
+                if len(batch) >= batch_size:
+                    yield batch_id,batch
+                    batch = []
+                    batch_id += 1
+        except json.JSONDecodeError as e:
+            print(f"Error in decoding json for filename : {fn.name}, error : {e}.")
+    if len(batch) > 0:
+        yield batch_id,batch
+
+def embed_batch_with_retry(batch:list[dict],max_retries:int,retry_backoff:float) -> list[dict]:
+    """
+        Runs embed_batch, retrying failed attempts with exponential backoff and jitter.
+        Args :
+            batch (list[dict]) : Chunks to embed.
+            max_retries (int) : Retries after the first attempt.
+            retry_backoff (float) : Base delay in seconds, doubled on every retry.
+        Returns :
+            list[dict] : The embedded chunks.
+        Raises :
+            Exception : The last error once the retries are exhausted.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return embed_batch(batch)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * (2 ** attempt) * (1 + random.random())
+            print(f"Embedding attempt {attempt+1} failed: {e}. Retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
 def embed_documents_chunks(data_input:list[Path],output_dir:str)->list:
     """
         Processes a list of documents, extracts text, generates embeddings in batches, and returns a DataFrame with embedding added.
+        Up to embedding_config['max_in_flight'] batches are embedded concurrently in a thread pool. Reading stops while that many
+        batches are pending (backpressure), and batches are saved in reading order, so the output is deterministic.
+        Every saved chunk is also added to the BM25 inverted index in the same pass, keyed by its unique_id.
+        Saved batches are logged in the EmbeddingLog, and chunks already logged or stored are not embedded again,
+        so a run interrupted by a crash resumes where it stopped.
         Args : 
             data_input (list) : A list of files containing the documents to process.
             output_dir (str) : Directory to output updated Chunks.
         Returns :
-            str : Datetime of processed batch for file identification. 
+            tuple[list[Path],set[Path]] : The batch directories written to output_dir, and the input files with chunks in a batch
+                                          that still failed after its retries (not fully embedded, to be retried by a later run).
     """
     created_time = datetime.now()
-    batch_size = os.getenv("BATCH_SIZE")
-    batch_id=0
-    print(f"Starting document embedding for {len(data_input)} files.")
-    print(f"Embedding for chunks in batches {len(batch_size)}")
-    batch = []
+    embedder = get_embedder()
+    batch_size = embedder.batch_size
+    max_in_flight = max(1,int(embedding_config['max_in_flight']))
+    n_batches = 0
+    print(f"Starting document embedding for {len(data_input)} files with {embedder.model_name}.")
+    print(f"Embedding for chunks in batches {batch_size}, {max_in_flight} batches in flight.")
     output_files = []
+    failed_files = set()
+    files_by_name = {fn.name:fn for fn in data_input}
+    in_flight = deque()
+    lexical_index = get_lexical_index()
+    embedding_log = get_embedding_log()
 
-    for doc_id,fn in enumerate(data_input):
-        print(f"==================================")
-        print(f"Preparing document: {fn.name}")
+    def save_oldest():
+        batch_id,batch,future = in_flight.popleft()
+        try:
+            batch = future.result()
+            fn_batch = save_batch(
+                batch=batch,
+                created_time = created_time,
+                batch_id = batch_id,
+                output_dir = output_dir
+            )
+            log_batch(batch,fn_batch,embedding_log)
+            output_files.append(fn_batch)
+            add_to_lexical_index(batch,lexical_index)
+        except Exception as e:
+            failed_files.update(files_by_name[chunk['document_link']] for chunk in batch)
+            print(f"Failed to embed batch : {batch_id}: {e}")
 
-        try :
-            with open(fn,"r",encoding="utf-8") as f:
-                doc_elements = json.load(f)
-            # doc_elements = json.loads(fn.name)
-        except json.JSONDecodeError as e:
-            print(f"Error in decoding json for filename : {fn.name}, error : {e}.")
-        
-        for chunk_id,data_i in enumerate(doc_elements):
-            # print(f"Chunk ID: {chunk_id}, Data: {data_i}")
-            batch.append(format_chunk(data_i,fn.name,fn.name,doc_id,chunk_id))
-            if isinstance(len(batch),int):
-                if len(batch) >= batch_size:
-                    try:
-                        print("In Batch",batch)
-                        batch = embed_batch(
-                            batch = batch
-                        )
-                        
-                        # fn_batch = save_batch(
-                        #     batch=batch,
-                        #     created_time = created_time,
-                        #     batch_id = batch_id
-                        # )
-                        # output_files.append(fn_batch)
-                    except Exception as e:
-                        print(f"Failed to embed batch : {batch_id}: e")
-                    finally:
-                        batch=[]
-                        batch_id+=1
-        # if len(batch)>0:
-        #     try:
-        #         batch = embed_batch(
-        #             batch = batch
-        #         )
-        #         fn_batch = save_batch(
-        #             batch=batch,
-        #             created_time = created_time,
-        #             batch_id = batch_id
-        #         )
-        #         output_files.append(fn_batch)
-        #     except Exception as e:
-        #         print(f"Failed to embed batch : {batch_id}: e")
-
-    print(f"Embeddings complete for {batch_id+1} batches.")
+    already_embedded = already_embedded_check(embedding_log,lexical_index)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for batch_id,batch in iter_chunk_batches(data_input,batch_size,skip=already_embedded):
+            in_flight.append((batch_id,batch,executor.submit(
+                embed_batch_with_retry,
+                batch,
+                embedding_config['max_retries'],
+                embedding_config['retry_backoff']
+            )))
+            n_batches += 1
+            if len(in_flight) >= max_in_flight:
+                save_oldest()
+        while in_flight:
+            save_oldest()
+
+    print(f"Embeddings complete for {n_batches} batches.")
+    lexical_index.save(lexical_index_config['path'])
+    print(f"Lexical index now holds {len(lexical_index)} chunks.")
+    if get_embedding_cache():
+        print(f"Embedding cache : {get_embedding_cache().stats()}")
+    if failed_files:
+        print(f"{len(failed_files)} files have batches that failed to embed: {sorted(fn.name for fn in failed_files)}")
     print(f"Time created : {created_time}")
-    # return output_files
-    
\ No newline at end of file
+    return output_files,failed_files
@@ -3,28 +3,18 @@ from pathlib import Path
 # import unstructured.partition
 # from unstructured.partition.pdf import partition_pdf
 # from unstructured.staging.base import dict_to_elements , elements_to_json
-import pdfplumber
 import os
 import json
 from pathlib import Path
-import io
 
 # LangChain loaders & utilities
-from langchain.document_loaders import (
-    # UnstructuredWordDocumentLoader,
-    # UnstructuredPowerPointLoader,
-    # CSVLoader,
-    PyMuPDFLoader,
-    # TextLoader,
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
-# OCR
-import pytesseract
-from PIL import Image
-
-# PDF table extraction
-import pdfplumber
+# from langchain.document_loaders import (
+#     UnstructuredWordDocumentLoader,
+#     UnstructuredPowerPointLoader,
+#     CSVLoader,
+#     PyMuPDFLoader,
+#     TextLoader,
+# )
 
 # PDF image extraction
 import fitz  # PyMuPDF
@@ -32,13 +22,46 @@ import fitz  # PyMuPDF
 # HTML parsing for links
 from bs4 import BeautifulSoup
 import re
-from utils.config import allowed_extentions
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from agent.document_reader import iter_csv_records,iter_docx_records,iter_pdf_records,iter_text_records
+from agent.table_store import TableStore
+from agent.text_splitter import get_text_splitter
+from utils.config import allowed_extentions,extraction_config,table_config
+from utils.utils import JsonlWriter
+
+
+def _raise_file_timeout(signum,frame):
+    raise TimeoutError("File extraction exceeded the configured timeout.")
+
+
+def _partition_file_worker(extractor,filename:Path,timeout:int):
+    """
+        Runs DocumentExtractor.partition_file inside a pool worker.
+        The timeout is enforced inside the worker with SIGALRM so a stuck file frees its worker instead of only being abandoned by the parent.
+        Args:
+            extractor(DocumentExtractor) : Extractor instance pickled into the worker.
+            filename(Path) : File to partition.
+            timeout(int) : Seconds allowed for the file, 0 or None disables the timeout.
+        Returns:
+            Path : The extracted jsonl file.
+    """
+    use_alarm = bool(timeout) and hasattr(signal,"SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM,_raise_file_timeout)
+        signal.alarm(int(timeout))
+    try:
+        return extractor.partition_file(filename)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
 
 class DocumentExtractor(object):
     """
         A class for extracting files in Azure using the Unstrcutured API.
     """
-    def __init__(self,input_files:list[Path],output_dir:str):
+    def __init__(self,input_files:list[Path],output_dir:str,parallel:bool=None,max_workers:int=None,file_timeout:int=None):
         self.input_files = input_files
         # self.files = list(
         #     filter(
@@ -54,93 +77,71 @@ class DocumentExtractor(object):
         )
         self.n_files = len(self.files)
         self.extracted_files = []
+        self.extracted_sources = {}
+        self.failed_files = []
+        self.parallel = extraction_config['parallel'] if parallel is None else parallel
+        self.max_workers = max_workers or extraction_config['max_workers'] or os.cpu_count()
+        self.file_timeout = extraction_config['file_timeout'] if file_timeout is None else file_timeout
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         print(f"Document_Extractor initialized with {self.n_files} files.")
 
     def partition_file(self, filename: Path) -> Path:
         ext = filename.suffix.lower()
-        docs = []
-        metadata = {"source": str(filename)}
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        text_splitter = get_text_splitter()
+        # Outputs are named after the whole file name, so report.pdf and report.csv do not overwrite each other.
+        output_file = self.output_dir / f"{filename.name}.jsonl"
+
+        if ext not in (".pdf",".docx",".csv",".txt"):
+            raise ValueError(f"No reader for {ext} files.")
 
-        try:
+        # Records are written as they are produced, so only the current page is held in memory.
+        # Any error propagates: the writer discards its temporary file and the caller records the file as failed.
+        with JsonlWriter(output_file) as writer:
             if ext == ".pdf":
-                # Extract raw text
-                loader = PyMuPDFLoader(str(filename))
-                text_docs = loader.load()
-
-                # Chunk text documents
-                for doc in text_docs:
-                    chunks = text_splitter.split_documents([doc])
-                    for idx, chunk in enumerate(chunks):
-                        docs.append({
-                            "type": "text",
-                            "content": chunk.page_content,
-                            "page": doc.metadata.get("page"),
-                            "chunk_index": idx,
-                            "metadata": chunk.metadata,
-                            "source": str(filename)
-                        })
-
-                # Extract tables using pdfplumber
-                with pdfplumber.open(str(filename)) as pdf:
-                    for page_num, page in enumerate(pdf.pages, start=1):
-                        for table_idx, table in enumerate(page.extract_tables(), start=1):
-                            header, *rows = table
-                            structured_table = [dict(zip(header, row)) for row in rows if row]
-                            docs.append({
-                                "type": "table",
-                                "content": structured_table,
-                                "page": page_num,
-                                "chunk_index": table_idx,
-                                "metadata": {},
-                                "source": str(filename)
-                            })
-
-                # Extract hyperlinks from text_docs
-                for doc in text_docs:
-                    links = re.findall(r'https?://\S+', doc.page_content)
-                    if links:
-                        docs.append({
-                            "type": "hyperlinks",
-                            "content": links,
-                            "page": doc.metadata.get("page"),
-                            "chunk_index": 0,
-                            "metadata": {},
-                            "source": str(filename)
-                        })
-
-                # Optional: Uncomment for image OCR using fitz + pytesseract
-                # pdf_doc = fitz.open(str(filename))
-                # for p_index, page in enumerate(pdf_doc, start=1):
-                #     for img_index, img_info in enumerate(page.get_images(full=True), start=1):
-                #         xref = img_info[0]
-                #         image_bytes = pdf_doc.extract_image(xref)["image"]
-                #         img = Image.open(io.BytesIO(image_bytes))
-                #         ocr_text = pytesseract.image_to_string(img)
-                #         if ocr_text.strip():
-                #             docs.append({
-                #                 "type": "image_ocr",
-                #                 "content": ocr_text,
-                #                 "page": p_index,
-                #                 "chunk_index": img_index,
-                #                 "metadata": {},
-                #                 "source": str(filename)
-                #             })
-
-        except Exception as e:
-            print(f"Error processing file {filename}: {e}")
-
-        # Write to JSON
-        output_file = self.output_dir / f"{filename.stem}.json"
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(docs, f, indent=2, ensure_ascii=False)
-
-        print(f"Saved extracted content to: {output_file}")
+                # Table cells go to a columnar <name>.tables file, the records keep a text rendering and a pointer.
+                with TableStore(self.output_dir / f"{filename.name}.tables",table_config['storage']) as table_store:
+                    writer.write_many(iter_pdf_records(filename,text_splitter,table_store))
+            elif ext == ".docx":
+                with TableStore(self.output_dir / f"{filename.name}.tables",table_config['storage']) as table_store:
+                    writer.write_many(iter_docx_records(filename,text_splitter,table_store))
+            elif ext == ".csv":
+                # Rows are grouped into chunks with the header repeated; no table file, the rows stay in the source CSV.
+                writer.write_many(iter_csv_records(filename))
+            else:
+                writer.write_many(iter_text_records(filename,text_splitter))
+
+            # Scanned pages are OCR'd by the opt-in OCR stage (agent.document_ocr), not inline.
+
+        print(f"Saved {writer.n_records} extracted records to: {output_file}")
         return output_file
 
     
+    def run_parallel(self) -> list[Path]:
+        """
+        Extracts the files in a process pool, one file per task.
+        Results are collected in the order of self.files. A file that raises or exceeds self.file_timeout is recorded in self.failed_files and the remaining files carry on.
+        Return :
+             list[Path] : Extracted json files, in input order, for the files that succeeded.
+        """
+        n_workers = max(1,min(self.max_workers,self.n_files))
+        print(f"Extracting {self.n_files} files with {n_workers} workers.")
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [
+                executor.submit(_partition_file_worker,self,file,self.file_timeout)
+                for file in self.files
+            ]
+            for file,future in zip(self.files,futures):
+                try:
+                    result = future.result()
+                    self.extracted_files.append(result)
+                    self.extracted_sources[file] = result
+                except Exception as e:
+                    self.failed_files.append(file)
+                    print(f"Extraction failed for file {file}: {e!r}")
+        print(f"Extraction complete. {len(self.extracted_files)} succeeded, {len(self.failed_files)} failed.")
+        return self.extracted_files
+
     def run(self) -> list[Path]:
         """
         Process a list of files , extracting content
@@ -150,9 +151,16 @@ class DocumentExtractor(object):
              list of dict : A list of dictionaries containing metadata and content for each processed file.
         """
         # print(f"Extracting {self.n_files} files...")
+        if self.parallel and self.n_files > 1:
+            return self.run_parallel()
         for file in self.files:
-            result = self.partition_file(file)
-            self.extracted_files.append(result)
+            try:
+                result = self.partition_file(file)
+                self.extracted_files.append(result)
+                self.extracted_sources[file] = result
+            except Exception as e:
+                self.failed_files.append(file)
+                print(f"Extraction failed for file {file}: {e!r}")
             print(f"Extraction complete.")
         return self.extracted_files
         
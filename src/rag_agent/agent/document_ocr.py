@@ -0,0 +1,259 @@
+import hashlib
+import io
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+import fitz  # PyMuPDF
+from utils.config import ocr_config
+from utils.utils import JsonlWriter,iter_records
+
+CREATE_OCR_TABLE = """
+CREATE TABLE IF NOT EXISTS ocr_cache (
+    image_hash TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    PRIMARY KEY (image_hash, lang)
+)
+"""
+
+
+def image_hash(image_bytes:bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _ocr_image(image_bytes:bytes,lang:str) -> str:
+    """
+        OCRs one encoded image. Runs in a pool worker, so the OCR libraries are imported there.
+    """
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return pytesseract.image_to_string(img,lang=lang)
+
+
+class OcrCache(object):
+    """
+        Persistent OCR results keyed by (image byte hash, language) in a local SQLite file.
+        Only the parent process reads and writes it; pool workers just return text.
+    """
+    def __init__(self,path:str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True,exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path),check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(CREATE_OCR_TABLE)
+        self.conn.commit()
+
+    def get_many(self,hashes:list[str],lang:str) -> dict[str,str]:
+        found = {}
+        with self._lock:
+            for start in range(0,len(hashes),500):
+                chunk = hashes[start:start+500]
+                rows = self.conn.execute(
+                    f"SELECT image_hash, text FROM ocr_cache WHERE lang = ? AND image_hash IN ({','.join('?'*len(chunk))})",
+                    [lang,*chunk]
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self,texts:dict[str,str],lang:str):
+        now = int(time.time())
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO ocr_cache (image_hash, lang, text, created) VALUES (?, ?, ?, ?)",
+                [(h,lang,text,now) for h,text in texts.items()]
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def iter_low_text_page_images(filename:Path,min_text_chars:int,min_image_pixels:int) -> Iterator[tuple[int,int,bytes]]:
+    """
+        Yields the images of the pages whose extracted text is shorter than min_text_chars, typically scanned pages.
+        Yields:
+            tuple[int,int,bytes] : (zero based page, one based image index on the page, encoded image bytes).
+    """
+    with fitz.open(str(filename)) as pdf:
+        for page in pdf:
+            if len(page.get_text().strip()) >= min_text_chars:
+                continue
+            for img_index,img_info in enumerate(page.get_images(full=True),start=1):
+                xref,width,height = img_info[0],img_info[2],img_info[3]
+                if width * height < min_image_pixels:
+                    continue
+                yield page.number,img_index,pdf.extract_image(xref)["image"]
+
+
+class OcrStage(object):
+    """
+        Adds 'image_ocr' records for scanned pages to extracted files.
+
+        Only pages below ocr_config['min_text_chars'] of text are considered. Their images are hashed and looked up in the on-disk
+        OcrCache, which also holds the images OCR'd earlier in the run; only the misses go to the process pool, so each distinct image
+        is OCR'd once. Pages are processed in windows of ocr_config['window_pages'], which bounds the image bytes held in memory.
+        An image repeated inside one document (logos, letterheads) is emitted on its first page only.
+        Use as a context manager so the process pool and the cache connection are released.
+    """
+    def __init__(self,config:dict=None,text_splitter=None):
+        self.config = config or ocr_config
+        self.text_splitter = text_splitter
+        self.lang = self.config['lang']
+        self.cache = OcrCache(self.config['cache_path'])
+        self.executor = None
+        self.n_images = 0
+        self.n_ocr = 0
+        self.n_cache_hits = 0
+        self.n_failed = 0
+
+    def __enter__(self):
+        self.executor = ProcessPoolExecutor(max_workers=max(1,int(self.config['max_workers'])))
+        return self
+
+    def __exit__(self,exc_type,exc,tb):
+        self.executor.shutdown(cancel_futures=True)
+        self.cache.close()
+        return False
+
+    def ocr_images(self,images:dict[str,bytes]) -> tuple[dict[str,str],list[str]]:
+        """
+            OCRs the images missing from the cache.
+            Returns:
+                tuple[dict[str,str],list[str]] : OCR text of each image hash that succeeded, and the hashes of the images that failed.
+        """
+        texts = self.cache.get_many(list(images),self.lang)
+        self.n_cache_hits += len(texts)
+        misses = [h for h in images if h not in texts]
+        futures = {h:self.executor.submit(_ocr_image,images[h],self.lang) for h in misses}
+        new_texts = {}
+        failed = []
+        for h,future in futures.items():
+            try:
+                new_texts[h] = future.result()
+            except Exception as e:
+                print(f"OCR failed for image {h[:12]}: {e!r}")
+                failed.append(h)
+        if new_texts:
+            self.cache.put_many(new_texts,self.lang)
+        self.n_ocr += len(new_texts)
+        self.n_failed += len(failed)
+        texts.update(new_texts)
+        return texts,failed
+
+    def ocr_records(self,filename:Path) -> tuple[list[dict],int]:
+        """
+            OCR records of the low-text pages of a PDF.
+            Images are read and OCR'd window_pages pages at a time (one cache lookup and one pool submission per window), so
+            only the encoded bytes of one window are held; images already seen in the document are recognised by their hash.
+            Returns:
+                tuple[list[dict],int] : The records, and the number of images whose OCR failed.
+        """
+        source = str(filename)
+        records = []
+        n_failed = 0
+        seen = set()
+        window = {}
+        occurrences = []
+        window_pages = set()
+
+        def flush():
+            nonlocal n_failed
+            texts,failed = self.ocr_images(window)
+            n_failed += len(failed)
+            records.extend(self._records(occurrences,texts,source))
+            window.clear()
+            occurrences.clear()
+            window_pages.clear()
+
+        for page,img_index,image_bytes in iter_low_text_page_images(
+            filename,self.config['min_text_chars'],self.config['min_image_pixels']
+        ):
+            h = image_hash(image_bytes)
+            self.n_images += 1
+            if h in seen:
+                continue
+            if page not in window_pages and len(window_pages) >= self.config['window_pages']:
+                flush()
+            seen.add(h)
+            window[h] = image_bytes
+            occurrences.append((page,img_index,h))
+            window_pages.add(page)
+        if window:
+            flush()
+        return records,n_failed
+
+    def _records(self,occurrences:list[tuple[int,int,str]],texts:dict[str,str],source:str) -> Iterator[dict]:
+        for page,img_index,h in occurrences:
+            text = texts.get(h,"").strip()
+            if not text:
+                continue
+            chunks = self.text_splitter.split_text(text) if self.text_splitter is not None else [text]
+            for chunk in chunks:
+                yield {
+                    "type": "image_ocr",
+                    "content": chunk,
+                    "page": page,
+                    "chunk_index": img_index,
+                    "metadata": {"image_hash": h},
+                    "source": source
+                }
+
+    def add_to_extracted(self,filename:Path,extracted_file:Path) -> tuple[int,bool]:
+        """
+            Rewrites an extracted file with the OCR records of the source PDF appended.
+            Records from an earlier OCR pass are dropped first, so the stage can be re-run.
+            When an image fails, the extracted file is left as it is; the images that succeeded are cached, so a re-run
+            only OCRs the failed ones again.
+            Returns:
+                tuple[int,bool] : Number of OCR records added, and whether the OCR of any image failed.
+        """
+        if Path(filename).suffix.lower() != ".pdf":
+            return 0,False
+        ocr_records,n_failed = self.ocr_records(Path(filename))
+        if n_failed:
+            print(f"OCR failed for {n_failed} images of {filename}, leaving it pending.")
+            return 0,True
+        if not ocr_records:
+            return 0,False
+        with JsonlWriter(extracted_file) as writer:
+            writer.write_many(record for record in iter_records(extracted_file) if record.get('type') != "image_ocr")
+            writer.write_many(ocr_records)
+        return len(ocr_records),False
+
+    def stats(self) -> dict:
+        return {"images":self.n_images,"ocr":self.n_ocr,"cache_hits":self.n_cache_hits,"failed":self.n_failed}
+
+
+def run_data_ocr(input_files:list[Path],extracted_files:list[Path],text_splitter=None) -> list[tuple[Path,int,bool]]:
+    """
+        Main function to run the OCR stage over extracted files.
+        Args:
+            input_files(list[Path]) : Source files.
+            extracted_files(list[Path]) : Extracted file of each source, in the same order.
+            text_splitter : Optional splitter exposing split_text(str) -> list[str] applied to long OCR text.
+        Returns:
+            list[tuple[Path,int,bool]] : (source file, OCR records added, failed) for every file; a failed file must stay
+                                         pending for the OCR stage.
+    """
+    print(f"Running OCR for low-text pages of {len(input_files)} files.")
+    done = []
+    with OcrStage(text_splitter=text_splitter) as stage:
+        for fn,extracted in zip(input_files,extracted_files):
+            try:
+                n_records,failed = stage.add_to_extracted(fn,extracted)
+                if not failed:
+                    print(f"Added {n_records} OCR records to {extracted}.")
+                done.append((fn,n_records,failed))
+            except Exception as e:
+                print(f"OCR failed for file {fn}: {e!r}")
+                done.append((fn,0,True))
+        print(f"OCR complete : {stage.stats()}")
+    return done
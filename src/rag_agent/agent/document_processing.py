@@ -2,6 +2,7 @@ import json
 from collections import Counter
 from pathlib import Path
 from utils.config import document_pipeline_config,processor_config
+from utils.utils import JsonlWriter,count_tokens,iter_records
 from dotenv import load_dotenv
 load_dotenv()
 from common.llm_connection import llm_module
@@ -14,15 +15,19 @@ class DocumentProcessor(object):
         self.input_files= input_files
         self.files = list(
             filter(
-                lambda fn:Path(fn).suffix == '.json',input_files
+                lambda fn:Path(fn).suffix in ('.json','.jsonl'),input_files
             )
         )
         self.n_files = len(self.files)
         self.output_dir = Path(output_dir)
         self.processor_config =processor_config
         self.chunk_method = self.processor_config['chunk_method']
-        self.current_block = {'content':"","page_number":[],"type":[]}
+        self.max_block_tokens = self.processor_config['max_block_tokens']
+        self._refresh_blocks()
         self.counts = {'nltk':0,'llm':0,'table':0,'image':0}
+        # Item types seen and skipped (not relevant per processor_config) across all files, reported once by print_summary().
+        self.type_counts = Counter()
+        self.skipped_counts = Counter()
         self.llm = None
         if (len(self.processor_config['clean_llm'])>0 | len(self.processor_config['type_image'])>0):
             self.llm = llm_module()
@@ -32,8 +37,42 @@ class DocumentProcessor(object):
         """
         Resets the current processing block to its initial state.
         This method clears the content, Page Number and Type of the current block, essentially preparing it for new data or content to be processed.
+        Content is kept as a list of parts joined once when the block is emitted, and pages as a set next to their first-seen order,
+        so adding an item is amortized O(1) however large the block grows.
+        """
+        self.current_block = {"parts":[],"pages":set(),"page_number":[],"type":[],"n_tokens":0}
+
+    def _add_to_block(self,item:dict,content:str,n_tokens:int):
+        block = self.current_block
+        page = self._item_page(item)
+        block['parts'].append(content)
+        block['n_tokens'] += n_tokens
+        block['type'].append(item.get('type',""))
+        if page is None:
+            return
+        pages = [page]
+        if isinstance(page,int) and isinstance(item.get('page_end'),int):
+            pages = range(page,item['page_end'] + 1)
+        for page in pages:
+            if page not in block['pages']:
+                block['pages'].add(page)
+                block['page_number'].append(page)
+
+    def _block_output(self) -> dict:
         """
-        self.current_block = {"content":"","page_number":[],"type":[]}
+            The emitted form of the current block: joined content, distinct pages in reading order and item types.
+        """
+        return {
+            "content":"".join(self.current_block['parts']),
+            "page_number":self.current_block['page_number'],
+            "type":self.current_block['type']
+        }
+
+    @staticmethod
+    def _item_page(item:dict):
+        # Extraction records carry 'page'; older element formats used 'page_number'.
+        page = item.get('page_number',item.get('page'))
+        return page if isinstance(page,(int,str)) else None
 
     def _check_item_categories(self,item)->dict[str,bool]:
         """
@@ -65,36 +104,29 @@ class DocumentProcessor(object):
             content = item['content']
         return content
 
-    def _check_switch_blocks(self,item:dict)->bool:
+    def _check_switch_blocks(self,item:dict,n_tokens:int=0)->bool:
         """
             Determine whether it's time to a new block of content based on the current chunking method.
-            This method evaluates the current content (item) and checks whether the block should switch according to the defined 'chunk_method'. It uses different criteria depending on whether the chunking method is 'use_existing' , 'by_type' or 'by_page' .
+            This method evaluates the current content (item) and checks whether the block should switch according to the defined 'chunk_method'. It uses different criteria depending on whether the chunking method is 'use_existing' , 'by_type' or 'by_page' ('page_number').
+            Independently of the method, the block switches when adding the item's n_tokens would exceed max_block_tokens.
             Args :
-                item(dict): A dictionary representing a single item of content expected to contain keys like type,content,page_number.
+                item(dict): A dictionary representing a single item of content expected to contain keys like type,content,page.
+                n_tokens(int): Token count of the item's processed content.
             Returns:
-                bool: True if the current block should switch; False otherwise.
+                bool: True if the current block should switch; False otherwise. An empty block never switches.
         """
-        block_has_len = len(self.current_block['page_number']) > 0
-
-        switch_due_to_content_length = len(self.current_block['content']) > 8000
+        if not self.current_block['parts']:
+            return False
         if self.chunk_method == 'use_existing':
             return True
-        switch_due_to_title = self.chunk_method == 'by_type' and item['type'] == 'page_text' and block_has_len
-        
-        switch_due_to_page = self.chunk_method == 'by_page' and block_has_len
-        if switch_due_to_page:
-            item_page = item.get('page_number',None)
-            if item_page is not None:
-                page_numbers = [elem.get('page_number') for elem in self.current_block['page_number']]
-                page_numbers = list(filter(lambda s: s is not None,page_numbers))
-                if item_page not in page_numbers:
-                    switch_due_to_page = True
-                else:
-                    switch_due_to_page = False
-            else:
-                switch_due_to_page = False
-        # print(f"Switch due to content : {switch_due_to_content_length} , title : {switch_due_to_title} , page : {switch_due_to_page}")
-        return switch_due_to_content_length,switch_due_to_title,switch_due_to_page
+        if self.current_block['n_tokens'] + n_tokens > self.max_block_tokens:
+            return True
+        if self.chunk_method == 'by_type':
+            return item['type'] == 'page_text'
+        if self.chunk_method in ('by_page','page_number'):
+            item_page = self._item_page(item)
+            return item_page is not None and item_page not in self.current_block['pages']
+        return False
 
 
     def _check_relevant_items(self,item)->bool:
@@ -113,48 +145,61 @@ class DocumentProcessor(object):
         return lowercase_match | word_within_match
 
 
-    def process_contents(self,data:dict)->list:
+    def iter_blocks(self,data):
         """
-            Processes the extracted document content into structured blocks.
+            Streams the extracted document content as structured blocks.
             Chunking determined by self.chunk_method , either 'using _existing (default) , 'by_page' or 'by_title'
             Args : 
-                data : dict from JSON object
-            Returns:
-                list : A list of structured content blocks , each containing text and metadata.
+                data : Iterable of extracted records, e.g. utils.utils.iter_records(path).
+            Yields:
+                dict : A structured content block containing text and metadata.
         """
-        final_content = []
         self._refresh_blocks()
-        print(Counter(item['type'] for item in data))
         for item in data:
             content = None
-            # print("Item : ",item)
-            # Determine if it's time for next block
-            if self._check_switch_blocks(item):
-                final_content.append(self.current_block)
-                self._refresh_blocks()
+            self.type_counts[item['type']] += 1
             # Process Item:
             try:
                 if self._check_relevant_items(item):
-                    # print("Inside Check relevant items")
                     content = self.process_items(item)
                 else:
-                    print(f"Item of type {item['type']} not processed.")
+                    self.skipped_counts[item['type']] += 1
                     content = None
-                if content is not None:
-                    self.current_block['content'] += f"{content}"
-                    self.current_block['page_number'].append(item.get('page_number',{}))
-                    self.current_block['type'].append(item.get('type',""))
-            
+                if content is None:
+                    continue
+                content = f"{content}"
+                n_tokens = count_tokens(content)
+                # Determine if it's time for next block
+                if self._check_switch_blocks(item,n_tokens):
+                    yield self._block_output()
+                    self._refresh_blocks()
+                self._add_to_block(item,content,n_tokens)
             except Exception as e:
                 # print(f"Error processing items: {item.get('page_number',item)}")
                 print(f"Error message {e}")
                 continue
-        if self.current_block['content']:
-            final_content.append(self.current_block)
-        # print(f"Final Content: {final_content}")
+        if self.current_block['parts']:
+            yield self._block_output()
+
+    def print_summary(self):
+        """
+            Prints the item type counts, the skipped item types and the process usage counts accumulated by iter_blocks.
+        """
+        print(f"Item type counts: {dict(self.type_counts)}")
+        if self.skipped_counts:
+            print(f"Items not processed by type: {dict(self.skipped_counts)}")
         print("Processed content into strucured blocks")
         print(f"Process usage counts: {self.counts}")
-        return final_content
+
+    def process_contents(self,data)->list:
+        """
+            Processes the extracted document content into structured blocks.
+            Args : 
+                data : Iterable of extracted records.
+            Returns:
+                list : A list of structured content blocks , each containing text and metadata.
+        """
+        return list(self.iter_blocks(data))
 
 
     def run(self)->list[Path]:
@@ -163,27 +208,15 @@ class DocumentProcessor(object):
         failed_files= []
         for json_file in self.files:
             try:
-                # json_data = json.loads(json_file)
-                
-                with open(json_file, "r", encoding="utf-8") as f:
-                    json_data = json.load(f)
-
-                processed_content = self.process_contents(json_data)
-
-                json_elements = json.dumps(processed_content,indent=2)
-                
-                output_file = self.output_dir/f"{json_file.stem}.json" 
-                output_file.parent.mkdir(parents=True,exist_ok=True)
-                try:
-                    with open(output_file,'w',encoding='utf-8') as f:
-                        json.dump(processed_content,f,indent=2,ensure_ascii=False)
-                    processed_json_data.append(output_file)
-                except Exception as e:
-                    print(f"Failed to write JSON to {output_file}: {e}")
-                
+                # Blocks are written as they are built, so neither the input nor the output file is held in memory.
+                output_file = self.output_dir/f"{Path(json_file).stem}.jsonl" 
+                with JsonlWriter(output_file) as writer:
+                    writer.write_many(self.iter_blocks(iter_records(json_file)))
+                processed_json_data.append(output_file)
             except Exception as e:
                 failed_files.append(json_file)
                 print(f'File {json_file} failed with exception {e}')
+        self.print_summary()
         return processed_json_data
     
 def run_data_processing(input_files:list,process_dir):
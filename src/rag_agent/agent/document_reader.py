@@ -0,0 +1,384 @@
+import csv
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Iterator
+
+import fitz  # PyMuPDF
+from agent.table_store import TableStore,render_table,table_header
+from agent.text_splitter import PageChunker
+from utils.config import reader_config,table_config
+
+LINK_PATTERN = re.compile(r'https?://\S+')
+WORD_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _document_metadata(pdf,filename:Path) -> dict:
+    """
+        Builds the per-document metadata attached to every text chunk.
+        Mirrors the keys PyMuPDFLoader used to emit so downstream records keep the same shape.
+    """
+    metadata = {
+        "source": str(filename),
+        "file_path": str(filename),
+        "total_pages": len(pdf),
+    }
+    for key,value in (pdf.metadata or {}).items():
+        if isinstance(value,(str,int)) and value != "":
+            metadata.setdefault(key,value)
+    return metadata
+
+
+def _page_may_have_tables(page,min_ruling_lines:int) -> bool:
+    """
+        Cheap prefilter for find_tables(): counts the horizontal and vertical ruling lines among the page's vector drawings.
+        Filled or stroked rectangles count as two lines of each orientation, thin ones as a single line.
+        Reading the drawings is far cheaper than table detection, and most pages have none.
+    """
+    horizontal = vertical = 0
+    for drawing in page.get_cdrawings():
+        for item in drawing.get('items',()):
+            if item[0] == 'l':
+                (x0,y0),(x1,y1) = item[1],item[2]
+                horizontal += abs(y1 - y0) < 1
+                vertical += abs(x1 - x0) < 1
+            elif item[0] == 're':
+                x0,y0,x1,y1 = item[1]
+                width,height = abs(x1 - x0),abs(y1 - y0)
+                if height < 3:
+                    horizontal += 1
+                elif width < 3:
+                    vertical += 1
+                else:
+                    horizontal += 2
+                    vertical += 2
+            if horizontal >= min_ruling_lines and vertical >= min_ruling_lines:
+                return True
+    return False
+
+
+def _page_tables(page,prefilter:bool=True) -> list[tuple[list[str],list[list]]]:
+    """
+        Extracts the tables of a single page as (header, rows) pairs.
+        With prefilter, pages without ruling lines skip find_tables() entirely.
+    """
+    if prefilter and not _page_may_have_tables(page,table_config['min_ruling_lines']):
+        return []
+    tables = []
+    for table in page.find_tables().tables:
+        rows = table.extract()
+        if not rows:
+            continue
+        header, *rows = rows
+        tables.append((table_header(header),[row for row in rows if row]))
+    return tables
+
+
+def _page_links(page,page_text:str) -> list[str]:
+    """
+        Collects the hyperlinks of a page from both the visible text and the link annotations, in first-seen order.
+    """
+    links = LINK_PATTERN.findall(page_text)
+    links.extend(link['uri'] for link in page.get_links() if link.get('uri'))
+    return list(dict.fromkeys(links))
+
+
+def iter_pdf_pages(filename:Path,prefilter:bool=None) -> Iterator[dict]:
+    """
+        Opens a PDF once and yields its pages one at a time.
+        Only the current page is materialised, so memory stays bounded by the largest page rather than the whole document.
+        Args:
+            filename(Path) : PDF file to read.
+            prefilter(bool) : Skip table detection on pages without ruling lines, defaults to table_config['prefilter'].
+        Yields:
+            dict : {'page','text','tables','links','metadata'} for each page, 'page' being zero based and 'tables' a list of (header, rows).
+    """
+    prefilter = table_config['prefilter'] if prefilter is None else prefilter
+    with fitz.open(str(filename)) as pdf:
+        doc_metadata = _document_metadata(pdf,filename)
+        for page in pdf:
+            page_text = page.get_text()
+            yield {
+                "page": page.number,
+                "text": page_text,
+                "tables": _page_tables(page,prefilter),
+                "links": _page_links(page,page_text),
+                "metadata": {**doc_metadata, "page": page.number},
+            }
+
+
+def iter_pdf_records(filename:Path,text_splitter,table_store:TableStore=None) -> Iterator[dict]:
+    """
+        Streams the extraction records of a PDF page by page.
+        Produces the same record schema as the previous PyMuPDFLoader + pdfplumber path ('text', 'table' and 'hyperlinks' records),
+        but interleaved per page instead of grouped by record type.
+        Text and link records keep the zero based page number, table records the one based page number, as before.
+        The text is split as one continuous text (agent.text_splitter.PageChunker), so a chunk can run across a page break:
+        its 'page' is the page it starts on, 'page_end' the page it ends on and 'start_index' its character offset in the start page.
+        A text chunk is yielded once it is complete, i.e. after the page it ends on, ahead of that page's tables and links.
+        Table records carry a text rendering of the table; the cells go to table_store (when given) and the record metadata points to them.
+        Args:
+            filename(Path) : PDF file to read.
+            text_splitter(FastTextSplitter) : Splitter from agent.text_splitter.
+            table_store(TableStore) : Columnar sink for the table cells.
+        Yields:
+            dict : One extraction record.
+    """
+    source = str(filename)
+    chunker = PageChunker(text_splitter)
+    chunk_index = 0
+    doc_metadata = {}
+
+    def text_records(chunks):
+        nonlocal chunk_index
+        for chunk in chunks:
+            yield {
+                "type": "text",
+                "content": chunk['content'],
+                "page": chunk['page_start'],
+                "page_end": chunk['page_end'],
+                "chunk_index": chunk_index,
+                "start_index": chunk['start_index'],
+                "metadata": {**doc_metadata, "page": chunk['page_start']},
+                "source": source
+            }
+            chunk_index += 1
+
+    for page in iter_pdf_pages(filename):
+        doc_metadata = page['metadata']
+        # get_text() ends every page with a line break; joined with the page separator it would read as a paragraph break.
+        yield from text_records(chunker.add(page['page'],page['text'].rstrip("\n")))
+        for table_idx, (header, rows) in enumerate(page['tables'], start=1):
+            yield {
+                "type": "table",
+                "content": render_table(header,rows),
+                "page": page['page'] + 1,
+                "chunk_index": table_idx,
+                "metadata": table_store.add(page['page'] + 1,header,rows) if table_store is not None else {},
+                "source": source
+            }
+        if page['links']:
+            yield {
+                "type": "hyperlinks",
+                "content": page['links'],
+                "page": page['page'],
+                "chunk_index": 0,
+                "metadata": {},
+                "source": source
+            }
+    yield from text_records(chunker.finish())
+
+
+def _file_metadata(filename:Path,page:int) -> dict:
+    return {"source": str(filename), "file_path": str(filename), "page": page}
+
+
+def _iter_page_records(filename:Path,page:int,text:str,text_splitter) -> Iterator[dict]:
+    """
+        Text and hyperlink records of one page (or window) of a non-PDF document, in the same shape as the PDF records.
+    """
+    source = str(filename)
+    for idx, (chunk, start_index) in enumerate(text_splitter.split_text_with_offsets(text)):
+        yield {
+            "type": "text",
+            "content": chunk,
+            "page": page,
+            "chunk_index": idx,
+            "start_index": start_index,
+            "metadata": _file_metadata(filename,page),
+            "source": source
+        }
+    links = list(dict.fromkeys(LINK_PATTERN.findall(text)))
+    if links:
+        yield {
+            "type": "hyperlinks",
+            "content": links,
+            "page": page,
+            "chunk_index": 0,
+            "metadata": {},
+            "source": source
+        }
+
+
+def iter_text_windows(filename:Path,window_chars:int=None) -> Iterator[str]:
+    """
+        Reads a text file in windows of about window_chars characters, cut after the last paragraph break (or line break) of the window.
+        The remainder is carried into the next window, so at most two windows are held in memory.
+    """
+    window_chars = window_chars or reader_config['text_window_chars']
+    with open(filename,"r",encoding="utf-8",errors="replace",newline="") as f:
+        buffer = ""
+        while True:
+            block = f.read(window_chars)
+            if not block:
+                break
+            buffer += block
+            if len(buffer) < window_chars:
+                continue
+            cut = buffer.rfind("\n\n")
+            cut = cut + 2 if cut > 0 else buffer.rfind("\n") + 1
+            if cut <= 0:
+                cut = len(buffer)
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+        if buffer:
+            yield buffer
+
+
+def iter_text_records(filename:Path,text_splitter) -> Iterator[dict]:
+    """
+        Streams the records of a plain text file. Each window of iter_text_windows plays the role of a page:
+        'page' is the zero based window number and start_index the chunk offset inside the window.
+    """
+    for page, text in enumerate(iter_text_windows(filename)):
+        yield from _iter_page_records(filename,page,text,text_splitter)
+
+
+def _csv_record(filename:Path,group_idx:int,header:list[str],rows:list[list],row_start:int,row_end:int) -> dict:
+    return {
+        "type": "table",
+        "content": render_table(header,rows),
+        "page": group_idx,
+        "chunk_index": 0,
+        "metadata": {**_file_metadata(filename,group_idx), "row_start": row_start, "row_end": row_end},
+        "source": str(filename)
+    }
+
+
+def iter_csv_records(filename:Path,chunk_chars:int=None,max_rows:int=None) -> Iterator[dict]:
+    """
+        Streams a CSV file as 'table' records of consecutive rows, each rendered with the header row so every chunk is self-describing.
+        Rows are read one at a time and a group is emitted once its rendering reaches chunk_chars or it holds max_rows rows,
+        so memory is bounded by one group whatever the file size. The delimiter is sniffed from the start of the file.
+        'page' is the one based group number (tables use one based pages); the metadata records the data row range [row_start, row_end).
+    """
+    chunk_chars = chunk_chars or reader_config['csv_chunk_chars']
+    max_rows = max_rows or reader_config['csv_max_rows']
+    with open(filename,"r",encoding="utf-8-sig",errors="replace",newline="") as f:
+        sample = f.read(65536)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample,delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(f,dialect)
+        header = next(reader,None)
+        if header is None:
+            return
+        header = table_header(header)
+        header_chars = len(" | ".join(header))
+        group_idx = 0
+        row_start = 0
+        rows = []
+        n_chars = header_chars
+        for row_idx, row in enumerate(reader):
+            if not any(cell.strip() for cell in row):
+                continue
+            if not rows:
+                row_start = row_idx
+            rows.append(row)
+            n_chars += sum(len(cell) + 3 for cell in row)
+            if n_chars >= chunk_chars or len(rows) >= max_rows:
+                group_idx += 1
+                yield _csv_record(filename,group_idx,header,rows,row_start,row_idx + 1)
+                rows = []
+                n_chars = header_chars
+        if rows:
+            group_idx += 1
+            yield _csv_record(filename,group_idx,header,rows,row_start,row_idx + 1)
+
+
+def _docx_paragraph_text(paragraph) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == WORD_NAMESPACE + "t":
+            parts.append(node.text or "")
+        elif node.tag == WORD_NAMESPACE + "tab":
+            parts.append("\t")
+        elif node.tag == WORD_NAMESPACE + "br" and node.get(WORD_NAMESPACE + "type") != "page":
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _docx_starts_page(paragraph) -> bool:
+    for node in paragraph.iter():
+        if node.tag == WORD_NAMESPACE + "lastRenderedPageBreak":
+            return True
+        if node.tag == WORD_NAMESPACE + "br" and node.get(WORD_NAMESPACE + "type") == "page":
+            return True
+    return False
+
+
+def iter_docx_blocks(filename:Path) -> Iterator[tuple]:
+    """
+        Streams the body of a .docx file with iterparse over word/document.xml, clearing every element once it is consumed.
+        Page numbers follow the page breaks Word rendered last (lastRenderedPageBreak) and explicit page breaks, zero based.
+        Yields:
+            tuple : ('paragraph', page, text) or ('table', page, rows) with rows as lists of cell texts, header row first.
+    """
+    page = 0
+    table_depth = 0
+    rows, row = [], []
+    with zipfile.ZipFile(filename) as archive, archive.open("word/document.xml") as f:
+        for event, elem in ET.iterparse(f,events=("start","end")):
+            if elem.tag == WORD_NAMESPACE + "tbl":
+                if event == "start":
+                    table_depth += 1
+                    continue
+                table_depth -= 1
+                if table_depth == 0:
+                    if rows:
+                        yield "table", page, rows
+                    rows = []
+                    elem.clear()
+                continue
+            if event == "start":
+                continue
+            if elem.tag == WORD_NAMESPACE + "p" and table_depth == 0:
+                if _docx_starts_page(elem):
+                    page += 1
+                yield "paragraph", page, _docx_paragraph_text(elem)
+                elem.clear()
+            elif elem.tag == WORD_NAMESPACE + "tc" and table_depth == 1:
+                row.append("\n".join(_docx_paragraph_text(p) for p in elem.iter(WORD_NAMESPACE + "p")))
+                elem.clear()
+            elif elem.tag == WORD_NAMESPACE + "tr" and table_depth == 1:
+                rows.append(row)
+                row = []
+                elem.clear()
+
+
+def iter_docx_records(filename:Path,text_splitter,table_store:TableStore=None) -> Iterator[dict]:
+    """
+        Streams the records of a .docx file page by page, with the same record schema as iter_pdf_records:
+        the paragraphs of a page are split into 'text' records, tables become 'table' records (cells in table_store when given)
+        and URLs found in the text a 'hyperlinks' record. Only the current page is held in memory.
+    """
+    source = str(filename)
+    current_page = 0
+    paragraphs = []
+    tables = []
+
+    def flush():
+        yield from _iter_page_records(filename,current_page,"\n\n".join(p for p in paragraphs if p.strip()),text_splitter)
+        for table_idx, (header, rows) in enumerate(tables, start=1):
+            yield {
+                "type": "table",
+                "content": render_table(header,rows),
+                "page": current_page + 1,
+                "chunk_index": table_idx,
+                "metadata": table_store.add(current_page + 1,header,rows) if table_store is not None else {},
+                "source": source
+            }
+
+    for kind, page, content in iter_docx_blocks(filename):
+        if page != current_page:
+            yield from flush()
+            current_page, paragraphs, tables = page, [], []
+        if kind == "paragraph":
+            paragraphs.append(content)
+        else:
+            header, *rows = content
+            tables.append((table_header(header),[row for row in rows if any(cell.strip() for cell in row)]))
+    yield from flush()
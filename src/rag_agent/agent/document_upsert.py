@@ -0,0 +1,145 @@
+from pathlib import Path
+import numpy as np
+from agent.embedded_batch import load_embedded_batch
+from agent.embedding_log import EmbeddingLog,get_embedding_log
+from common.lexical_index import InvertedIndex,get_lexical_index
+from common.metadata_index import filter_rows
+from common.vector_db_config import lexical_index_config
+from common.vector_db_connection import META_COLUMNS,LocalVectorStore,Snapshot,document_hash_of,get_vector_store
+from utils.config import embedding_log_config
+
+# Columns read from embedded batches; document_hash is taken from unique_id, so batches written before it existed still load.
+BATCH_COLUMNS = [col for col in META_COLUMNS if col != "document_hash"]
+
+
+def superseded_rows(snapshot:Snapshot,metadata:list[dict]) -> np.ndarray:
+    """
+        Rows of the snapshot left over from an earlier version of the documents of a batch: same document_name,
+        but a unique_id carrying another document hash. Rows of the hashes in the batch are kept.
+        Rows named after the stem of a document (report for report.pdf, the naming before PIPELINE_VERSION 3) are always stale.
+    """
+    hashes = {}
+    for row in metadata:
+        hashes.setdefault(row['document_name'],set()).add(document_hash_of(row['unique_id']))
+    stale = []
+    for name,current in hashes.items():
+        rows = filter_rows(snapshot,{"document_name":name},with_aliases=False)
+        if rows.size:
+            stale.append(rows[[row_hash not in current for row_hash in snapshot.column_values("document_hash",rows)]])
+        legacy_name = Path(name).stem
+        if legacy_name != name:
+            stale.append(filter_rows(snapshot,{"document_name":legacy_name},with_aliases=False))
+    return np.unique(np.concatenate(stale)) if stale else np.empty(0,dtype=np.int64)
+
+
+def upsert_batch(store:LocalVectorStore,fn:Path,staged_ids:set,lexical_index:InvertedIndex=None) -> tuple[int,int,int]:
+    """
+        Stages the chunks of one embedded batch file whose unique_id is not in the store yet.
+        Chunk ids are derived from content, so a re-ingested document yields the ids already stored and those rows are skipped.
+        A modified document yields new ids: the rows of its previous content are tombstoned (see superseded_rows) and removed
+        from the lexical index, so searches only see the current version once the batch is published.
+        The batch is recorded as a source even when every row was skipped, so it is not read again.
+        Args:
+            store(LocalVectorStore) : Target store.
+            fn(Path) : Embedded batch directory (or legacy .jsonl batch file).
+            staged_ids(set) : unique_ids staged earlier in this run, updated in place.
+            lexical_index(InvertedIndex) : BM25 index to remove superseded chunks from, defaults to get_lexical_index().
+        Returns:
+            tuple[int,int,int] : (rows staged, rows skipped as already present, rows superseded).
+    """
+    vectors,metadata = load_embedded_batch(fn,BATCH_COLUMNS)
+    if len(metadata) == 0:
+        print(f"No embedded chunks in {fn.name}.")
+        return 0,0,0
+    for row in metadata:
+        row['document_hash'] = document_hash_of(row['unique_id'])
+    snapshot = store.refresh()
+    unique_ids = [row['unique_id'] for row in metadata]
+    in_store = snapshot.find_rows(unique_ids) >= 0
+    keep = []
+    for idx,(unique_id,exists) in enumerate(zip(unique_ids,in_store)):
+        if not exists and unique_id not in staged_ids:
+            staged_ids.add(unique_id)
+            keep.append(idx)
+    stale = superseded_rows(snapshot,metadata)
+    if stale.size:
+        store.delete_rows(stale)
+        lexical_index = get_lexical_index() if lexical_index is None else lexical_index
+        lexical_index.remove(snapshot.column_values("unique_id",stale).tolist())
+        print(f"Superseded {stale.size} chunks of earlier versions of {sorted({row['document_name'] for row in metadata})}.")
+    store.append(vectors[keep],[metadata[idx] for idx in keep],source=fn.name)
+    return len(keep),len(metadata) - len(keep),int(stale.size)
+
+
+def replay_embedding_log(store:LocalVectorStore,embedding_log:EmbeddingLog,staged_ids:set,extra_files:list[Path]=(),commit_rows:int=None) -> tuple[int,int,int,int]:
+    """
+        Bulk loads the uncommitted batches of the embedding log (and any extra batch files the log does not know) into the store.
+        A snapshot is published every commit_rows staged rows, and the log is committed up to the last batch of that snapshot,
+        so a crash only repeats the batches after the last commit; their rows are then skipped by unique_id.
+        Args:
+            store(LocalVectorStore) : Target store.
+            embedding_log(EmbeddingLog) : Log of the embedded batches.
+            staged_ids(set) : unique_ids staged earlier in this run, updated in place.
+            extra_files(list[Path]) : Batch files written outside the log, e.g. before it existed.
+            commit_rows(int) : Rows per transaction, defaults to embedding_log_config['commit_rows'].
+        Returns:
+            tuple[int,int,int,int] : (rows upserted, rows skipped as already present, rows superseded, published snapshot version).
+    """
+    commit_rows = commit_rows or embedding_log_config['commit_rows']
+    loaded_sources = store.refresh().sources
+    logged_names = embedding_log.batch_names()
+    extra = [(None,Path(fn)) for fn in extra_files if Path(fn).name not in loaded_sources and Path(fn).name not in logged_names]
+    pending = [(entry['seq'],Path(entry['batch_file'])) for entry in embedding_log.pending()]
+    print(f"Upserting {len(extra) + len(pending)} embedded batches, {len(pending)} of them from the embedding log.")
+    work = extra + pending
+    n_rows = n_skipped = n_superseded = n_staged = 0
+    last_seq = None
+    version = store.version
+    try:
+        for seq,fn in work:
+            if fn.name not in loaded_sources:
+                if fn.exists():
+                    n_new,n_existing,n_stale = upsert_batch(store,fn,staged_ids)
+                    n_rows += n_new
+                    n_skipped += n_existing
+                    n_superseded += n_stale
+                    n_staged += n_new
+                else:
+                    print(f"Logged batch file {fn} is missing, its chunks are not upserted.")
+            last_seq = seq if seq is not None else last_seq
+            if n_staged >= commit_rows:
+                version = store.publish()
+                if last_seq is not None:
+                    embedding_log.commit(last_seq,version)
+                n_staged = 0
+        version = store.publish()
+        if last_seq is not None:
+            embedding_log.commit(last_seq,version)
+    except Exception:
+        store.discard_staged()
+        raise
+    return n_rows,n_skipped,n_superseded,version
+
+
+def run_data_upsert(input_files:list[Path]=(),store:LocalVectorStore=None,embedding_log:EmbeddingLog=None) -> int:
+    """
+        Main function to load embedded batches into the local vector store.
+        The batches come from the embedding write-ahead log, resuming after its last committed batch (see replay_embedding_log).
+        input_files may add batch files the log does not know; files already recorded as sources of the current snapshot are skipped,
+        and so are chunks whose unique_id is already stored (see upsert_batch), so re-running the stage is idempotent.
+        When earlier versions of a document were superseded, the lexical index is saved without them.
+        Args:
+            input_files(list[Path]) : Embedded batch files.
+            store(LocalVectorStore) : Target store, defaults to the one configured in vector_db_config.
+            embedding_log(EmbeddingLog) : Embedding log, defaults to the one configured in embedding_log_config.
+        Returns:
+            int : The published snapshot version.
+    """
+    store = get_vector_store() if store is None else store
+    embedding_log = get_embedding_log() if embedding_log is None else embedding_log
+    n_rows,n_skipped,n_superseded,version = replay_embedding_log(store,embedding_log,set(),input_files)
+    if n_superseded:
+        get_lexical_index().save(lexical_index_config['path'])
+    store.update_ann_index()
+    print(f"Upserted {n_rows} chunks, skipped {n_skipped} already stored, superseded {n_superseded}, vector store now holds {len(store)} chunks at version {version}.")
+    return version
@@ -0,0 +1,130 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from utils.config import embedded_batch_config
+from utils.utils import iter_records
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+BATCH_VECTORS = "vectors.npy"
+BATCH_METADATA_PARQUET = "metadata.parquet"
+BATCH_METADATA_JSON = "metadata.json"
+
+
+def _fsync_file(path:Path):
+    with open(path,"rb") as f:
+        os.fsync(f.fileno())
+
+
+def write_embedded_batch(path:Path,batch:list[dict],dtype:str=None,metadata_storage:str=None) -> Path:
+    """
+        Writes an embedded batch as a directory holding a vector block and a columnar metadata file:
+            <path>/vectors.npy                        (n, dimension) array in the configured dtype
+            <path>/metadata.parquet | metadata.json   every other chunk field as a column, one row per vector
+        Parquet is used when pyarrow is installed, otherwise columnar JSON ({"columns": {name: [values]}}).
+        Files are written and fsync'd in a temporary directory that is then renamed, so a batch is either complete or absent.
+        Chunks without an embedding are left out.
+        Returns:
+            Path : The batch directory.
+    """
+    path = Path(path)
+    dtype = np.dtype(dtype or embedded_batch_config['dtype'])
+    metadata_storage = metadata_storage or embedded_batch_config['metadata_storage']
+    embedded = [chunk for chunk in batch if chunk.get('embedding') is not None]
+    # Embeddings are numpy rows (see embed_batch), stacked straight into the block; lists are accepted as well.
+    if embedded:
+        vectors = np.stack([np.asarray(chunk['embedding']) for chunk in embedded]).astype(dtype,copy=False)
+    else:
+        vectors = np.empty((0,0),dtype=dtype)
+    names = [key for key in (embedded[0] if embedded else {}) if key != 'embedding']
+    columns = {name:[chunk.get(name) for chunk in embedded] for name in names}
+
+    tmp_dir = path.parent/f".tmp_{path.name}"
+    shutil.rmtree(tmp_dir,ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir/BATCH_VECTORS,vectors)
+    if metadata_storage == "parquet" and pa is not None:
+        metadata_file = tmp_dir/BATCH_METADATA_PARQUET
+        pq.write_table(pa.table(columns),metadata_file)
+    else:
+        metadata_file = tmp_dir/BATCH_METADATA_JSON
+        with open(metadata_file,"w",encoding="utf-8") as f:
+            json.dump({"columns":columns},f,ensure_ascii=False)
+    _fsync_file(tmp_dir/BATCH_VECTORS)
+    _fsync_file(metadata_file)
+    shutil.rmtree(path,ignore_errors=True)
+    os.rename(tmp_dir,path)
+    return path
+
+
+def load_batch_vectors(path:Path) -> np.ndarray:
+    """
+        Memory maps the vector block of a batch directory; rows are read from the page cache, not copied.
+    """
+    return np.load(Path(path)/BATCH_VECTORS,mmap_mode='r')
+
+
+def load_batch_metadata(path:Path,columns:Optional[list[str]]=None) -> dict[str,list]:
+    """
+        Reads the metadata columns of a batch directory, optionally only the named ones.
+    """
+    path = Path(path)
+    if (path/BATCH_METADATA_PARQUET).exists():
+        if pq is None:
+            raise ImportError("pyarrow is required to read parquet batch metadata.")
+        return pq.read_table(path/BATCH_METADATA_PARQUET,columns=columns).to_pydict()
+    with open(path/BATCH_METADATA_JSON,"r",encoding="utf-8") as f:
+        stored = json.load(f)["columns"]
+    return stored if columns is None else {col:stored[col] for col in columns}
+
+
+def is_embedded_batch(path:Path) -> bool:
+    path = Path(path)
+    return (path.is_dir() and (path/BATCH_VECTORS).exists()) or (path.is_file() and path.suffix == ".jsonl")
+
+
+def list_embedded_batches(folder:str) -> list[Path]:
+    """
+        Embedded batches of a folder in name order: batch directories and legacy .jsonl batch files.
+    """
+    folder = Path(folder)
+    if not folder.is_dir():
+        return []
+    return sorted(
+        (p for p in folder.iterdir() if not p.name.startswith(".") and p.name.startswith("batch_") and is_embedded_batch(p)),
+        key=lambda p:p.name
+    )
+
+
+def load_embedded_batch(path:Path,columns:Optional[list[str]]=None):
+    """
+        Loads an embedded batch as (vectors, metadata rows).
+        Batch directories return their memory mapped vector block; legacy .jsonl batches are parsed, skipping chunks without an embedding.
+        Args:
+            path(Path) : Batch directory or legacy .jsonl file.
+            columns(list[str]) : Metadata fields to return, all of them by default.
+        Returns:
+            tuple[np.ndarray,list[dict]] : (vectors, metadata) with one metadata dict per vector row.
+    """
+    path = Path(path)
+    if path.is_dir():
+        meta = load_batch_metadata(path,columns)
+        names = list(meta)
+        n_rows = len(meta[names[0]]) if names else 0
+        return load_batch_vectors(path),[{name:meta[name][idx] for name in names} for idx in range(n_rows)]
+    vectors = []
+    metadata = []
+    for record in iter_records(path):
+        if record.get('embedding') is None:
+            continue
+        vectors.append(record['embedding'])
+        metadata.append({col:record[col] for col in (columns or [key for key in record if key != 'embedding'])})
+    return np.asarray(vectors,dtype=np.float32),metadata
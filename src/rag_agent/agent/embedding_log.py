@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+from pathlib import Path
+from utils.config import embedding_log_config
+
+
+class EmbeddingLog(object):
+    """
+        Append-only write-ahead log of the embedded batch files, shared by the embedding and upsert stages.
+
+        Every embedded batch is written (and fsync'd) to its batch file first and then logged as one JSON line
+        {"seq","batch_file","sources","unique_ids"}, fsync'd as well. A logged batch is therefore never lost, and its chunks are
+        skipped by later embedding runs, so no finished embedding call is repeated after a crash.
+        The upsert stage replays the entries after the committed sequence number and commits (path.checkpoint, replaced atomically)
+        once the store snapshot holding them is published, so a restart resumes from the last committed batch.
+        A torn last line left by a crash is dropped when the log is opened.
+    """
+    def __init__(self,path:str=None,compact_bytes:int=None):
+        self.path = Path(path or embedding_log_config['path'])
+        self.checkpoint_path = self.path.with_suffix(self.path.suffix + ".checkpoint")
+        self.compact_bytes = compact_bytes or embedding_log_config['compact_bytes']
+        self.path.parent.mkdir(parents=True,exist_ok=True)
+        self._lock = threading.Lock()
+        self.committed_seq = -1
+        self.committed_version = None
+        self.next_seq = 0
+        if self.checkpoint_path.exists():
+            with open(self.checkpoint_path,"r",encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            self.committed_seq = checkpoint['committed_seq']
+            self.committed_version = checkpoint.get('version')
+            self.next_seq = checkpoint['next_seq']
+        self.entries = self._read_entries()
+        if self.entries:
+            self.next_seq = max(self.next_seq,self.entries[-1]['seq'] + 1)
+        self.logged_ids = {uid for entry in self.entries for uid in entry['unique_ids']}
+        self._f = open(self.path,"a",encoding="utf-8")
+
+    def _read_entries(self) -> list[dict]:
+        entries = []
+        if not self.path.exists():
+            return entries
+        good_bytes = 0
+        with open(self.path,"rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+                good_bytes += len(line)
+        if good_bytes < self.path.stat().st_size:
+            print(f"Dropping a torn entry at the end of {self.path}.")
+            with open(self.path,"r+b") as f:
+                f.truncate(good_bytes)
+        return entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def contains(self,unique_id:str) -> bool:
+        return unique_id in self.logged_ids
+
+    def append(self,batch_file:Path,sources:list[str],unique_ids:list[str]) -> int:
+        """
+            Logs a batch whose file is already durable and returns its sequence number.
+            Args:
+                batch_file(Path) : The embedded batch file.
+                sources(list[str]) : Documents the batch's chunks come from.
+                unique_ids(list[str]) : unique_id of every embedded chunk in the batch.
+        """
+        with self._lock:
+            entry = {"seq":self.next_seq,"batch_file":str(batch_file),"sources":sorted(sources),"unique_ids":list(unique_ids)}
+            self._f.write(json.dumps(entry,ensure_ascii=False,separators=(",",":")) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self.entries.append(entry)
+            self.logged_ids.update(entry['unique_ids'])
+            self.next_seq += 1
+            return entry['seq']
+
+    def pending(self) -> list[dict]:
+        """
+            Logged batches that are not committed to the store yet, in log order.
+        """
+        with self._lock:
+            return [entry for entry in self.entries if entry['seq'] > self.committed_seq]
+
+    def batch_names(self) -> set[str]:
+        with self._lock:
+            return {Path(entry['batch_file']).name for entry in self.entries}
+
+    def commit(self,seq:int,version:int):
+        """
+            Records that every batch up to seq is in the published store snapshot version.
+        """
+        with self._lock:
+            if seq <= self.committed_seq:
+                return
+            self.committed_seq = seq
+            self.committed_version = version
+            tmp_path = self.checkpoint_path.with_suffix(".checkpoint.tmp")
+            with open(tmp_path,"w",encoding="utf-8") as f:
+                json.dump({"committed_seq":seq,"version":version,"next_seq":self.next_seq},f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path,self.checkpoint_path)
+            if self._f.tell() >= self.compact_bytes:
+                self._compact()
+
+    def _compact(self):
+        """
+            Rewrites the log without its committed entries; their chunks are found in the vector store instead.
+        """
+        self.entries = [entry for entry in self.entries if entry['seq'] > self.committed_seq]
+        self.logged_ids = {uid for entry in self.entries for uid in entry['unique_ids']}
+        self._f.close()
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path,"w",encoding="utf-8") as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry,ensure_ascii=False,separators=(",",":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path,self.path)
+        self._f = open(self.path,"a",encoding="utf-8")
+        print(f"Compacted embedding log to {len(self.entries)} uncommitted batches.")
+
+    def close(self):
+        with self._lock:
+            self._f.close()
+
+
+_embedding_log = None
+_embedding_log_lock = threading.Lock()
+
+
+def get_embedding_log() -> EmbeddingLog:
+    """
+        Returns the process wide embedding log opened from embedding_log_config['path'].
+    """
+    global _embedding_log
+    with _embedding_log_lock:
+        if _embedding_log is None:
+            _embedding_log = EmbeddingLog()
+    return _embedding_log
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from utils.config import PIPELINE_VERSION,dedup_config,embedding_config,ocr_config,processor_config,reader_config,splitter_config,table_config
+from utils.utils import file_content_hash
+
+
+def pipeline_config_version() -> str:
+    """
+        Fingerprints the pipeline configuration that shapes the stage outputs.
+        Any change here makes every manifest entry stale, so all files are ingested again.
+        Paths, worker counts and other settings that do not change what a stage writes are left out.
+    """
+    payload = json.dumps({
+        "version": PIPELINE_VERSION,
+        "reader_config": reader_config,
+        "splitter_config": splitter_config,
+        "table_config": table_config,
+        "ocr": {key:ocr_config[key] for key in ("enabled","min_text_chars","min_image_pixels","lang")},
+        "dedup": {key:value for key,value in dedup_config.items() if key != "index_path"},
+        "processor_config": processor_config,
+        "embedding": {key:embedding_config[key] for key in ("backend","model","dimension")},
+    },sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class IngestionManifest(object):
+    """
+        Persistent record of which pipeline stages each input file has completed.
+        Entries are keyed by the file content hash and carry the pipeline config version they were produced with,
+        so a file is only skipped when both its bytes and the pipeline config are unchanged.
+
+        Layout of the manifest file:
+            {"files": {<content_hash>: {"source","config_version","stages":{<stage>:<output>},"updated_datetime"}},
+             "stat": {<path>: {"size","mtime_ns","content_hash"}}}
+        The stat index lets an unchanged file (same size and mtime) skip re-hashing, so a re-run over a static corpus only stats files.
+        An optional listener(fn,stage,done) is called whenever a stage of a file is marked done or invalidated (progress reporting).
+    """
+    def __init__(self,manifest_path:str):
+        self.manifest_path = Path(manifest_path)
+        self.config_version = pipeline_config_version()
+        self.entries = {}
+        self.stat_index = {}
+        self.listener = None
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path,"r",encoding="utf-8") as f:
+                    manifest = json.load(f)
+                self.entries = manifest.get("files",{})
+                self.stat_index = manifest.get("stat",{})
+            except (json.JSONDecodeError,OSError) as e:
+                print(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+                self.entries = {}
+                self.stat_index = {}
+
+    def content_hash(self,fn:Path) -> str:
+        key = str(fn)
+        stat = os.stat(fn)
+        cached = self.stat_index.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["content_hash"]
+        content_hash = file_content_hash(fn)
+        self.stat_index[key] = {"size":stat.st_size,"mtime_ns":stat.st_mtime_ns,"content_hash":content_hash}
+        return content_hash
+
+    def _entry(self,fn:Path) -> dict:
+        content_hash = self.content_hash(fn)
+        entry = self.entries.get(content_hash)
+        if entry is None or entry.get("config_version") != self.config_version:
+            entry = {"source":str(fn),"config_version":self.config_version,"stages":{}}
+            self.entries[content_hash] = entry
+        entry["source"] = str(fn)
+        return entry
+
+    def is_done(self,stage:str,fn:Path) -> bool:
+        entry = self.entries.get(self.content_hash(fn))
+        return (
+            entry is not None
+            and entry.get("config_version") == self.config_version
+            and stage in entry.get("stages",{})
+        )
+
+    def pending(self,stage:str,files:list[Path]) -> list[Path]:
+        """
+            Returns the files that still have to run the given stage, in input order.
+        """
+        return [fn for fn in files if not self.is_done(stage,fn)]
+
+    def mark_done(self,stage:str,fn:Path,output=None):
+        entry = self._entry(fn)
+        entry["stages"][stage] = output
+        entry["updated_datetime"] = datetime.now().isoformat()
+        if self.listener is not None:
+            self.listener(fn,stage,True)
+
+    def invalidate(self,fn:Path,stages:list[str]):
+        """
+            Forgets the given stages of a file, e.g. the stages downstream of an output that was rewritten.
+        """
+        entry = self.entries.get(self.content_hash(fn))
+        if entry is not None:
+            for stage in stages:
+                entry.get("stages",{}).pop(stage,None)
+        if self.listener is not None:
+            for stage in stages:
+                self.listener(fn,stage,False)
+
+    def stage_output(self,stage:str,fn:Path):
+        entry = self.entries.get(self.content_hash(fn),{})
+        return entry.get("stages",{}).get(stage)
+
+    def mark_outputs(self,stage:str,sources:list[Path],outputs:list[Path]):
+        """
+            Marks a stage done for every source whose output was produced. Outputs are named <source file name>.<ext>,
+            so an output matches the source whose full name is its stem (report.pdf -> report.pdf.jsonl).
+            Sources without an output are left pending so they are retried on the next run.
+        """
+        outputs_by_name = {Path(out).stem:out for out in outputs or []}
+        for fn in sources:
+            output = outputs_by_name.get(fn.name)
+            if output is not None:
+                self.mark_done(stage,fn,str(output))
+
+    def prune(self,files:list[Path]):
+        """
+            Drops entries whose content is no longer present in the input folder.
+        """
+        live_hashes = {self.content_hash(fn) for fn in files}
+        live_paths = {str(fn) for fn in files}
+        self.entries = {h:e for h,e in self.entries.items() if h in live_hashes}
+        self.stat_index = {p:s for p,s in self.stat_index.items() if p in live_paths}
+
+    def save(self):
+        """
+            Writes the manifest atomically: a temporary file is written and then renamed over the old one.
+        """
+        self.manifest_path.parent.mkdir(parents=True,exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(self.manifest_path.suffix + ".tmp")
+        with open(tmp_path,"w",encoding="utf-8") as f:
+            json.dump({"files":self.entries,"stat":self.stat_index},f,indent=2)
+        os.replace(tmp_path,self.manifest_path)
@@ -0,0 +1,369 @@
+import contextlib
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED,ProcessPoolExecutor,ThreadPoolExecutor,wait
+from datetime import datetime
+from pathlib import Path
+from common.embedding_cache import get_embedding_cache
+from common.embedding_connection import get_embedder
+from common.lexical_index import get_lexical_index
+from common.vector_db_config import lexical_index_config
+from common.vector_db_connection import get_vector_store
+from agent.document_embedding import add_to_lexical_index,already_embedded_check,embed_batch_with_retry,iter_chunk_batches,log_batch,save_batch
+from agent.document_extraction import DocumentExtractor,_partition_file_worker
+from agent.text_splitter import get_text_splitter
+from agent.document_ocr import OcrStage
+from agent.document_dedup import ChunkDeduplicator
+from agent.document_upsert import replay_embedding_log,upsert_batch
+from agent.embedded_batch import list_embedded_batches
+from agent.embedding_log import get_embedding_log
+from agent.ingestion_manifest import IngestionManifest
+from utils.config import dedup_config,embedding_config,ocr_config,streaming_pipeline_config
+
+_END = object()
+
+
+class StageStats(object):
+    """
+        Throughput and input queue depth of one streaming stage.
+    """
+    def __init__(self,name:str,input_queue:queue.Queue=None):
+        self.name = name
+        self.input_queue = input_queue
+        self.items = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def record(self,n:int=1,failed:bool=False):
+        with self._lock:
+            if failed:
+                self.failed += n
+            else:
+                self.items += n
+
+    def sample_queue(self):
+        if self.input_queue is not None:
+            self.max_queue_depth = max(self.max_queue_depth,self.input_queue.qsize())
+
+    def report(self) -> dict:
+        end = self.finished or time.perf_counter()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "stage":self.name,
+            "items":self.items,
+            "failed":self.failed,
+            "items_per_sec":round(self.items / elapsed,2) if elapsed > 0 else 0.0,
+            "queue_depth":self.input_queue.qsize() if self.input_queue is not None else 0,
+            "max_queue_depth":self.max_queue_depth,
+            "elapsed_sec":round(elapsed,2)
+        }
+
+
+class StreamingPipeline(object):
+    """
+        Runs extraction, embedding and upsert concurrently instead of stage by stage.
+
+            extraction (process pool) --file_queue--> embedding (thread pool) --upsert_queue--> upsert (one thread)
+
+        Extracted files are handed to embedding as soon as their worker finishes, embedded batches are upserted as soon as they are saved,
+        and the vector store publishes a snapshot after each file, so the first file is searchable while later files are still being parsed.
+        Both queues are bounded: a slow stage blocks the one feeding it instead of letting intermediate results pile up.
+        Extraction never runs more files ahead than its workers plus the free file_queue slots.
+
+        Stage outputs are the same files the batch pipeline writes, and every stage is recorded in the ingestion manifest,
+        so the two modes can be mixed across runs. The optional processing stage is not part of the stream: embedding reads extracted records.
+    """
+    def __init__(self,folders:dict,manifest:IngestionManifest,file_queue_size:int=None,upsert_queue_size:int=None,report_interval:float=None):
+        self.folders = folders
+        self.manifest = manifest
+        self.file_queue = queue.Queue(maxsize=file_queue_size or streaming_pipeline_config['file_queue_size'])
+        self.upsert_queue = queue.Queue(maxsize=upsert_queue_size or streaming_pipeline_config['upsert_queue_size'])
+        self.report_interval = report_interval or streaming_pipeline_config['report_interval']
+        self.stats = {
+            "extract":StageStats("extract"),
+            "embed":StageStats("embed",self.file_queue),
+            "upsert":StageStats("upsert",self.upsert_queue)
+        }
+        self.errors = []
+        self._deduplicator = None
+        self._fns_input = []
+        self._stop = threading.Event()
+        self._manifest_lock = threading.Lock()
+
+    def _put(self,q:queue.Queue,item):
+        """
+            Blocking put that gives up once another stage has failed, so no thread waits forever on a dead consumer.
+        """
+        while not self._stop.is_set():
+            try:
+                q.put(item,timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self,q:queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
+
+    def _run_stage(self,name:str,target,*args):
+        stats = self.stats[name]
+        stats.start()
+        try:
+            target(*args)
+        except Exception as e:
+            self.errors.append((name,e))
+            print(f"Streaming stage {name} failed: {e!r}")
+            self._stop.set()
+        finally:
+            stats.finish()
+
+    def extract_stage(self,fns_input:list[Path]):
+        with self._manifest_lock:
+            fns_pending = self.manifest.pending('extracted',fns_input)
+            done = [
+                (fn,self.manifest.stage_output('extracted',fn)) for fn in fns_input
+                if fn not in fns_pending and (
+                    not self.manifest.is_done('upserted',fn)
+                    or (ocr_config['enabled'] and not self.manifest.is_done('ocr',fn))
+                    or (dedup_config['enabled'] and not self.manifest.is_done('deduped',fn))
+                )
+            ]
+        ocr = OcrStage(text_splitter=get_text_splitter()) if ocr_config['enabled'] else None
+        self._deduplicator = ChunkDeduplicator() if dedup_config['enabled'] else None
+        self._fns_input = fns_input
+        try:
+            with ocr or contextlib.nullcontext():
+                self._extract_files(fns_pending,done,ocr)
+        finally:
+            if self._deduplicator is not None:
+                self._deduplicator.save()
+                print(f"Dedup : {self._deduplicator.stats()}")
+            self._put(self.file_queue,_END)
+
+    def _post_extract(self,ocr:OcrStage,fn:Path,output:Path):
+        """
+            Runs the opt-in OCR stage and near-duplicate marking on one extracted file before it is handed to embedding.
+        """
+        with self._manifest_lock:
+            run_ocr = ocr is not None and not self.manifest.is_done('ocr',fn)
+        if run_ocr:
+            n_records,failed = ocr.add_to_extracted(fn,output)
+            # A failed file goes on without OCR records and stays pending for the next run.
+            if not failed:
+                with self._manifest_lock:
+                    self.manifest.mark_done('ocr',fn)
+                    if n_records:
+                        self.manifest.invalidate(fn,['deduped','processed','embedded','upserted'])
+        with self._manifest_lock:
+            run_dedup = self._deduplicator is not None and not self.manifest.is_done('deduped',fn)
+        if run_dedup:
+            n_changed = self._deduplicator.dedup_file(fn,output)
+            with self._manifest_lock:
+                self.manifest.mark_done('deduped',fn)
+                if n_changed:
+                    self.manifest.invalidate(fn,['processed','embedded','upserted'])
+                # Documents holding duplicates of chunks this file evicted are deduplicated again by the next run.
+                for other in self._fns_input:
+                    if other.name in self._deduplicator.orphaned and other != fn:
+                        self.manifest.invalidate(other,['deduped'])
+                self._deduplicator.orphaned.clear()
+
+    def _extract_files(self,fns_pending:list[Path],done:list[tuple],ocr:OcrStage):
+        stats = self.stats['extract']
+        # Files extracted by an earlier run go straight to embedding.
+        for fn,output in done:
+            if output is None or not Path(output).exists():
+                continue
+            self._post_extract(ocr,fn,Path(output))
+            if not self._put(self.file_queue,(fn,Path(output))):
+                return
+        extractor = DocumentExtractor(fns_pending,self.folders['extracted'])
+        files = deque(extractor.files)
+        n_workers = max(1,min(extractor.max_workers,extractor.n_files))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            running = {}
+            while (files or running) and not self._stop.is_set():
+                while files and len(running) < n_workers + self.file_queue.maxsize - self.file_queue.qsize():
+                    fn = files.popleft()
+                    running[executor.submit(_partition_file_worker,extractor,fn,extractor.file_timeout)] = fn
+                finished,_ = wait(running,timeout=0.5,return_when=FIRST_COMPLETED)
+                for future in finished:
+                    fn = running.pop(future)
+                    try:
+                        output = future.result()
+                        with self._manifest_lock:
+                            self.manifest.mark_done('extracted',fn,str(output))
+                        self._post_extract(ocr,fn,output)
+                    except Exception as e:
+                        stats.record(failed=True)
+                        print(f"Extraction failed for file {fn}: {e!r}")
+                        continue
+                    stats.record()
+                    if not self._put(self.file_queue,(fn,output)):
+                        return
+            for future in running:
+                future.cancel()
+
+    def embed_stage(self):
+        stats = self.stats['embed']
+        embedder = get_embedder()
+        batch_size = embedder.batch_size
+        max_in_flight = max(1,int(embedding_config['max_in_flight']))
+        created_time = datetime.now()
+        lexical_index = get_lexical_index()
+        embedding_log = get_embedding_log()
+        already_embedded = already_embedded_check(embedding_log,lexical_index)
+        in_flight = deque()
+        failed_sources = set()
+        n_docs = 0
+        n_batches = 0
+
+        def save_oldest():
+            batch_id,future,fn = in_flight.popleft()
+            if future is None:
+                # End of file marker: all of its batches are saved.
+                if fn not in failed_sources:
+                    with self._manifest_lock:
+                        self.manifest.mark_done('embedded',fn)
+                return self._put(self.upsert_queue,("file",fn,None))
+            try:
+                batch = future.result()
+                fn_batch = save_batch(batch,created_time,batch_id,self.folders['embedded'])
+                seq = log_batch(batch,fn_batch,embedding_log)
+                add_to_lexical_index(batch,lexical_index)
+                stats.record(len(batch))
+            except Exception as e:
+                failed_sources.add(fn)
+                stats.record(failed=True)
+                print(f"Failed to embed batch : {batch_id}: {e}")
+                return True
+            return self._put(self.upsert_queue,("batch",fn_batch,seq))
+
+        try:
+            with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+                while True:
+                    item = self._get(self.file_queue)
+                    if item is _END:
+                        break
+                    fn,extracted = item
+                    with self._manifest_lock:
+                        file_done = self.manifest.is_done('embedded',fn)
+                    if not file_done:
+                        for batch_id,batch in iter_chunk_batches([Path(extracted)],batch_size,n_docs,n_batches,already_embedded):
+                            in_flight.append((batch_id,executor.submit(
+                                embed_batch_with_retry,
+                                batch,
+                                embedding_config['max_retries'],
+                                embedding_config['retry_backoff']
+                            ),fn))
+                            n_batches = batch_id + 1
+                            while len(in_flight) >= max_in_flight:
+                                if not save_oldest():
+                                    return
+                    n_docs += 1
+                    in_flight.append((None,None,fn))
+                    while len(in_flight) >= max_in_flight:
+                        if not save_oldest():
+                            return
+                while in_flight:
+                    if not save_oldest():
+                        return
+        finally:
+            lexical_index.save(lexical_index_config['path'])
+            self._put(self.upsert_queue,_END)
+
+    def upsert_stage(self):
+        stats = self.stats['upsert']
+        store = get_vector_store()
+        embedding_log = get_embedding_log()
+        staged_ids = set()
+        last_seq = None
+        try:
+            # Batches logged by an earlier run that never reached the store, plus batch files written before the log existed.
+            n_rows,_,n_superseded,_ = replay_embedding_log(store,embedding_log,staged_ids,list_embedded_batches(self.folders['embedded']))
+            stats.record(n_rows)
+            loaded_sources = store.snapshot.sources
+            while True:
+                item = self._get(self.upsert_queue)
+                if item is _END:
+                    break
+                kind,path,seq = item
+                if kind == "batch":
+                    last_seq = seq
+                    if path.name in loaded_sources:
+                        continue
+                    n_new,_,n_stale = upsert_batch(store,path,staged_ids)
+                    n_superseded += n_stale
+                    stats.record(n_new)
+                    continue
+                # kind == "file": publish so the whole file becomes searchable at once, then commit the log up to its last batch.
+                version = store.publish()
+                if last_seq is not None:
+                    embedding_log.commit(last_seq,version)
+                loaded_sources = store.snapshot.sources
+                with self._manifest_lock:
+                    if self.manifest.is_done('embedded',path):
+                        self.manifest.mark_done('upserted',path,version)
+        except Exception:
+            store.discard_staged()
+            raise
+        # The embed stage saved the lexical index before ending its queue, removals of superseded chunks come after.
+        if n_superseded:
+            get_lexical_index().save(lexical_index_config['path'])
+        store.update_ann_index()
+
+    def report(self):
+        for name in self.stats:
+            self.stats[name].sample_queue()
+        print(" | ".join(
+            f"{r['stage']}: {r['items']} done, {r['items_per_sec']}/s, queue {r['queue_depth']}"
+            for r in (stats.report() for stats in self.stats.values())
+        ))
+
+    def run(self,fns_input:list[Path]) -> dict:
+        """
+            Streams the input files through extraction, embedding and upsert.
+            Returns:
+                dict : Per-stage report (items, failed, items_per_sec, queue_depth, max_queue_depth, elapsed_sec).
+        """
+        print(f"Streaming {len(fns_input)} files through extraction, embedding and upsert.")
+        threads = [
+            threading.Thread(target=self._run_stage,args=("extract",self.extract_stage,fns_input),name="extract"),
+            threading.Thread(target=self._run_stage,args=("embed",self.embed_stage),name="embed"),
+            threading.Thread(target=self._run_stage,args=("upsert",self.upsert_stage),name="upsert")
+        ]
+        for thread in threads:
+            thread.start()
+        last_report = time.perf_counter()
+        while any(thread.is_alive() for thread in threads):
+            threads[-1].join(timeout=0.2)
+            for stats in self.stats.values():
+                stats.sample_queue()
+            if time.perf_counter() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        self.report()
+        if get_embedding_cache():
+            print(f"Embedding cache : {get_embedding_cache().stats()}")
+        if self.errors:
+            stage,error = self.errors[0]
+            raise RuntimeError(f"Streaming pipeline stopped in the {stage} stage.") from error
+        return {name:stats.report() for name,stats in self.stats.items()}
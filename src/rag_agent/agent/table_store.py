@@ -0,0 +1,163 @@
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Long format: one row per table cell, so tables of any shape share one columnar file per document.
+TABLE_COLUMNS = ["table_id","page","row","column","header","value"]
+# Cells buffered before they are written out as one row group, which bounds the memory of a document with many tables.
+ROW_GROUP_CELLS = 65536
+TABLE_SCHEMA = pa.schema([
+    ("table_id",pa.int64()),
+    ("page",pa.int64()),
+    ("row",pa.int64()),
+    ("column",pa.int64()),
+    ("header",pa.string()),
+    ("value",pa.string())
+]) if pa is not None else None
+
+
+def render_table(header:list[str],rows:list[list]) -> str:
+    """
+        Plain text rendering of a table (pipe separated, header first) used as the chunk text of table records.
+    """
+    lines = [" | ".join(header)]
+    lines.extend(" | ".join("" if cell is None else str(cell) for cell in row) for row in rows)
+    return "\n".join(lines)
+
+
+def table_header(header:list) -> list[str]:
+    """
+        Names the columns of an extracted header row, replacing empty cells with col_<index>.
+    """
+    return [str(cell) if cell not in (None,"") else f"col_{idx}" for idx,cell in enumerate(header)]
+
+
+class TableStore(object):
+    """
+        Collects the tables of one document and writes them as a columnar file next to its extraction records.
+
+        Tables are stored in long format (TABLE_COLUMNS, one row per cell) as <name>.tables.parquet when pyarrow is installed,
+        otherwise as columnar JSON (<name>.tables.json, one {"columns": {name: [values]}} line per row group), <name> being the
+        source file name. Extraction records keep a text rendering of each table plus a pointer (table_file, table_id) into
+        this file, so consumers can scan the cells without re-parsing.
+        Cells are written out every row_group_cells (a parquet row group, or a JSON line), so memory stays bounded whatever the
+        number of tables. The file is written to a temporary path and renamed on a clean close; a document without tables
+        removes the file of an earlier extraction, and an error discards the partial file and leaves the earlier one in place
+        (the extraction records of the failed run are discarded as well).
+        Usage:
+            with TableStore(output_dir/"report.pdf.tables") as tables:
+                pointer = tables.add(page,header,rows)
+    """
+    def __init__(self,path_stem:Path,storage:str="parquet",row_group_cells:int=ROW_GROUP_CELLS):
+        use_parquet = storage == "parquet" and pa is not None
+        self.path = Path(f"{path_stem}.parquet" if use_parquet else f"{path_stem}.json")
+        # The file of the other storage format, left over when the storage setting changed.
+        self.other_path = Path(f"{path_stem}.json" if use_parquet else f"{path_stem}.parquet")
+        self.tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        self.use_parquet = use_parquet
+        self.row_group_cells = row_group_cells
+        self.columns = {col:[] for col in TABLE_COLUMNS}
+        self.n_tables = 0
+        self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def add(self,page:int,header:list[str],rows:list[list]) -> dict:
+        """
+            Adds one table and returns the pointer stored in its extraction record.
+        """
+        table_id = self.n_tables
+        self.n_tables += 1
+        for row_idx,row in enumerate(rows):
+            for col_idx,cell in enumerate(row):
+                self.columns["table_id"].append(table_id)
+                self.columns["page"].append(page)
+                self.columns["row"].append(row_idx)
+                self.columns["column"].append(col_idx)
+                self.columns["header"].append(header[col_idx] if col_idx < len(header) else f"col_{col_idx}")
+                self.columns["value"].append(None if cell is None else str(cell))
+        if len(self.columns["value"]) >= self.row_group_cells:
+            self._flush()
+        return {"table_file":self.path.name,"table_id":table_id}
+
+    def _flush(self):
+        """
+            Writes the buffered cells to the temporary file as one row group (an empty one when nothing was written yet,
+            so a document whose tables have no cells still gets a file).
+        """
+        if not self.columns["value"] and self._writer is not None:
+            return
+        if self.use_parquet:
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.tmp_path,TABLE_SCHEMA)
+            self._writer.write_table(pa.table(self.columns,schema=TABLE_SCHEMA))
+        else:
+            if self._writer is None:
+                self._writer = open(self.tmp_path,"w",encoding="utf-8")
+            self._writer.write(json.dumps({"columns":self.columns},ensure_ascii=False) + "\n")
+        self.columns = {col:[] for col in TABLE_COLUMNS}
+
+    def _close_writer(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self):
+        """
+            Writes the remaining cells and publishes the file, or removes the file of an earlier extraction when no table was added.
+        """
+        if self.n_tables == 0:
+            self.discard()
+            self.path.unlink(missing_ok=True)
+        else:
+            self._flush()
+            self._close_writer()
+            os.replace(self.tmp_path,self.path)
+        self.other_path.unlink(missing_ok=True)
+
+    def discard(self):
+        """
+            Drops the partial file, the file of an earlier extraction is left untouched.
+        """
+        self._close_writer()
+        self.tmp_path.unlink(missing_ok=True)
+        self.columns = {col:[] for col in TABLE_COLUMNS}
+
+    def __exit__(self,exc_type,exc,tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+def load_tables(path:Path,table_id:Optional[int]=None) -> dict[str,list]:
+    """
+        Reads a table file written by TableStore as a dict of columns, optionally restricted to one table.
+    """
+    path = Path(path)
+    if path.suffix == ".parquet":
+        if pq is None:
+            raise ImportError("pyarrow is required to read parquet table files.")
+        filters = [("table_id","=",table_id)] if table_id is not None else None
+        return pq.read_table(path,filters=filters).to_pydict()
+    # One {"columns": ...} object per row group and line; files written before row groups hold a single one.
+    columns = {col:[] for col in TABLE_COLUMNS}
+    with open(path,"r",encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                for col,values in json.loads(line)["columns"].items():
+                    columns[col].extend(values)
+    if table_id is None:
+        return columns
+    keep = [idx for idx,tid in enumerate(columns["table_id"]) if tid == table_id]
+    return {col:[values[idx] for idx in keep] for col,values in columns.items()}
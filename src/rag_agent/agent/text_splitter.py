@@ -0,0 +1,215 @@
+import re
+import threading
+from bisect import bisect_right
+from collections import deque
+from typing import Callable,Optional
+from utils.config import splitter_config
+from utils.utils import count_tokens
+
+
+class FastTextSplitter(object):
+    """
+        Drop-in replacement for LangChain's RecursiveCharacterTextSplitter (default separators, keep_separator=True, strip_whitespace=True)
+        that returns the same chunks for the same text, chunk_size and chunk_overlap.
+
+        The recursion works on (start, end) offsets into the original string instead of substrings:
+        - separator matches are found once per text for the top-level span and with compiled patterns bounded by (pos, endpos) below it,
+          so no intermediate strings are built;
+        - with keep_separator every split starts at a separator, so splits are contiguous and a merged chunk is a single slice text[start:end];
+        - the merge window is a deque with a running length, instead of re-slicing a list for every dropped split.
+        Because chunks are slices, their character offsets come for free, which is what split_text_with_offsets and split_pages expose.
+
+        length='tokens' sizes chunks with utils.utils.count_tokens instead of characters.
+        The splitter holds no per-text state, so one instance is shared per process (get_text_splitter()).
+    """
+    def __init__(self,chunk_size:int=1000,chunk_overlap:int=200,separators:Optional[list[str]]=None,length:str="chars"):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must not be larger than chunk_size ({chunk_size}).")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators or ["\n\n","\n"," ",""]
+        self._patterns = {sep:re.compile(re.escape(sep)) for sep in self.separators if sep}
+        if length not in ("chars","tokens"):
+            raise ValueError(f"Unknown length '{length}', expected 'chars' or 'tokens'.")
+        self.length = length
+
+    def _length_function(self,text:str) -> Callable[[int,int],int]:
+        if self.length == "chars":
+            return lambda start,end: end - start
+        return lambda start,end: count_tokens(text[start:end])
+
+    def _match_starts(self,text:str,separator:str,start:int,end:int,top_level:dict) -> list[int]:
+        """
+            Start offsets of the non-overlapping separator matches inside [start, end), as re.split would find them on text[start:end].
+        """
+        if start == 0 and end == len(text):
+            if separator not in top_level:
+                top_level[separator] = [m.start() for m in self._patterns[separator].finditer(text)]
+            return top_level[separator]
+        return [m.start() for m in self._patterns[separator].finditer(text,start,end)]
+
+    def _strip(self,text:str,start:int,end:int) -> Optional[tuple[int,int]]:
+        piece = text[start:end]
+        stripped = piece.lstrip()
+        if not stripped:
+            return None
+        start += len(piece) - len(stripped)
+        return start,start + len(stripped.rstrip())
+
+    def _merge_splits(self,text:str,splits:list[tuple[int,int,int]],out:list[tuple[int,int]]):
+        current = deque()
+        total = 0
+        for start,end,size in splits:
+            if total + size > self.chunk_size and current:
+                span = self._strip(text,current[0][0],current[-1][1])
+                if span is not None:
+                    out.append(span)
+                while total > self.chunk_overlap or (total + size > self.chunk_size and total > 0):
+                    total -= current.popleft()[2]
+            current.append((start,end,size))
+            total += size
+        if current:
+            span = self._strip(text,current[0][0],current[-1][1])
+            if span is not None:
+                out.append(span)
+
+    def _split(self,text:str,start:int,end:int,separators:list[str],length,top_level:dict,out:list[tuple[int,int]]):
+        separator = separators[-1]
+        new_separators = []
+        for i,sep in enumerate(separators):
+            if not sep:
+                separator = sep
+                break
+            if self._patterns[sep].search(text,start,end):
+                separator = sep
+                new_separators = separators[i+1:]
+                break
+
+        if separator:
+            # keep_separator: each split runs from one separator match to the next, an empty leading split is dropped.
+            bounds = self._match_starts(text,separator,start,end,top_level)
+            edges = [start] + [pos for pos in bounds if pos > start] + [end]
+        else:
+            edges = list(range(start,end+1))
+
+        good = []
+        for split_start,split_end in zip(edges,edges[1:]):
+            size = length(split_start,split_end)
+            if size < self.chunk_size:
+                good.append((split_start,split_end,size))
+                continue
+            if good:
+                self._merge_splits(text,good,out)
+                good = []
+            if not new_separators:
+                out.append((split_start,split_end))
+            else:
+                self._split(text,split_start,split_end,new_separators,length,top_level,out)
+        if good:
+            self._merge_splits(text,good,out)
+
+    def split_text_with_offsets(self,text:str) -> list[tuple[str,int]]:
+        """
+            Splits text into chunks and returns each chunk with its start offset in text.
+        """
+        spans = []
+        if text:
+            self._split(text,0,len(text),self.separators,self._length_function(text),{},spans)
+        return [(text[start:end],start) for start,end in spans]
+
+    def split_text(self,text:str) -> list[str]:
+        """
+            Splits text into chunks, identical to RecursiveCharacterTextSplitter.split_text.
+        """
+        return [chunk for chunk,_ in self.split_text_with_offsets(text)]
+
+    def split_pages(self,pages:list[str],page_separator:str="\n") -> list[dict]:
+        """
+            Splits a document given as page texts as one continuous text, so chunks can span page boundaries.
+            Returns:
+                list[dict] : {'content','start_index','page_start','page_end'} per chunk, pages zero based.
+        """
+        page_offsets = []
+        offset = 0
+        for page_text in pages:
+            page_offsets.append(offset)
+            offset += len(page_text) + len(page_separator)
+        text = page_separator.join(pages)
+        return [
+            {
+                "content":chunk,
+                "start_index":start,
+                "page_start":bisect_right(page_offsets,start) - 1,
+                "page_end":bisect_right(page_offsets,start + len(chunk) - 1) - 1
+            }
+            for chunk,start in self.split_text_with_offsets(text)
+        ]
+
+
+class PageChunker(object):
+    """
+        Feeds a streamed document to FastTextSplitter.split_pages one page at a time.
+        Every chunk but the last is final once a page is added; the last one may still grow into the next page,
+        so only the text from its start onward is carried. Memory stays bounded by a page plus one chunk.
+        Chunks are returned with absolute page numbers and with start_index relative to their first page.
+    """
+    def __init__(self,text_splitter:FastTextSplitter,page_separator:str="\n"):
+        self.text_splitter = text_splitter
+        self.page_separator = page_separator
+        self._pages = []  # (page, text, offset of text in its page)
+
+    def _split(self) -> list[dict]:
+        chunks = self.text_splitter.split_pages([text for _,text,_ in self._pages],self.page_separator)
+        page_offsets = []
+        offset = 0
+        for _,text,_ in self._pages:
+            page_offsets.append(offset)
+            offset += len(text) + len(self.page_separator)
+        for chunk in chunks:
+            page,_,page_offset = self._pages[chunk['page_start']]
+            chunk['start_index'] += page_offset - page_offsets[chunk['page_start']]
+            chunk['page_start'] = page
+            chunk['page_end'] = self._pages[chunk['page_end']][0]
+        return chunks
+
+    def add(self,page:int,text:str) -> list[dict]:
+        """
+            Adds the text of the next page and returns the chunks that can no longer change.
+        """
+        self._pages.append((page,text,0))
+        chunks = self._split()
+        if len(chunks) < 2:
+            return []
+        last = chunks[-1]
+        first = next(i for i,(number,_,_) in enumerate(self._pages) if number == last['page_start'])
+        page,text,page_offset = self._pages[first]
+        cut = last['start_index'] - page_offset
+        self._pages = [(page,text[cut:],last['start_index'])] + self._pages[first+1:]
+        return chunks[:-1]
+
+    def finish(self) -> list[dict]:
+        """
+            Returns the remaining chunks at the end of the document.
+        """
+        chunks = self._split() if self._pages else []
+        self._pages = []
+        return chunks
+
+
+_text_splitter = None
+_text_splitter_lock = threading.Lock()
+
+
+def get_text_splitter() -> FastTextSplitter:
+    """
+        The process wide splitter configured from splitter_config, shared by the extraction and OCR stages.
+    """
+    global _text_splitter
+    with _text_splitter_lock:
+        if _text_splitter is None:
+            _text_splitter = FastTextSplitter(
+                chunk_size=splitter_config['chunk_size'],
+                chunk_overlap=splitter_config['chunk_overlap'],
+                length=splitter_config['length']
+            )
+    return _text_splitter
@@ -1,30 +1,83 @@
+import asyncio
 import json
 import os
-from typing import Any,Dict
+import threading
+from typing import Any,Dict,Optional
 from dotenv import load_dotenv
 from utils.config import AGENT_NAME
 from agent.chat_history import answer_from_existing_data
 from agent.Document_Pipeline import DocumentPipeline
+from app.ingestion_jobs import IngestionJob,IngestionJobManager
+from common.hybrid_retrieval import search_documents_async
+from common.lexical_index import reload_lexical_index
+from common.metadata_index import get_document_sessions
+from common.vector_db_connection import get_vector_store
 from utils.config import document_pipeline_config
 load_dotenv()
 
+_ingestion_jobs = None
+_ingestion_jobs_lock = threading.Lock()
+
+
+def run_document_ingestion(job:IngestionJob):
+    """
+        Job body, run in the ingestion job process: the configured document pipeline, reporting its progress into the job.
+        Every document of the run is then recorded as uploaded by the job's sessions, for session_id filters, including
+        documents an earlier upload (of another session) already ingested.
+    """
+    pipeline = DocumentPipeline(progress=job)
+    pipeline.run(
+        extract_files = document_pipeline_config['extracting_on'],
+        process_files = document_pipeline_config['processing_on'],
+        embed_files = document_pipeline_config['embedding_on'],
+        upsert_files = document_pipeline_config['upserting_on'],
+        streaming = document_pipeline_config['streaming_on']
+    )
+    get_document_sessions().add(job.session_ids,job.input_files)
+
+
+def reload_search_indexes(job:IngestionJob):
+    """
+        Runs in the API process after an ingestion job: reloads the BM25 and ANN indexes the job process saved.
+        Vector store snapshots and session ownership need nothing, they are re-read whenever their file changes.
+    """
+    reload_lexical_index()
+    get_vector_store().reload_ann_index()
+
+
+def get_ingestion_jobs() -> IngestionJobManager:
+    global _ingestion_jobs
+    with _ingestion_jobs_lock:
+        if _ingestion_jobs is None:
+            _ingestion_jobs = IngestionJobManager(run_document_ingestion,after_job=reload_search_indexes)
+    return _ingestion_jobs
+
+
 def process_document_upload(payload:Dict[str,Any]) -> Dict[str,Any]:
+    """
+        Queues a background ingestion job for the uploaded documents and returns without waiting for it.
+        Args:
+            payload(Dict[str,Any]) : Upload request data with the session_id.
+        Returns:
+            Dict[str,Any] : {'job_id','status'} of the job to poll with get_document_upload_status, or an error.
+    """
     try :
-        pipeline = DocumentPipeline()
-        pipeline.run(
-            extract_files = document_pipeline_config['extracting_on'],
-            process_files = document_pipeline_config['processing_on'],
-            embed_files = document_pipeline_config['embedding_on'],
-            upsert_files = document_pipeline_config['upserting_on']
-        )
-        return payload
+        job = get_ingestion_jobs().submit(payload['session_id'])
+        return {"job_id":job.job_id,"status":job.status}
     except Exception as e:
         print("Error in process_document_upload: %s",e)
         return {"error":"Failed to process document upload."}
 
 
+def get_document_upload_status(job_id:str) -> Optional[Dict[str,Any]]:
+    """
+        Returns the status and per-file, per-stage progress of an ingestion job, or None for an unknown job id.
+    """
+    job = get_ingestion_jobs().get(job_id)
+    return job.to_dict() if job is not None else None
+
 
-def process_document_search(payload:Dict[str,Any])->Dict[str,Any]:
+async def process_document_search(payload:Dict[str,Any])->Dict[str,Any]:
     """
         Processes a document search by checking if there is an exisiting answer,
         and if not retrieving relevant document and performing a Q&A task on them.
@@ -37,19 +90,39 @@ def process_document_search(payload:Dict[str,Any])->Dict[str,Any]:
 
     try:
         payload['source_agent'] = 'rag-agent'
-        existing_chat_data = answer_from_existing_data(payload)
+        existing_chat_data = await asyncio.to_thread(answer_from_existing_data,payload)
         if not existing_chat_data['can_answer']:
-            response = handle_new_query(payload,existing_chat_data)
+            response = await handle_new_query(payload,existing_chat_data)
         else:
             response = handle_existing_response(payload,existing_chat_data)
     except Exception as e:
         response = build_error_response(f"Error processing : {str(e)}")
+    return response
 
 def handle_existing_response(payload:Dict[str,Any],exisiting_chat_data:Dict[str,Any])->Dict[str,Any]:
     pass
 
-def handle_new_query(payload:Dict[str,Any],exisiting_chat_data:Dict[str,Any])->Dict[str,Any]:
-    pass
+async def handle_new_query(payload:Dict[str,Any],exisiting_chat_data:Dict[str,Any])->Dict[str,Any]:
+    """
+        Retrieves the chunks relevant to a new query through the cached hybrid search,
+        micro-batched with the dense searches of concurrent requests.
+        Args:
+            payload(Dict[str,Any]) : Query request data with the user_query and optional metadata filters
+                                     (e.g. {'document_name': '10-K_2023.pdf'} or {'session_id': <session>}).
+            exisiting_chat_data(Dict[str,Any]) : Result of answer_from_existing_data.
+        Returns:
+            Dict[str,Any] : Response with the retrieved chunk metadata in response_metadata['metadata'].
+    """
+    hits = await search_documents_async(payload['user_query'],filters=payload.get('filters'))
+    print(f"Retrieved {len(hits)} chunks for the query.")
+    if not hits:
+        return build_error_response("No relevant documents found for this query.")
+    return {
+        "CanIAnswerPrompt":"True",
+        "agent_name":AGENT_NAME,
+        "answer_text":"",
+        "response_metadata":{"metadata":hits,"answer_img":[]}
+    }
 
 def build_error_response(error_message:str) -> Dict[str,Any]:
     return {
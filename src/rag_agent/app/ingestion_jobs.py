@@ -0,0 +1,270 @@
+import multiprocessing
+import queue
+import threading
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any,Callable,Dict,Optional
+from utils.config import ingestion_jobs_config
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+FILE_PENDING = "pending"
+FILE_RUNNING = "running"
+FILE_DONE = "done"
+
+
+def file_stage_states(fns_input:list[Path],manifest,stages:list[str]) -> Dict[str,Dict[str,str]]:
+    """
+        Initial {file name: {stage: state}} of a run: stages the manifest already records as done start as done.
+    """
+    return {
+        Path(fn).name:{stage:FILE_DONE if manifest.is_done(stage,fn) else FILE_PENDING for stage in stages}
+        for fn in fns_input
+    }
+
+
+class IngestionJob(object):
+    """
+        State of one background ingestion run, shared between the manager thread following the run and the status endpoint.
+
+        The job receives the pipeline's progress: set_files() records the input files and the stages of the run,
+        stage_started() marks the stage currently running, and file_stage_done moves each file/stage cell from pending to done
+        as soon as the pipeline records it. Files whose stages were already done before the run start as done.
+        In the job process the pipeline reports to a JobProgressReporter, whose events the manager applies here; begin() lets
+        the job itself serve as the pipeline's progress tracker when the pipeline runs in this process.
+    """
+    def __init__(self,session_id:str):
+        self.job_id = uuid.uuid4().hex
+        self.session_ids = [session_id]
+        self.status = JOB_QUEUED
+        self.created_datetime = datetime.now().isoformat()
+        self.started_datetime = None
+        self.finished_datetime = None
+        self.current_stage = None
+        self.stages = []
+        self.files = {}
+        self.input_files = []
+        self.new_files = []
+        self.error = None
+        self._lock = threading.Lock()
+
+    def begin(self,fns_input:list[Path],manifest,stages:list[str]):
+        self.set_files(stages,file_stage_states(fns_input,manifest,stages))
+        manifest.listener = self.file_stage_done
+
+    def set_files(self,stages:list[str],files:Dict[str,Dict[str,str]]):
+        with self._lock:
+            self.stages = list(stages)
+            self.files = {name:dict(file_stages) for name,file_stages in files.items()}
+            self.input_files = list(self.files)
+            self.new_files = [name for name,file_stages in self.files.items() if FILE_PENDING in file_stages.values()]
+
+    def stage_started(self,stage:str):
+        with self._lock:
+            self.current_stage = stage
+            for file_stages in self.files.values():
+                if file_stages.get(stage) == FILE_PENDING:
+                    file_stages[stage] = FILE_RUNNING
+
+    def file_stage_done(self,fn:Path,stage:str,done:bool):
+        with self._lock:
+            file_stages = self.files.get(Path(fn).name)
+            if file_stages is not None and stage in file_stages:
+                file_stages[stage] = FILE_DONE if done else FILE_PENDING
+
+    def set_status(self,status:str,error:Optional[str]=None):
+        with self._lock:
+            self.status = status
+            if status == JOB_RUNNING:
+                self.started_datetime = datetime.now().isoformat()
+            elif status in (JOB_SUCCEEDED,JOB_FAILED):
+                self.finished_datetime = datetime.now().isoformat()
+                self.current_stage = None
+                if status == JOB_FAILED:
+                    for file_stages in self.files.values():
+                        for stage,state in file_stages.items():
+                            if state == FILE_RUNNING:
+                                file_stages[stage] = FILE_PENDING
+            self.error = error
+
+    def to_dict(self) -> Dict[str,Any]:
+        with self._lock:
+            files = {name:dict(file_stages) for name,file_stages in self.files.items()}
+            return {
+                "job_id":self.job_id,
+                "status":self.status,
+                "session_ids":list(self.session_ids),
+                "created_datetime":self.created_datetime,
+                "started_datetime":self.started_datetime,
+                "finished_datetime":self.finished_datetime,
+                "current_stage":self.current_stage,
+                "stages":list(self.stages),
+                "files":files,
+                "progress":{
+                    "files":len(files),
+                    "done":{stage:sum(1 for s in files.values() if s.get(stage) == FILE_DONE) for stage in self.stages}
+                },
+                "error":self.error
+            }
+
+
+class JobProgressReporter(object):
+    """
+        Progress tracker handed to the job body inside the job process. Exposes the job's session_ids, input_files and new_files
+        like IngestionJob and forwards begin / stage_started / file_stage_done as events to the API process.
+    """
+    def __init__(self,session_ids:list[str],events):
+        self.session_ids = list(session_ids)
+        self.input_files = []
+        self.new_files = []
+        self.events = events
+
+    def begin(self,fns_input:list[Path],manifest,stages:list[str]):
+        files = file_stage_states(fns_input,manifest,stages)
+        self.input_files = list(files)
+        self.new_files = [name for name,file_stages in files.items() if FILE_PENDING in file_stages.values()]
+        self.events.put(("begin",list(stages),files))
+        manifest.listener = self.file_stage_done
+
+    def stage_started(self,stage:str):
+        self.events.put(("stage",stage))
+
+    def file_stage_done(self,fn:Path,stage:str,done:bool):
+        self.events.put(("file",Path(fn).name,stage,done))
+
+
+def run_job_process(run_job:Callable,session_ids:list[str],events):
+    """
+        Entry point of a job process: runs the job body against a JobProgressReporter and reports how it ended.
+    """
+    try:
+        run_job(JobProgressReporter(session_ids,events))
+    except Exception as e:
+        events.put(("failed",str(e),traceback.format_exc()))
+    else:
+        events.put(("succeeded",))
+
+
+class IngestionJobManager(object):
+    """
+        Runs ingestion jobs in a separate process so /document_upload can return a job id immediately and the API process
+        keeps its interpreter (and GIL) for requests: extraction, dedup, splitting and embedding all run in the job process.
+
+        Every run ingests the whole input folder and shares the manifest, stage folders and vector store with any other run,
+        so jobs execute one at a time: a single manager thread starts the process of the next job and applies the progress
+        events it sends to the IngestionJob until the process ends. An upload arriving while a job is still queued joins that
+        job instead of queuing another full run: the queued run will pick up its files anyway. Vector store snapshots are
+        published atomically, so searches keep being served from the current snapshot during ingestion; after_job then lets
+        the API process reload what the job rewrote on disk. Finished jobs are kept for polling, up to max_finished_jobs.
+        Args:
+            run_job(Callable) : Job body, called with a JobProgressReporter in the job process; must be a module level function.
+            after_job(Callable) : Called in this process with the job once its process has ended, whatever the outcome.
+    """
+    def __init__(self,run_job:Callable[[IngestionJob],None],max_finished_jobs:int=None,after_job:Callable[[IngestionJob],None]=None,start_method:str=None):
+        self.run_job = run_job
+        self.after_job = after_job
+        self.max_finished_jobs = max_finished_jobs or ingestion_jobs_config['max_finished_jobs']
+        self.context = multiprocessing.get_context(start_method or ingestion_jobs_config['start_method'])
+        self.executor = ThreadPoolExecutor(max_workers=1,thread_name_prefix="ingestion")
+        self.jobs = OrderedDict()
+        self._queued_job = None
+        self._process = None
+        self._lock = threading.Lock()
+
+    def submit(self,session_id:str) -> IngestionJob:
+        with self._lock:
+            if self._queued_job is not None:
+                if session_id not in self._queued_job.session_ids:
+                    self._queued_job.session_ids.append(session_id)
+                return self._queued_job
+            job = IngestionJob(session_id)
+            self.jobs[job.job_id] = job
+            self._queued_job = job
+            self._trim()
+        self.executor.submit(self._run,job)
+        print(f"Queued ingestion job {job.job_id} for session {session_id}.")
+        return job
+
+    def _run(self,job:IngestionJob):
+        with self._lock:
+            if self._queued_job is job:
+                self._queued_job = None
+        job.set_status(JOB_RUNNING)
+        try:
+            self._run_in_process(job)
+            job.set_status(JOB_SUCCEEDED)
+            print(f"Ingestion job {job.job_id} succeeded.")
+        except Exception as e:
+            traceback.print_exc()
+            job.set_status(JOB_FAILED,error=str(e))
+            print(f"Ingestion job {job.job_id} failed: {e!r}")
+        finally:
+            if self.after_job is not None:
+                self.after_job(job)
+
+    def _run_in_process(self,job:IngestionJob):
+        """
+            Runs the job body in a new process and applies its progress events to the job until the process ends.
+            Raises:
+                RuntimeError : When the job body raised, or the process died without reporting an outcome.
+        """
+        events = self.context.Queue()
+        process = self.context.Process(
+            target=run_job_process,
+            args=(self.run_job,list(job.session_ids),events),
+            name=f"ingestion-{job.job_id[:8]}"
+        )
+        process.start()
+        self._process = process
+        outcome = None
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=0.2)
+                except queue.Empty:
+                    # A process flushes its events before exiting, so once it is gone an empty queue means nothing is left.
+                    if not process.is_alive():
+                        break
+                    continue
+                kind = event[0]
+                if kind == "begin":
+                    job.set_files(event[1],event[2])
+                elif kind == "stage":
+                    job.stage_started(event[1])
+                elif kind == "file":
+                    job.file_stage_done(event[1],event[2],event[3])
+                else:
+                    outcome = event
+        finally:
+            process.join()
+            self._process = None
+        if outcome is None:
+            raise RuntimeError(f"Ingestion process exited with code {process.exitcode} before finishing the job.")
+        if outcome[0] == "failed":
+            print(outcome[2])
+            raise RuntimeError(outcome[1])
+
+    def _trim(self):
+        finished = [job_id for job_id,job in self.jobs.items() if job.status in (JOB_SUCCEEDED,JOB_FAILED)]
+        for job_id in finished[:max(0,len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def get(self,job_id:str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def shutdown(self):
+        """
+            Cancels queued jobs and stops a running job process; the ingestion manifest lets the next run resume its files.
+        """
+        self.executor.shutdown(wait=False,cancel_futures=True)
+        process = self._process
+        if process is not None and process.is_alive():
+            process.terminate()
@@ -0,0 +1,91 @@
+"""
+    Recall@k versus latency of the IVF-PQ index against exact search on a synthetic clustered corpus.
+    Sweeps nprobe (and refinement on/off) so an operating point can be picked for vector_db_config['ann'].
+
+    Usage (from src/rag_agent):
+        python -m benchmarks.bench_ann_index --rows 200000 --dim 768 --queries 200 --k 10
+"""
+import argparse
+import json
+import time
+import numpy as np
+from common.ann_index import IVFPQIndex
+from common.vector_search import block_top_k,normalize_rows,sort_top_k
+
+
+def synthetic_corpus(n_rows:int,dim:int,n_topics:int,spread:float=0.6,seed:int=0):
+    """
+        Gaussian mixture around random topic directions, which mimics the clustered structure of real chunk embeddings.
+        spread is the expected norm of the per-row noise relative to the unit topic vector.
+    """
+    rng = np.random.default_rng(seed)
+    topics = normalize_rows(rng.standard_normal((n_topics,dim),dtype=np.float32))
+    labels = rng.integers(0,n_topics,n_rows)
+    corpus = np.empty((n_rows,dim),dtype=np.float32)
+    for start in range(0,n_rows,65536):
+        stop = min(start+65536,n_rows)
+        noise = rng.standard_normal((stop-start,dim),dtype=np.float32) * (spread / np.sqrt(dim))
+        corpus[start:stop] = topics[labels[start:stop]] + noise
+    return normalize_rows(corpus),topics,rng
+
+
+def recall_at_k(approx_rows:np.ndarray,exact_rows:np.ndarray) -> float:
+    hits = sum(len(set(a) & set(e)) for a,e in zip(approx_rows,exact_rows))
+    return hits / exact_rows.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--spread", type=float, default=1.0, help="Noise norm relative to the topic vector; larger values make topics overlap.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=1024)
+    parser.add_argument("--pq-m", type=int, default=16)
+    parser.add_argument("--refine-factor", type=int, default=4)
+    parser.add_argument("--train-sample", type=int, default=100000)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1,2,4,8,16,32,64])
+    args = parser.parse_args()
+
+    corpus,topics,rng = synthetic_corpus(args.rows,args.dim,args.topics,args.spread)
+    query_noise = rng.standard_normal((args.queries,args.dim),dtype=np.float32) * (args.spread / np.sqrt(args.dim))
+    queries = normalize_rows(topics[rng.integers(0,args.topics,args.queries)] + query_noise)
+
+    start = time.perf_counter()
+    exact_scores,exact_rows = sort_top_k(*block_top_k(queries,corpus,args.k))
+    exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+    index = IVFPQIndex(args.dim,n_lists=args.n_lists,pq_m=args.pq_m,refine_factor=args.refine_factor)
+    start = time.perf_counter()
+    index.train(corpus[rng.choice(args.rows,min(args.rows,args.train_sample),replace=False)])
+    train_s = time.perf_counter() - start
+    start = time.perf_counter()
+    index.add(corpus,np.arange(args.rows))
+    add_s = time.perf_counter() - start
+
+    results = {
+        "rows": args.rows, "dim": args.dim, "k": args.k, "topics": args.topics, "spread": args.spread, "n_lists": index.n_lists, "pq_m": args.pq_m, "refine_factor": args.refine_factor,
+        "train_s": round(train_s,2), "add_s": round(add_s,2),
+        "exact": {"latency_ms": round(exact_ms,3), "qps": round(1000/exact_ms,1)},
+        "ann": [],
+    }
+    for refine in (False,True):
+        for nprobe in args.nprobe:
+            start = time.perf_counter()
+            _,rows = index.search(queries,args.k,nprobe=nprobe,refine=(lambda r: corpus[r]) if refine else None)
+            latency_ms = (time.perf_counter() - start) * 1000 / args.queries
+            point = {
+                "nprobe": nprobe, "refine": refine,
+                "recall_at_k": round(recall_at_k(rows,exact_rows),4),
+                "latency_ms": round(latency_ms,3), "qps": round(1000/latency_ms,1),
+            }
+            results["ann"].append(point)
+            print(f"nprobe={nprobe:<4} refine={refine!s:<5} recall@{args.k}={point['recall_at_k']:.3f} {latency_ms:8.3f} ms/query")
+    print(f"exact {exact_ms:8.3f} ms/query")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
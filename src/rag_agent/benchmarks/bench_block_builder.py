@@ -0,0 +1,93 @@
+"""
+    Micro-benchmark of DocumentProcessor.iter_blocks on a large synthetic element list.
+    The legacy builder (content grown with +=, page list rebuilt from the whole block for every item, 8000 character limit)
+    is reproduced with its always-true switch fixed, so both builders emit comparable multi-item blocks.
+
+    Usage (from src/rag_agent):
+        python -m benchmarks.bench_block_builder --elements 200000 --items-per-page 400
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import time
+
+
+def synthetic_elements(n_elements:int,items_per_page:int,words_per_item:int,seed:int=0) -> list[dict]:
+    rng = random.Random(seed)
+    vocab = ["revenue","NUSA","Cost_Center","plant","EBITDA","forecast","variance","segment","margin","capex","4010-200","quarter"]
+    return [
+        {
+            "type":"table" if i % 17 == 0 else "text",
+            "content":" ".join(rng.choice(vocab) for _ in range(words_per_item)),
+            "page":i // items_per_page,
+            "chunk_index":i % items_per_page
+        }
+        for i in range(n_elements)
+    ]
+
+
+def legacy_blocks(data,max_chars:int=8000) -> int:
+    """
+        The block builder process_contents used before the rewrite, with 'by_page' chunking.
+    """
+    n_blocks = 0
+    block = {"content":"","page_number":[],"type":[]}
+    for item in data:
+        block_has_len = len(block['page_number']) > 0
+        switch = len(block['content']) > max_chars
+        if block_has_len and not switch:
+            page_numbers = [elem.get('page_number') for elem in block['page_number']]
+            page_numbers = list(filter(lambda s: s is not None,page_numbers))
+            switch = item['page'] not in page_numbers
+        if switch:
+            n_blocks += 1
+            block = {"content":"","page_number":[],"type":[]}
+        block['content'] += f"{item['content']}"
+        block['page_number'].append({"page_number":item['page']})
+        block['type'].append(item['type'])
+    return n_blocks + (1 if block['content'] else 0)
+
+
+def current_blocks(data,max_block_tokens:int) -> int:
+    from agent.document_processing import DocumentProcessor
+
+    processor = DocumentProcessor([],"intermediate/processed")
+    processor.chunk_method = "by_page"
+    processor.max_block_tokens = max_block_tokens
+    return sum(1 for _ in processor.iter_blocks(data))
+
+
+def timed(fn,*args) -> dict:
+    # The processor prints progress, keep it out of the timing output.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        n_blocks = fn(*args)
+        wall = time.perf_counter() - start
+    return {"blocks":n_blocks,"wall_s":round(wall,4)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, default=200000)
+    parser.add_argument("--items-per-page", type=int, default=400)
+    parser.add_argument("--words-per-item", type=int, default=8)
+    parser.add_argument("--max-chars", type=int, default=8000, help="Legacy block limit in characters.")
+    parser.add_argument("--max-block-tokens", type=int, default=2000, help="Token limit of the current builder.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = synthetic_elements(args.elements,args.items_per_page,args.words_per_item)
+    results = {}
+    for name,fn,limit in (("legacy",legacy_blocks,args.max_chars),("current",current_blocks,args.max_block_tokens)):
+        runs = [timed(fn,data,limit) for _ in range(args.repeat)]
+        best = min(runs,key=lambda r: r["wall_s"])
+        best["elements_per_sec"] = round(args.elements / best["wall_s"]) if best["wall_s"] else None
+        results[name] = best
+        print(f"{name:<8} {best['wall_s']:>8.3f}s {best['blocks']:>8} blocks {best['elements_per_sec']:>10} elements/s")
+    print(json.dumps({"elements":args.elements,"items_per_page":args.items_per_page,**results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
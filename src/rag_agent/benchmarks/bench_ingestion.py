@@ -0,0 +1,254 @@
+"""
+    End-to-end ingestion throughput on a synthetic corpus of financial PDFs, for comparing runs across commits.
+    The corpus is generated locally with PyMuPDF from a seed: report pages with paragraphs of figures, ruled tables and
+    hyperlinks, with page counts drawn between --min-pages and --max-pages. It then runs run_data_extraction,
+    run_data_processing and embed_documents_chunks with the offline hashing embedder (no network, embedding cache off),
+    all writing under --workdir, and prints one JSON report:
+        wall time per stage, pages/sec and chunks/sec, peak RSS of this process and of the extraction workers, and the git commit.
+    Pass an earlier report with --baseline to add the wall time ratio of every stage (this run / baseline).
+
+    Usage (from src/rag_agent):
+        python -m benchmarks.bench_ingestion --docs 20 --output bench_ingestion.json
+        python -m benchmarks.bench_ingestion --docs 20 --baseline bench_ingestion.json
+"""
+import argparse
+import contextlib
+import json
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+COMPANIES = ["Northwind Holdings","Contoso Energy","Fabrikam Industrial","Tailspin Logistics","Woodgrove Financial"]
+SEGMENTS = ["Americas","EMEA","APAC","Corporate","Services","Manufacturing"]
+METRICS = ["revenue","EBITDA","operating margin","capex","free cash flow","working capital","net debt","gross margin"]
+PAGE_WIDTH,PAGE_HEIGHT = 595,842
+MARGIN = 50
+
+
+def _sentence(rng:random.Random) -> str:
+    metric = rng.choice(METRICS)
+    segment = rng.choice(SEGMENTS)
+    change = rng.uniform(-15,25)
+    return (
+        f"{segment} {metric} was {rng.uniform(5,900):,.1f} million in Q{rng.randint(1,4)} {rng.randint(2019,2025)}, "
+        f"{'up' if change >= 0 else 'down'} {abs(change):.1f}% against the prior year, driven by "
+        f"{rng.choice(['pricing','volume','mix','FX','cost savings','restructuring'])}."
+    )
+
+
+def _draw_table(page,rng:random.Random,top:float) -> float:
+    """
+        Draws a ruled table of yearly figures per segment starting at top and returns its bottom edge.
+    """
+    years = [str(year) for year in range(2021,2021 + rng.randint(2,4))]
+    header = ["Segment"] + years
+    rows = [[segment] + [f"{rng.uniform(10,999):,.1f}" for _ in years] for segment in rng.sample(SEGMENTS,rng.randint(3,6))]
+    col_width = (PAGE_WIDTH - 2*MARGIN) / len(header)
+    row_height = 18
+    for row_idx,row in enumerate([header] + rows):
+        y = top + row_idx*row_height
+        for col_idx,cell in enumerate(row):
+            page.insert_text((MARGIN + col_idx*col_width + 4,y + 13),cell,fontsize=9)
+    bottom = top + (len(rows) + 1)*row_height
+    for row_idx in range(len(rows) + 2):
+        y = top + row_idx*row_height
+        page.draw_line((MARGIN,y),(PAGE_WIDTH - MARGIN,y))
+    for col_idx in range(len(header) + 1):
+        x = MARGIN + col_idx*col_width
+        page.draw_line((x,top),(x,bottom))
+    return bottom
+
+
+def write_synthetic_pdf(path:Path,n_pages:int,rng:random.Random,table_probability:float,link_probability:float):
+    import fitz  # PyMuPDF
+
+    company = rng.choice(COMPANIES)
+    with fitz.open() as pdf:
+        pdf.set_metadata({"title":f"{company} annual report","author":"bench_ingestion"})
+        for page_idx in range(n_pages):
+            page = pdf.new_page(width=PAGE_WIDTH,height=PAGE_HEIGHT)
+            top = MARGIN
+            page.insert_text((MARGIN,top),f"{company} - {rng.choice(SEGMENTS)} review, page {page_idx + 1}",fontsize=14)
+            top += 20
+            if rng.random() < table_probability:
+                top = _draw_table(page,rng,top) + 20
+            if rng.random() < link_probability:
+                url = f"https://investors.example.com/{company.split()[0].lower()}/{rng.randint(1000,9999)}"
+                page.insert_text((MARGIN,top + 10),f"Full filing: {url}",fontsize=9)
+                page.insert_link({"kind":fitz.LINK_URI,"from":fitz.Rect(MARGIN,top,PAGE_WIDTH - MARGIN,top + 14),"uri":url})
+                top += 20
+            paragraphs = ["\n".join(_sentence(rng) for _ in range(rng.randint(2,6))) for _ in range(rng.randint(2,5))]
+            page.insert_textbox(fitz.Rect(MARGIN,top,PAGE_WIDTH - MARGIN,PAGE_HEIGHT - MARGIN),"\n\n".join(paragraphs),fontsize=9)
+        pdf.save(str(path))
+
+
+def generate_corpus(input_dir:Path,n_docs:int,min_pages:int,max_pages:int,table_probability:float,link_probability:float,seed:int) -> dict:
+    rng = random.Random(seed)
+    input_dir.mkdir(parents=True,exist_ok=True)
+    n_pages = 0
+    for doc_idx in range(n_docs):
+        pages = rng.randint(min_pages,max_pages)
+        write_synthetic_pdf(input_dir/f"report_{doc_idx:04d}.pdf",pages,rng,table_probability,link_probability)
+        n_pages += pages
+    return {
+        "docs":n_docs,
+        "pages":n_pages,
+        "bytes":sum(fn.stat().st_size for fn in input_dir.glob("*.pdf")),
+        "seed":seed
+    }
+
+
+def configure_offline(workdir:Path,dimension:int):
+    """
+        Points every stateful component at the benchmark workdir and selects the offline embedder.
+        Must run before the pipeline modules create their singletons.
+    """
+    from common.vector_db_config import lexical_index_config,vector_db_config
+    from utils.config import embedding_cache_config,embedding_config,embedding_log_config
+
+    embedding_config['backend'] = "hashing"
+    embedding_config['dimension'] = dimension
+    embedding_cache_config['enabled'] = False
+    embedding_log_config['path'] = str(workdir/"embedded"/"embedding_wal.log")
+    lexical_index_config['path'] = str(workdir/"lexical_index")
+    vector_db_config['path'] = str(workdir/"vector_store")
+    vector_db_config['dimension'] = dimension
+
+
+def peak_rss_mb() -> dict:
+    return {
+        "self":round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,1),
+        "children":round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,1)
+    }
+
+
+def count_records(files:list[Path]) -> int:
+    from utils.utils import iter_records
+
+    return sum(1 for fn in files for _ in iter_records(fn))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git","rev-parse","--short","HEAD"],capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError,subprocess.CalledProcessError):
+        return None
+
+
+def timed_stage(name:str,fn,*args):
+    print(f"[bench] running {name}",file=sys.stderr)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        result = fn(*args)
+    return result,time.perf_counter() - start
+
+
+def run_benchmark(workdir:Path,corpus:dict) -> dict:
+    from agent.document_embedding import embed_documents_chunks
+    from agent.document_extraction import run_data_extraction
+    from agent.document_processing import run_data_processing
+    from agent.embedded_batch import load_batch_vectors
+
+    for stage_dir in ("extracted","processed","embedded","lexical_index","vector_store"):
+        shutil.rmtree(workdir/stage_dir,ignore_errors=True)
+    commit = git_commit()
+    input_files = sorted((workdir/"input").glob("*.pdf"))
+    extracted_files,extract_s = timed_stage("extraction",run_data_extraction,input_files,str(workdir/"extracted"))
+    extracted_files = [Path(fn) for fn in extracted_files]
+    rss_after_extraction = peak_rss_mb()
+    n_records = count_records(extracted_files)
+
+    processed_files,process_s = timed_stage("processing",run_data_processing,extracted_files,str(workdir/"processed"))
+    n_blocks = count_records([Path(fn) for fn in processed_files])
+
+    (embedded_files,_),embed_s = timed_stage("embedding",embed_documents_chunks,extracted_files,str(workdir/"embedded"))
+    n_chunks = sum(load_batch_vectors(fn).shape[0] for fn in embedded_files)
+
+    total_s = extract_s + process_s + embed_s
+    pages = corpus['pages']
+    return {
+        "commit":commit,
+        "corpus":corpus,
+        "stages":{
+            "extraction":{
+                "wall_s":round(extract_s,4),
+                "files":len(extracted_files),
+                "records":n_records,
+                "pages_per_sec":round(pages / extract_s,2) if extract_s else None,
+                "peak_rss_mb":rss_after_extraction
+            },
+            "processing":{
+                "wall_s":round(process_s,4),
+                "files":len(processed_files),
+                "blocks":n_blocks,
+                "records_per_sec":round(n_records / process_s,2) if process_s else None
+            },
+            "embedding":{
+                "wall_s":round(embed_s,4),
+                "batch_files":len(embedded_files),
+                "chunks":n_chunks,
+                "chunks_per_sec":round(n_chunks / embed_s,2) if embed_s else None
+            }
+        },
+        "total":{
+            "wall_s":round(total_s,4),
+            "pages_per_sec":round(pages / total_s,2) if total_s else None,
+            "chunks_per_sec":round(n_chunks / total_s,2) if total_s else None
+        },
+        "peak_rss_mb":peak_rss_mb()
+    }
+
+
+def compare(results:dict,baseline:dict) -> dict:
+    """
+        Wall time of this run relative to the baseline report, per stage and in total (below 1.0 is faster).
+    """
+    ratios = {}
+    for stage,stats in results['stages'].items():
+        before = baseline.get('stages',{}).get(stage,{}).get('wall_s')
+        ratios[stage] = round(stats['wall_s'] / before,3) if before else None
+    before = baseline.get('total',{}).get('wall_s')
+    ratios['total'] = round(results['total']['wall_s'] / before,3) if before else None
+    return {"baseline_commit":baseline.get('commit'),"same_corpus":baseline.get('corpus') == results['corpus'],"wall_s_ratio":ratios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--min-pages", type=int, default=2)
+    parser.add_argument("--max-pages", type=int, default=40)
+    parser.add_argument("--table-probability", type=float, default=0.3, help="Share of pages with a ruled table.")
+    parser.add_argument("--link-probability", type=float, default=0.2, help="Share of pages with a hyperlink.")
+    parser.add_argument("--dimension", type=int, default=768, help="Dimension of the hashing embedder.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, default=None, help="Directory for the corpus and stage outputs, a temporary one by default.")
+    parser.add_argument("--keep", action="store_true", help="Keep the workdir after the run.")
+    parser.add_argument("--output", type=Path, default=None, help="Also write the JSON report to this file.")
+    parser.add_argument("--baseline", type=Path, default=None, help="Earlier JSON report to compare wall times against.")
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="bench_ingestion_"))
+    try:
+        configure_offline(workdir,args.dimension)
+        print(f"[bench] generating {args.docs} PDFs in {workdir}",file=sys.stderr)
+        corpus = generate_corpus(workdir/"input",args.docs,args.min_pages,args.max_pages,args.table_probability,args.link_probability,args.seed)
+        results = run_benchmark(workdir,corpus)
+    finally:
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(workdir,ignore_errors=True)
+    if args.baseline is not None:
+        with open(args.baseline,"r",encoding="utf-8") as f:
+            results['comparison'] = compare(results,json.load(f))
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(report,encoding="utf-8")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+    Compares the legacy PyMuPDFLoader + pdfplumber extraction with the single-open page stream.
+    Each (mode, file) pair runs in a fresh process so peak RSS is not polluted by the previous run.
+
+    Usage (from src/rag_agent):
+        python -m benchmarks.bench_pdf_extraction storage/ --repeat 3
+"""
+import argparse
+import json
+import multiprocessing
+import re
+import resource
+import time
+from pathlib import Path
+
+
+def _legacy_records(filename:Path) -> int:
+    """
+        The extraction path partition_file used before the page stream: full PyMuPDFLoader load, a second pdfplumber pass for tables and a third walk for links.
+    """
+    import pdfplumber
+    from langchain.document_loaders import PyMuPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    docs = []
+    text_docs = PyMuPDFLoader(str(filename)).load()
+    for doc in text_docs:
+        for idx, chunk in enumerate(text_splitter.split_documents([doc])):
+            docs.append({"type": "text", "content": chunk.page_content, "page": doc.metadata.get("page"), "chunk_index": idx})
+    with pdfplumber.open(str(filename)) as pdf:
+        for page_num, page in enumerate(pdf.pages, start=1):
+            for table_idx, table in enumerate(page.extract_tables(), start=1):
+                header, *rows = table
+                docs.append({"type": "table", "content": [dict(zip(header, row)) for row in rows if row], "page": page_num, "chunk_index": table_idx})
+    for doc in text_docs:
+        links = re.findall(r'https?://\S+', doc.page_content)
+        if links:
+            docs.append({"type": "hyperlinks", "content": links, "page": doc.metadata.get("page"), "chunk_index": 0})
+    return len(docs)
+
+
+def _stream_records(filename:Path) -> int:
+    from agent.document_reader import iter_pdf_records
+    from agent.text_splitter import get_text_splitter
+
+    return sum(1 for _ in iter_pdf_records(filename,get_text_splitter()))
+
+
+MODES = {"legacy": _legacy_records, "stream": _stream_records}
+
+
+def _measure(mode:str,filename:str,queue):
+    """
+        Runs one extraction in the current (fresh) process and reports wall time and peak RSS.
+        The RSS after imports is reported separately so the per-mode working set can be read as the difference.
+    """
+    fn = MODES[mode]
+    if mode == "legacy":
+        import pdfplumber  # noqa: F401
+        from langchain.document_loaders import PyMuPDFLoader  # noqa: F401
+    else:
+        import agent.document_reader  # noqa: F401
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    n_records = fn(Path(filename))
+    wall = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "mode": mode,
+        "file": filename,
+        "records": n_records,
+        "wall_s": round(wall, 4),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "extraction_rss_mb": round((peak_kb - baseline_kb) / 1024, 1),
+    })
+
+
+def run_case(mode:str,filename:Path) -> dict:
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_measure, args=(mode, str(filename), queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", type=Path, help="PDF file or directory of PDFs.")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    files = sorted(args.path.glob("*.pdf")) if args.path.is_dir() else [args.path]
+    results = []
+    for filename in files:
+        for mode in args.modes:
+            runs = [run_case(mode, filename) for _ in range(args.repeat)]
+            best = min(runs, key=lambda r: r["wall_s"])
+            best["peak_rss_mb"] = max(r["peak_rss_mb"] for r in runs)
+            results.append(best)
+            print(f"{filename.name:<40} {mode:<8} {best['wall_s']:>8.3f}s {best['peak_rss_mb']:>8.1f} MB peak ({best['records']} records)")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
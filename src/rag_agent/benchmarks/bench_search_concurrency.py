@@ -0,0 +1,150 @@
+"""
+    Dense search throughput under concurrent requests, with and without the search coalescer.
+    A store of --rows random unit vectors is written to --workdir, then for every --concurrency level the same --queries
+    queries are issued from that many concurrent coroutines in two modes:
+        single    : every request runs its own store.search_rows call on the scoring thread pool (matrix-vector product)
+        coalesced : requests go through SearchCoalescer, which scores them in batches (matrix-matrix product, batched top-k)
+    Both modes use the same --workers scoring threads. The JSON report gives, per level and mode, queries/sec, queries per
+    CPU second (process user + system time, i.e. throughput per core), p50/p99 latency and, for coalesced, the mean batch size.
+
+    Usage (from src/rag_agent):
+        python -m benchmarks.bench_search_concurrency --rows 200000 --concurrency 1 8 32 128 --output bench_search.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+
+def build_store(path:Path,rows:int,dimension:int,seed:int):
+    from common.vector_db_connection import LocalVectorStore
+
+    store = LocalVectorStore(path=str(path),dimension=dimension)
+    rng = np.random.default_rng(seed)
+    block = 100000
+    for start in range(0,rows,block):
+        n = min(block,rows - start)
+        metadata = [
+            {"document_id":idx // 100,"document_name":f"doc_{idx // 100}","document_hash":f"{idx // 100:016x}","chunk_id":idx,"page_start":1,"page_end":1,"unique_id":f"bench_{idx}"}
+            for idx in range(start,start + n)
+        ]
+        store.append(rng.standard_normal((n,dimension),dtype=np.float32),metadata)
+    store.publish()
+    return store
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run_level(search,queries:np.ndarray,concurrency:int) -> tuple[list[float],float]:
+    """
+        Issues every query from `concurrency` coroutines pulling from a shared queue; returns (latencies, wall seconds).
+    """
+    next_query = iter(range(len(queries)))
+    latencies = []
+
+    async def client():
+        for idx in next_query:
+            start = time.perf_counter()
+            await search(queries[idx])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies,time.perf_counter() - start
+
+
+def summarize(latencies:list[float],wall_s:float,cpu_s:float) -> dict:
+    latencies = np.asarray(latencies)
+    return {
+        "wall_s":round(wall_s,4),
+        "qps":round(len(latencies) / wall_s,1),
+        "queries_per_cpu_s":round(len(latencies) / cpu_s,1) if cpu_s else None,
+        "p50_ms":round(float(np.percentile(latencies,50))*1000,3),
+        "p99_ms":round(float(np.percentile(latencies,99))*1000,3)
+    }
+
+
+async def run_benchmark(store,queries:np.ndarray,levels:list[int],k:int,workers:int,window_ms:float,max_batch:int) -> list[dict]:
+    from common.search_coalescer import SearchCoalescer
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    snapshot = store.refresh()
+    results = []
+    for concurrency in levels:
+        async def single(vector):
+            return await loop.run_in_executor(executor,store.search_rows,vector[None,:],k,snapshot)
+
+        coalescer = SearchCoalescer(store,window_ms=window_ms,max_batch=max_batch,workers=workers)
+
+        async def coalesced(vector):
+            return await coalescer.search(vector,k)
+
+        level = {"concurrency":concurrency}
+        for mode,search in (("single",single),("coalesced",coalesced)):
+            print(f"[bench] concurrency {concurrency}, {mode}",file=sys.stderr)
+            await run_level(search,queries[:min(len(queries),concurrency)],concurrency)
+            cpu_start = cpu_seconds()
+            latencies,wall_s = await run_level(search,queries,concurrency)
+            level[mode] = summarize(latencies,wall_s,cpu_seconds() - cpu_start)
+        level['coalesced'].update(coalescer.stats())
+        level['qps_ratio'] = round(level['coalesced']['qps'] / level['single']['qps'],2)
+        coalescer.shutdown()
+        results.append(level)
+    executor.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=50, help="Candidates per query, as hybrid_search requests them.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1,4,16,64,256])
+    parser.add_argument("--workers", type=int, default=2, help="Scoring threads, the same in both modes.")
+    parser.add_argument("--window-ms", type=float, default=2)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, default=None, help="Directory for the store, a temporary one by default.")
+    parser.add_argument("--output", type=Path, default=None, help="Also write the JSON report to this file.")
+    args = parser.parse_args()
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="bench_search_"))
+    try:
+        print(f"[bench] writing {args.rows} vectors to {workdir}",file=sys.stderr)
+        with contextlib.redirect_stdout(sys.stderr):
+            store = build_store(workdir/"vector_store",args.rows,args.dimension,args.seed)
+        queries = np.random.default_rng(args.seed + 1).standard_normal((args.queries,args.dimension),dtype=np.float32)
+        levels = asyncio.run(run_benchmark(store,queries,args.concurrency,args.k,args.workers,args.window_ms,args.max_batch))
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir,ignore_errors=True)
+    report = json.dumps({
+        "rows":args.rows,
+        "dimension":args.dimension,
+        "queries":args.queries,
+        "k":args.k,
+        "workers":args.workers,
+        "window_ms":args.window_ms,
+        "max_batch":args.max_batch,
+        "levels":levels
+    }, indent=2)
+    if args.output is not None:
+        args.output.write_text(report,encoding="utf-8")
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+    Checks FastTextSplitter against LangChain's RecursiveCharacterTextSplitter on a golden corpus and compares their speed.
+    The corpus is a set of seeded synthetic documents (paragraphs, single newlines, long unbroken tokens, whitespace runs),
+    plus the page texts of any PDFs passed with --pdf-dir. Every text must produce identical chunks; mismatches are reported
+    and make the script exit with status 1.
+
+    Usage (from src/rag_agent):
+        python -m benchmarks.bench_text_splitter --docs 200 --pdf-dir storage/
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+
+def _reference_splitter(chunk_size:int,chunk_overlap:int):
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size,chunk_overlap=chunk_overlap)
+
+
+def synthetic_corpus(n_docs:int,seed:int=0) -> list[str]:
+    rng = random.Random(seed)
+    vocab = ["revenue","NUSA","Cost_Center","plant","EBITDA","forecast","variance","segment","margin","capex","4010-200","quarter","the","of","and"]
+    docs = []
+    for _ in range(n_docs):
+        parts = []
+        for _ in range(rng.randint(1,80)):
+            kind = rng.random()
+            if kind < 0.05:
+                parts.append("x" * rng.randint(500,2500))
+            elif kind < 0.1:
+                parts.append(" " * rng.randint(1,6) + "\n" * rng.randint(1,4))
+            else:
+                parts.append(" ".join(rng.choice(vocab) for _ in range(rng.randint(3,300))))
+            parts.append(rng.choice(["\n\n","\n"," ","\n\n\n","  "]))
+        docs.append("".join(parts))
+    return docs
+
+
+def pdf_pages(pdf_dir:Path) -> list[str]:
+    import fitz  # PyMuPDF
+
+    pages = []
+    for fn in sorted(pdf_dir.glob("*.pdf")):
+        with fitz.open(str(fn)) as pdf:
+            pages.extend(page.get_text() for page in pdf)
+    return pages
+
+
+def timed(split,texts:list[str],repeat:int) -> tuple[float,list[list[str]]]:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [split(text) for text in texts]
+        best = min(best,time.perf_counter() - start)
+    return best,chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200, help="Synthetic documents in the golden corpus.")
+    parser.add_argument("--pdf-dir", type=Path, default=None, help="Optional directory of PDFs whose pages join the corpus.")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--large-doc-chars", type=int, default=2_000_000, help="Size of the single large document timed separately.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from agent.text_splitter import FastTextSplitter
+
+    texts = synthetic_corpus(args.docs)
+    if args.pdf_dir is not None:
+        texts.extend(pdf_pages(args.pdf_dir))
+    reference = _reference_splitter(args.chunk_size,args.chunk_overlap)
+    fast = FastTextSplitter(chunk_size=args.chunk_size,chunk_overlap=args.chunk_overlap)
+
+    ref_s,ref_chunks = timed(reference.split_text,texts,args.repeat)
+    fast_s,fast_chunks = timed(fast.split_text,texts,args.repeat)
+    mismatches = [idx for idx,(a,b) in enumerate(zip(ref_chunks,fast_chunks)) if a != b]
+
+    large = "\n\n".join(synthetic_corpus(10_000,seed=1))[:args.large_doc_chars]
+    large_ref_s,(large_ref,) = timed(reference.split_text,[large],1)
+    large_fast_s,(large_fast,) = timed(fast.split_text,[large],args.repeat)
+
+    results = {
+        "golden_texts":len(texts),
+        "golden_chunks":sum(len(c) for c in ref_chunks),
+        "mismatched_texts":len(mismatches),
+        "corpus_reference_s":round(ref_s,4),
+        "corpus_fast_s":round(fast_s,4),
+        "large_doc_chars":len(large),
+        "large_doc_identical":large_ref == large_fast,
+        "large_doc_reference_s":round(large_ref_s,4),
+        "large_doc_fast_s":round(large_fast_s,4),
+        "large_doc_speedup":round(large_ref_s / large_fast_s,2) if large_fast_s else None,
+    }
+    print(json.dumps(results, indent=2))
+    if mismatches or large_ref != large_fast:
+        print(f"Chunk boundaries differ for texts {mismatches[:10]}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
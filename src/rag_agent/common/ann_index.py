@@ -0,0 +1,243 @@
+import json
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Callable,Optional
+import numpy as np
+from common.vector_search import normalize_rows,sort_top_k
+
+
+def kmeans(data:np.ndarray,n_clusters:int,n_iter:int=20,spherical:bool=False,seed:int=0) -> np.ndarray:
+    """
+        Lloyd's k-means in NumPy.
+        With spherical=True points are assigned by inner product and centroids are re-normalised (cosine k-means),
+        otherwise squared L2 distance is used.
+        Returns:
+            np.ndarray : (n_clusters, dim) float32 centroids.
+    """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data,dtype=np.float32)
+    n_clusters = min(n_clusters,data.shape[0])
+    centroids = data[rng.choice(data.shape[0],n_clusters,replace=False)].copy()
+    for _ in range(n_iter):
+        assign = assign_clusters(data,centroids,spherical)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums,assign,data)
+        counts = np.bincount(assign,minlength=n_clusters)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty,None]
+        # Re-seed empty clusters on random points so every list stays usable.
+        if empty.any():
+            centroids[empty] = data[rng.choice(data.shape[0],int(empty.sum()),replace=False)]
+        if spherical:
+            centroids = normalize_rows(centroids)
+    return centroids
+
+
+def assign_clusters(data:np.ndarray,centroids:np.ndarray,spherical:bool,block_rows:int=65536) -> np.ndarray:
+    assign = np.empty(data.shape[0],dtype=np.int64)
+    c_norms = (centroids*centroids).sum(axis=1)
+    for start in range(0,data.shape[0],block_rows):
+        block = data[start:start+block_rows]
+        scores = block @ centroids.T
+        if spherical:
+            assign[start:start+block_rows] = scores.argmax(axis=1)
+        else:
+            assign[start:start+block_rows] = (c_norms[None,:] - 2*scores).argmin(axis=1)
+    return assign
+
+
+class IVFPQIndex(object):
+    """
+        Inverted-file index with product-quantised residuals (IVF-PQ) for approximate inner product search on normalised vectors.
+
+        The vectors are partitioned into n_lists cells by spherical k-means. Within a cell each vector is stored as the PQ code of its
+        residual to the cell centroid: pq_m sub-vectors, each replaced by the id of its nearest of 256 sub-centroids (one byte).
+        Because the PQ codebooks are shared by all cells, a query's score against a code is
+            q . centroid + sum_m lut[m, code_m]   with   lut[m, j] = q_m . codebook[m, j]
+        so one lookup table per query scores every probed cell with vectorised gathers.
+        pq_m=0 gives IVF-Flat: residual codes are replaced by the raw float16 vectors.
+
+        nprobe (cells visited per query) trades recall for latency. Passing a refine callable re-scores the best refine_factor*k
+        candidates with exact vectors. Vectors can be added after training (incremental inserts) and the index persists to disk.
+        Deleted rows are masked out of the probed cells (exclude) before the candidate cut; remap() follows a store compaction,
+        whose generation the index records.
+    """
+    def __init__(self,dimension:int,n_lists:int=1024,pq_m:int=16,nprobe:int=16,refine_factor:int=4):
+        if pq_m and dimension % pq_m:
+            raise ValueError(f"pq_m={pq_m} must divide the dimension {dimension}.")
+        self.dimension = dimension
+        self.n_lists = n_lists
+        self.pq_m = pq_m
+        self.nprobe = nprobe
+        self.refine_factor = refine_factor
+        self.centroids = None
+        self.codebooks = None
+        self.n_indexed = 0
+        self.generation = 0
+        self._list_codes = []
+        self._list_rows = []
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self,sample:np.ndarray,n_iter:int=20,seed:int=0):
+        """
+            Learns the coarse centroids and, for IVF-PQ, the residual codebooks from a representative sample.
+        """
+        sample = normalize_rows(sample)
+        self.centroids = kmeans(sample,self.n_lists,n_iter=n_iter,spherical=True,seed=seed)
+        self.n_lists = self.centroids.shape[0]
+        if self.pq_m:
+            residuals = sample - self.centroids[assign_clusters(sample,self.centroids,True)]
+            sub_dim = self.dimension // self.pq_m
+            self.codebooks = np.stack([
+                kmeans(residuals[:,m*sub_dim:(m+1)*sub_dim],256,n_iter=n_iter,seed=seed+m)
+                for m in range(self.pq_m)
+            ])
+        width = self.pq_m or self.dimension
+        dtype = np.uint8 if self.pq_m else np.float16
+        self._list_codes = [np.empty((0,width),dtype=dtype) for _ in range(self.n_lists)]
+        self._list_rows = [np.empty(0,dtype=np.int64) for _ in range(self.n_lists)]
+
+    def _encode(self,residuals:np.ndarray) -> np.ndarray:
+        sub_dim = self.dimension // self.pq_m
+        codes = np.empty((residuals.shape[0],self.pq_m),dtype=np.uint8)
+        for m in range(self.pq_m):
+            codes[:,m] = assign_clusters(residuals[:,m*sub_dim:(m+1)*sub_dim],self.codebooks[m],False)
+        return codes
+
+    def add(self,vectors:np.ndarray,rows:np.ndarray):
+        """
+            Inserts vectors under the given row ids. Can be called any number of times after train().
+        """
+        if not self.is_trained:
+            raise RuntimeError("The index must be trained before vectors are added.")
+        vectors = normalize_rows(vectors)
+        rows = np.asarray(rows,dtype=np.int64)
+        assign = assign_clusters(vectors,self.centroids,True)
+        codes = self._encode(vectors - self.centroids[assign]) if self.pq_m else vectors.astype(np.float16)
+        order = np.argsort(assign,kind="stable")
+        bounds = np.searchsorted(assign[order],np.arange(self.n_lists+1))
+        for lst in np.unique(assign):
+            sel = order[bounds[lst]:bounds[lst+1]]
+            self._list_codes[lst] = np.concatenate([self._list_codes[lst],codes[sel]])
+            self._list_rows[lst] = np.concatenate([self._list_rows[lst],rows[sel]])
+        self.n_indexed += len(rows)
+
+    def remap(self,mapping:np.ndarray):
+        """
+            Renumbers the indexed rows after a store compaction: mapping[old row] is the new row, -1 for a dropped row.
+            Rows are renumbered in order, so the indexed prefix of the store stays a prefix.
+        """
+        for lst in range(self.n_lists):
+            rows = mapping[self._list_rows[lst]]
+            keep = rows >= 0
+            self._list_codes[lst] = self._list_codes[lst][keep]
+            self._list_rows[lst] = rows[keep]
+        self.n_indexed = int((mapping[:self.n_indexed] >= 0).sum())
+
+    def _search_one(self,query:np.ndarray,k:int,nprobe:int,exclude:Optional[np.ndarray]=None):
+        coarse = self.centroids @ query
+        probe = np.argpartition(-coarse,min(nprobe,self.n_lists)-1)[:nprobe]
+        codes = [self._list_codes[lst] for lst in probe]
+        rows = np.concatenate([self._list_rows[lst] for lst in probe])
+        if rows.size == 0:
+            return np.empty(0,dtype=np.float32),rows
+        base = np.repeat(coarse[probe],[len(c) for c in codes])
+        codes = np.concatenate(codes)
+        if exclude is not None and exclude.size:
+            keep = ~np.isin(rows,exclude)
+            rows,base,codes = rows[keep],base[keep],codes[keep]
+            if rows.size == 0:
+                return np.empty(0,dtype=np.float32),rows
+        if self.pq_m:
+            sub_dim = self.dimension // self.pq_m
+            lut = np.einsum('md,mjd->mj',query.reshape(self.pq_m,sub_dim),self.codebooks)
+            scores = base + lut[np.arange(self.pq_m),codes].sum(axis=1)
+        else:
+            scores = codes.astype(np.float32) @ query
+        kk = min(k,scores.size)
+        top = np.argpartition(-scores,kk-1)[:kk]
+        return scores[top].astype(np.float32),rows[top]
+
+    def search(self,queries:np.ndarray,k:int,nprobe:Optional[int]=None,refine:Optional[Callable]=None,exclude:Optional[np.ndarray]=None):
+        """
+            Approximate top-k inner product search.
+            Args:
+                queries(np.ndarray) : (n_queries, dimension) or (dimension,) query embeddings.
+                k(int) : Results per query.
+                nprobe(int) : Cells probed per query, defaults to self.nprobe.
+                refine(Callable) : Optional rows -> exact vectors lookup used to re-rank refine_factor*k candidates.
+                exclude(np.ndarray) : Optional rows never returned (e.g. tombstoned ones), dropped before the candidate cut.
+            Returns:
+                tuple[np.ndarray,np.ndarray] : (scores, rows) sorted by descending score, padded with -inf / -1.
+        """
+        queries = normalize_rows(queries)
+        nprobe = nprobe or self.nprobe
+        n_candidates = k * self.refine_factor if refine is not None else k
+        out_scores = np.full((queries.shape[0],k),-np.inf,dtype=np.float32)
+        out_rows = np.full((queries.shape[0],k),-1,dtype=np.int64)
+        for qi,query in enumerate(queries):
+            scores,rows = self._search_one(query,n_candidates,nprobe,exclude)
+            if refine is not None and rows.size:
+                scores = refine(rows) @ query
+            scores,rows = sort_top_k(scores[None,:],rows[None,:])
+            out_scores[qi,:min(k,rows.shape[1])] = scores[0,:k]
+            out_rows[qi,:min(k,rows.shape[1])] = rows[0,:k]
+        return out_scores,out_rows
+
+    def save(self,path:str):
+        """
+            Persists the index in a fresh directory and atomically repoints path/CURRENT to it, then removes older copies.
+        """
+        root = Path(path)
+        root.mkdir(parents=True,exist_ok=True)
+        name = f"index_{self.n_indexed}_{uuid.uuid4().hex[:8]}"
+        tmp_dir = root/f".tmp_{name}"
+        tmp_dir.mkdir()
+        lengths = np.array([len(r) for r in self._list_rows],dtype=np.int64)
+        np.save(tmp_dir/"centroids.npy",self.centroids)
+        if self.pq_m:
+            np.save(tmp_dir/"codebooks.npy",self.codebooks)
+        np.save(tmp_dir/"list_offsets.npy",np.concatenate([[0],np.cumsum(lengths)]))
+        np.save(tmp_dir/"codes.npy",np.concatenate(self._list_codes))
+        np.save(tmp_dir/"rows.npy",np.concatenate(self._list_rows))
+        with open(tmp_dir/"meta.json","w",encoding="utf-8") as f:
+            json.dump({
+                "dimension":self.dimension,"n_lists":self.n_lists,"pq_m":self.pq_m,
+                "nprobe":self.nprobe,"refine_factor":self.refine_factor,"n_indexed":self.n_indexed,"generation":self.generation
+            },f)
+        os.rename(tmp_dir,root/name)
+        tmp_pointer = root/"CURRENT.tmp"
+        tmp_pointer.write_text(name,encoding="utf-8")
+        os.replace(tmp_pointer,root/"CURRENT")
+        for old in root.glob("index_*"):
+            if old.name != name:
+                shutil.rmtree(old,ignore_errors=True)
+
+    @classmethod
+    def load(cls,path:str) -> Optional["IVFPQIndex"]:
+        """
+            Loads the index path/CURRENT points to, or returns None if no index was saved there.
+        """
+        root = Path(path)
+        if not (root/"CURRENT").exists():
+            return None
+        index_dir = root/(root/"CURRENT").read_text(encoding="utf-8").strip()
+        with open(index_dir/"meta.json","r",encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(meta['dimension'],meta['n_lists'],meta['pq_m'],meta['nprobe'],meta['refine_factor'])
+        index.centroids = np.load(index_dir/"centroids.npy")
+        if index.pq_m:
+            index.codebooks = np.load(index_dir/"codebooks.npy")
+        offsets = np.load(index_dir/"list_offsets.npy")
+        codes = np.load(index_dir/"codes.npy")
+        rows = np.load(index_dir/"rows.npy")
+        index._list_codes = [codes[offsets[i]:offsets[i+1]] for i in range(index.n_lists)]
+        index._list_rows = [rows[offsets[i]:offsets[i+1]] for i in range(index.n_lists)]
+        index.n_indexed = meta['n_indexed']
+        index.generation = meta.get('generation',0)
+        return index
@@ -0,0 +1,146 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from utils.config import embedding_cache_config
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+CREATE_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    cache_key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    last_access INTEGER NOT NULL
+)
+"""
+CREATE_ACCESS_INDEX = "CREATE INDEX IF NOT EXISTS idx_embedding_cache_access ON embedding_cache (last_access)"
+
+
+def normalize_text(text:str) -> str:
+    """
+        Collapses runs of whitespace so the same text extracted with different line wrapping shares a cache entry.
+    """
+    return WHITESPACE_PATTERN.sub(" ",text).strip()
+
+
+def cache_key(model_name:str,text:str) -> str:
+    return hashlib.sha256(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(object):
+    """
+        Persistent, content addressed cache of embeddings keyed by (model name, normalised text hash).
+        Entries live in a local SQLite file as raw float32 blobs. The cache holds at most max_entries vectors and evicts the
+        least recently used ones once the cap is exceeded. Hit and miss counters are kept per instance.
+        The entry count is read once when the cache opens and then kept up to date by put_many, so inserts never scan the table;
+        entries written by another process in the meantime are only counted when the cache is reopened.
+        The connection is shared between threads behind a lock, so concurrent embedding workers can use one cache.
+    """
+    def __init__(self,path:str,max_entries:int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True,exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path),check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(CREATE_CACHE_TABLE)
+        self.conn.execute(CREATE_ACCESS_INDEX)
+        self.conn.commit()
+        self.n_entries = self.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+
+    def get_many(self,model_name:str,texts:list[str]) -> list[Optional[np.ndarray]]:
+        """
+            Looks up the embeddings of texts, returning None in the positions that are not cached.
+            Hits have their last access time refreshed for LRU eviction.
+        """
+        keys = [cache_key(model_name,text) for text in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(dict.fromkeys(keys))
+            for start in range(0,len(unique_keys),500):
+                chunk = unique_keys[start:start+500]
+                placeholders = ",".join("?"*len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT cache_key,vector FROM embedding_cache WHERE cache_key IN ({placeholders})",chunk
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time_ns()
+                self.conn.executemany(
+                    "UPDATE embedding_cache SET last_access=? WHERE cache_key=?",
+                    [(now,key) for key in found]
+                )
+                self.conn.commit()
+            n_hits = sum(key in found for key in keys)
+            self.hits += n_hits
+            self.misses += len(keys) - n_hits
+        return [
+            np.frombuffer(found[key],dtype=np.float32) if key in found else None
+            for key in keys
+        ]
+
+    def put_many(self,model_name:str,texts:list[str],vectors:np.ndarray):
+        """
+            Stores freshly computed embeddings and evicts the least recently used entries above max_entries.
+            Keys are content addressed, so a key already cached holds the same vector and only has its last access refreshed.
+        """
+        now = time.time_ns()
+        rows = [
+            (cache_key(model_name,text),model_name,np.asarray(vector,dtype=np.float32).tobytes(),now)
+            for text,vector in zip(texts,vectors)
+        ]
+        with self._lock:
+            n_new = self.conn.executemany(
+                "INSERT OR IGNORE INTO embedding_cache (cache_key,model,vector,last_access) VALUES (?,?,?,?)",rows
+            ).rowcount
+            if n_new < len(rows):
+                self.conn.executemany("UPDATE embedding_cache SET last_access=? WHERE cache_key=?",[(now,row[0]) for row in rows])
+            self.n_entries += n_new
+            overflow = self.n_entries - self.max_entries
+            if overflow > 0:
+                n_evicted = self.conn.execute(
+                    "DELETE FROM embedding_cache WHERE cache_key IN "
+                    "(SELECT cache_key FROM embedding_cache ORDER BY last_access ASC LIMIT ?)",(overflow,)
+                ).rowcount
+                self.n_entries -= n_evicted
+                self.evictions += n_evicted
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": self.n_entries,
+            "hit_rate": round(self.hits / total,4) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+        Returns the process wide embedding cache, or None when embedding_cache_config['enabled'] is off.
+    """
+    global _embedding_cache
+    if not embedding_cache_config['enabled']:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(embedding_cache_config['path'],embedding_cache_config['max_entries'])
+    return _embedding_cache
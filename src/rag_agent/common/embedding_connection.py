@@ -0,0 +1,158 @@
+import os
+import re
+import threading
+import zlib
+import numpy as np
+from utils.config import embedding_config
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+
+
+class BaseEmbedder(object):
+    """
+        Interface shared by the embedding backends.
+        Backends turn a list of texts into a float32 matrix of shape (len(texts), dimension), one row per text, in input order.
+    """
+    model_name = None
+    dimension = None
+
+    def __init__(self,batch_size:int,num_threads:int):
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+
+    def embed(self,texts:list[str]) -> np.ndarray:
+        """
+            Embeds a single batch of texts.
+        """
+        raise NotImplementedError
+
+    def embed_all(self,texts:list[str]) -> np.ndarray:
+        """
+            Embeds any number of texts, split into batches of self.batch_size.
+        """
+        if not texts:
+            return np.zeros((0,self.dimension),dtype=np.float32)
+        blocks = [
+            self.embed(texts[start:start+self.batch_size])
+            for start in range(0,len(texts),self.batch_size)
+        ]
+        return np.vstack(blocks)
+
+
+class NomicEmbedder(BaseEmbedder):
+    """
+        Remote embeddings through the Nomic Atlas API (needs network access and NOMIC_API_KEY).
+    """
+    def __init__(self,model_name:str,dimension:int,batch_size:int,num_threads:int):
+        super().__init__(batch_size,num_threads)
+        from nomic import embed
+        self._embed = embed
+        self.model_name = model_name
+        self.dimension = dimension
+
+    def embed(self,texts:list[str]) -> np.ndarray:
+        response = self._embed.text(
+            texts=texts,
+            model=self.model_name,
+            task_type='embedding',
+        )
+        return np.asarray(response['embeddings'],dtype=np.float32)
+
+
+class SentenceTransformerEmbedder(BaseEmbedder):
+    """
+        Local CPU embeddings with a sentence-transformers model loaded from disk or the local HF cache.
+        The torch thread pool is pinned to num_threads so several ingestion workers do not oversubscribe the cores.
+    """
+    def __init__(self,model_name:str,dimension:int,batch_size:int,num_threads:int):
+        super().__init__(batch_size,num_threads)
+        import torch
+        from sentence_transformers import SentenceTransformer
+        torch.set_num_threads(num_threads)
+        self.model = SentenceTransformer(model_name,device="cpu")
+        self.model_name = model_name
+        self.dimension = self.model.get_sentence_embedding_dimension() or dimension
+
+    def embed(self,texts:list[str]) -> np.ndarray:
+        embeddings = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+        return embeddings.astype(np.float32,copy=False)
+
+
+class HashingEmbedder(BaseEmbedder):
+    """
+        Deterministic offline embedder based on signed feature hashing of word unigrams and bigrams.
+        No model or network is needed, which makes it suitable for air-gapped runs, tests and benchmarks.
+        Vectors are L2 normalised so cosine similarity reduces to a dot product.
+    """
+    def __init__(self,dimension:int,batch_size:int,num_threads:int):
+        super().__init__(batch_size,num_threads)
+        self.dimension = dimension
+        self.model_name = f"hashing-{dimension}"
+
+    def _features(self,text:str) -> list[int]:
+        tokens = TOKEN_PATTERN.findall(text.lower())
+        grams = tokens + [f"{a} {b}" for a,b in zip(tokens,tokens[1:])]
+        return [zlib.crc32(gram.encode("utf-8")) for gram in grams]
+
+    def embed(self,texts:list[str]) -> np.ndarray:
+        rows, hashes = [], []
+        for row,text in enumerate(texts):
+            features = self._features(text)
+            rows.extend([row]*len(features))
+            hashes.extend(features)
+        hashes = np.asarray(hashes,dtype=np.uint32)
+        cols = (hashes % self.dimension).astype(np.int64)
+        signs = np.where((hashes >> 31) & 1,-1.0,1.0).astype(np.float32)
+        matrix = np.zeros((len(texts),self.dimension),dtype=np.float32)
+        np.add.at(matrix,(np.asarray(rows,dtype=np.int64),cols),signs)
+        norms = np.linalg.norm(matrix,axis=1,keepdims=True)
+        return matrix / np.maximum(norms,1e-12)
+
+
+EMBEDDER_BACKENDS = {
+    "nomic": NomicEmbedder,
+    "sentence_transformer": SentenceTransformerEmbedder,
+    "hashing": HashingEmbedder,
+}
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def create_embedder(config:dict=None) -> BaseEmbedder:
+    """
+        Builds the embedding backend named by config['backend'].
+        The batch size can be overridden with the BATCH_SIZE environment variable.
+        Args:
+            config(dict) : Embedding configuration, defaults to utils.config.embedding_config.
+        Returns:
+            BaseEmbedder : The configured backend.
+        Raises:
+            ValueError : If the backend name is unknown.
+    """
+    config = config or embedding_config
+    backend = config['backend']
+    if backend not in EMBEDDER_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {list(EMBEDDER_BACKENDS)}.")
+    batch_size = int(os.getenv("BATCH_SIZE",config['batch_size']))
+    num_threads = int(config['num_threads'])
+    if backend == "hashing":
+        return HashingEmbedder(config['dimension'],batch_size,num_threads)
+    return EMBEDDER_BACKENDS[backend](config['model'],config['dimension'],batch_size,num_threads)
+
+
+def get_embedder() -> BaseEmbedder:
+    """
+        Returns the process wide embedder, created on first use from embedding_config.
+    """
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = create_embedder()
+    return _embedder
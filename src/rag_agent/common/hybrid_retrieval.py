@@ -0,0 +1,220 @@
+import asyncio
+from typing import Optional
+import numpy as np
+from common.embedding_connection import get_embedder
+from common.lexical_index import InvertedIndex,get_lexical_index
+from common.metadata_index import filter_rows,filtered_search_rows,get_document_sessions,get_duplicate_aliases
+from common.query_cache import QueryCache,get_query_cache
+from common.search_coalescer import SearchCoalescer,get_search_coalescer
+from common.vector_db_config import hybrid_search_config,metadata_filter_config,search_coalescer_config
+from common.vector_db_connection import LocalVectorStore,Snapshot,get_vector_store
+
+
+def reciprocal_rank_fusion(rankings:dict[str,list[str]],rrf_k:int=None,weights:dict[str,float]=None) -> list[tuple[str,float]]:
+    """
+        Fuses ranked key lists with reciprocal-rank fusion: score(key) = sum over rankings of weight / (rrf_k + rank), rank from 1.
+        Only ranks are used, so BM25 and cosine scores never need to be put on a common scale.
+        Args:
+            rankings(dict[str,list[str]]) : Retriever name -> keys ordered best first.
+            rrf_k(int) : Fusion constant, defaults to hybrid_search_config['rrf_k'].
+            weights(dict[str,float]) : Retriever name -> weight, missing names weigh 1.
+        Returns:
+            list[tuple[str,float]] : (key, fused score) ordered best first.
+    """
+    rrf_k = rrf_k if rrf_k is not None else hybrid_search_config['rrf_k']
+    weights = weights or {}
+    fused = {}
+    for name,keys in rankings.items():
+        weight = weights.get(name,1.0)
+        for rank,key in enumerate(keys,start=1):
+            fused[key] = fused.get(key,0.0) + weight / (rrf_k + rank)
+    return sorted(fused.items(),key=lambda item:item[1],reverse=True)
+
+
+def hybrid_search(query_text:str,query_vector:Optional[np.ndarray]=None,k:int=5,
+                  store:LocalVectorStore=None,lexical_index:InvertedIndex=None,candidates:int=None,snapshot:Snapshot=None,
+                  filters:Optional[dict]=None) -> list[dict]:
+    """
+        Lexical (BM25) + dense retrieval fused with reciprocal-rank fusion.
+        Each retriever returns its top candidates; results are joined on the chunk unique_id, so exact tokens such as
+        tickers, GL accounts or cost-center codes surface even when the embedding does not rank them.
+        Args:
+            query_text(str) : The user query, tokenised for BM25.
+            query_vector(np.ndarray) : Query embedding, computed with the configured embedder when not given.
+            k(int) : Number of fused results.
+            store(LocalVectorStore) : Dense store, defaults to get_vector_store().
+            lexical_index(InvertedIndex) : BM25 index, defaults to get_lexical_index().
+            candidates(int) : Results taken from each retriever, defaults to hybrid_search_config['candidates'].
+            snapshot(Snapshot) : Store snapshot to search, defaults to the latest published one.
+            filters(dict) : Metadata filters (see metadata_index.resolve_filters); both retrievers only score the matching rows.
+        Returns:
+            list[dict] : Chunk metadata with rrf_score, dense_score / dense_rank and bm25_score / lexical_rank (None when a
+                         retriever did not return the chunk), ordered best first.
+    """
+    store = get_vector_store() if store is None else store
+    lexical_index = get_lexical_index() if lexical_index is None else lexical_index
+    candidates = max(k,candidates or hybrid_search_config['candidates'])
+    if query_vector is None:
+        query_vector = get_embedder().embed([query_text])[0]
+
+    snapshot = store.refresh() if snapshot is None else snapshot
+    if filters:
+        allowed_rows = filter_rows(snapshot,filters)
+        dense_scores,dense_rows = filtered_search_rows(store,query_vector,candidates,allowed_rows,snapshot)
+        return fuse_dense_and_lexical(query_text,dense_scores,dense_rows,snapshot,k,lexical_index,candidates,allowed_rows)
+    dense_scores,dense_rows = store.search_rows(np.asarray(query_vector,dtype=np.float32)[None,:],candidates,snapshot)
+    return fuse_dense_and_lexical(query_text,dense_scores[0],dense_rows[0],snapshot,k,lexical_index,candidates)
+
+
+def fuse_dense_and_lexical(query_text:str,dense_scores:np.ndarray,dense_rows:np.ndarray,snapshot:Snapshot,k:int,
+                           lexical_index:InvertedIndex,candidates:int,allowed_rows:Optional[np.ndarray]=None) -> list[dict]:
+    """
+        Fusion half of hybrid_search: joins one query's dense candidates (rows of snapshot, -1 padded) with its BM25 candidates.
+        Split out so callers that score the dense side elsewhere (the search coalescer) share the fusion.
+        With allowed_rows (sorted rows of a metadata filter) BM25 is restricted to them: directly when they are few, otherwise
+        by taking lexical_oversample times more BM25 candidates and keeping the allowed ones.
+    """
+    found = dense_rows >= 0
+    dense_rows,dense_scores = dense_rows[found],dense_scores[found]
+    dense_hits = snapshot.row_metadata(dense_rows)
+    for hit,score,row in zip(dense_hits,dense_scores,dense_rows):
+        hit.update({"dense_score":float(score),"row":int(row)})
+    dense = {hit['unique_id']:hit for hit in dense_hits}
+
+    # Lexical hits outside the published snapshot (not upserted yet) cannot be returned with their metadata.
+    if allowed_rows is None:
+        lexical = lexical_index.search(query_text,candidates)
+    elif allowed_rows.size <= metadata_filter_config['brute_force_max_rows']:
+        lexical = lexical_index.search(query_text,candidates,allowed_keys=snapshot.column_values("unique_id",allowed_rows))
+    else:
+        lexical = lexical_index.search(query_text,candidates * metadata_filter_config['lexical_oversample'])
+    lexical_rows = snapshot.find_rows([key for key,_ in lexical])
+    if allowed_rows is not None:
+        lexical_rows = np.where(np.isin(lexical_rows,allowed_rows,assume_unique=True),lexical_rows,-1)
+    lexical = [(key,score,int(row)) for (key,score),row in zip(lexical,lexical_rows) if row >= 0][:candidates]
+
+    fused = reciprocal_rank_fusion(
+        {"dense":list(dense),"lexical":[key for key,_,_ in lexical]},
+        weights=hybrid_search_config['weights']
+    )[:k]
+    lexical_by_key = {key:(rank,score,row) for rank,(key,score,row) in enumerate(lexical,start=1)}
+    dense_rank = {key:rank for rank,key in enumerate(dense,start=1)}
+    missing = [key for key,_ in fused if key not in dense]
+    for key,hit in zip(missing,snapshot.row_metadata([lexical_by_key[key][2] for key in missing])):
+        hit.update({"dense_score":None,"row":lexical_by_key[key][2]})
+        dense[key] = hit
+
+    results = []
+    for key,rrf_score in fused:
+        hit = dict(dense[key])
+        lexical_hit = lexical_by_key.get(key)
+        hit.update({
+            "rrf_score":rrf_score,
+            "dense_rank":dense_rank.get(key),
+            "lexical_rank":lexical_hit[0] if lexical_hit else None,
+            "bm25_score":lexical_hit[1] if lexical_hit else None
+        })
+        results.append(hit)
+    return results
+
+
+SCORE_FIELDS = ("rrf_score","dense_score","dense_rank","lexical_rank","bm25_score","row")
+
+
+def _query_vector(query_text:str,cache:Optional[QueryCache]) -> np.ndarray:
+    embedder = get_embedder()
+    if cache is None:
+        return embedder.embed([query_text])[0]
+    return cache.query_embedding(query_text,embedder.model_name,lambda text:embedder.embed([text])[0])
+
+
+def _cache_version(snapshot:Snapshot,filters:Optional[dict]):
+    # Filters also depend on the duplicate aliases and, for session filters, on the session -> documents map,
+    # which both change without a new snapshot.
+    if not filters:
+        return snapshot.version
+    aliases = get_duplicate_aliases()
+    aliases.refresh()
+    if "session_id" in filters:
+        sessions = get_document_sessions()
+        sessions.refresh()
+        return (snapshot.version,aliases.version,sessions.version)
+    return (snapshot.version,aliases.version)
+
+
+def _cached_hits(cache:Optional[QueryCache],query_vector:np.ndarray,k:int,filters:Optional[dict],snapshot:Snapshot) -> Optional[list[dict]]:
+    if cache is None:
+        return None
+    cached = cache.get_results(query_vector,k,filters,_cache_version(snapshot,filters))
+    if cached is None:
+        return None
+    hits = snapshot.row_metadata([hit['row'] for hit in cached])
+    for hit,scores in zip(hits,cached):
+        hit.update(scores)
+    return hits
+
+
+def _cache_hits(cache:Optional[QueryCache],query_vector:np.ndarray,k:int,filters:Optional[dict],snapshot:Snapshot,hits:list[dict]) -> list[dict]:
+    if cache is not None:
+        cache.put_results(query_vector,k,filters,_cache_version(snapshot,filters),[{field:hit[field] for field in SCORE_FIELDS} for hit in hits])
+    return hits
+
+
+def search_documents(query_text:str,k:int=None,filters:Optional[dict]=None,store:LocalVectorStore=None,
+                     lexical_index:InvertedIndex=None,cache:QueryCache=None) -> list[dict]:
+    """
+        Hybrid search behind the query cache, the retrieval entry point of process_document_search.
+        The query embedding is looked up by model and normalized query text, and the fused top-k by
+        (query embedding, k, filters, snapshot version); a miss on either level falls through to the embedder / hybrid_search.
+        Filters are resolved to candidate rows from the metadata posting indexes before any scoring (see hybrid_search).
+        Args:
+            query_text(str) : The user query.
+            k(int) : Number of results, defaults to hybrid_search_config['top_k'].
+            filters(dict) : Metadata field -> value or list of values, page_range -> [first, last], session_id -> session(s).
+            store(LocalVectorStore) : Dense store, defaults to get_vector_store().
+            lexical_index(InvertedIndex) : BM25 index, defaults to get_lexical_index().
+            cache(QueryCache) : Defaults to get_query_cache(); searches uncached when caching is disabled.
+        Returns:
+            list[dict] : Same hits as hybrid_search, ordered best first.
+    """
+    k = k or hybrid_search_config['top_k']
+    store = get_vector_store() if store is None else store
+    cache = get_query_cache() if cache is None else cache
+    query_vector = _query_vector(query_text,cache)
+    snapshot = store.refresh()
+    hits = _cached_hits(cache,query_vector,k,filters,snapshot)
+    if hits is not None:
+        return hits
+    hits = hybrid_search(query_text,query_vector,k=k,store=store,lexical_index=lexical_index,snapshot=snapshot,filters=filters)
+    return _cache_hits(cache,query_vector,k,filters,snapshot,hits)
+
+
+async def search_documents_async(query_text:str,k:int=None,filters:Optional[dict]=None,lexical_index:InvertedIndex=None,
+                                 cache:QueryCache=None,coalescer:SearchCoalescer=None) -> list[dict]:
+    """
+        search_documents for the event loop: the dense search goes through the search coalescer, so concurrent requests are
+        scored as one batch, and the embedding and fusion steps run in worker threads. Filtered searches score only their
+        candidate rows and run in a worker thread outside the coalescer.
+        Falls back to search_documents in a thread when search_coalescer_config['enabled'] is off.
+        Args:
+            coalescer(SearchCoalescer) : Defaults to get_search_coalescer(); its store is the one searched.
+            (other arguments as in search_documents)
+    """
+    if not search_coalescer_config['enabled'] and coalescer is None:
+        return await asyncio.to_thread(search_documents,query_text,k,filters,None,lexical_index,cache)
+    k = k or hybrid_search_config['top_k']
+    coalescer = get_search_coalescer() if coalescer is None else coalescer
+    cache = get_query_cache() if cache is None else cache
+    lexical_index = get_lexical_index() if lexical_index is None else lexical_index
+    query_vector = await asyncio.to_thread(_query_vector,query_text,cache)
+    snapshot = coalescer.store.refresh()
+    hits = _cached_hits(cache,query_vector,k,filters,snapshot)
+    if hits is not None:
+        return hits
+    if filters:
+        hits = await asyncio.to_thread(hybrid_search,query_text,query_vector,k,coalescer.store,lexical_index,None,snapshot,filters)
+        return _cache_hits(cache,query_vector,k,filters,snapshot,hits)
+    candidates = max(k,hybrid_search_config['candidates'])
+    dense_scores,dense_rows,snapshot = await coalescer.search(query_vector,candidates)
+    hits = await asyncio.to_thread(fuse_dense_and_lexical,query_text,dense_scores,dense_rows,snapshot,k,lexical_index,candidates)
+    return _cache_hits(cache,query_vector,k,filters,snapshot,hits)
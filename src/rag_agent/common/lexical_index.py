@@ -0,0 +1,231 @@
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Iterable,Optional
+import numpy as np
+from common.vector_db_config import lexical_index_config
+
+# Keeps identifiers such as tickers, GL account numbers and cost-center codes (NUSA, Cost_Center, 4010-200) as single tokens.
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[_\-./][a-z0-9]+)*")
+SUBTOKEN_PATTERN = re.compile(r"[_\-./]")
+
+
+def tokenize(text:str) -> list[str]:
+    """
+        Lower-cases and tokenises text for BM25.
+        Compound identifiers are kept whole and also split into their parts, so 'Cost_Center' matches both 'cost_center' and 'center'.
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = SUBTOKEN_PATTERN.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class InvertedIndex(object):
+    """
+        Compact BM25 inverted index: term -> postings of (document number, term frequency).
+
+        Documents are identified externally by a string key (the chunk unique_id) and internally by their insertion number.
+        Postings grow incrementally: add_documents() appends per-term blocks that are concatenated into contiguous int32 arrays
+        on the next search. remove() tombstones documents. Scoring is vectorised per query term over the posting arrays.
+
+        On disk (path/CURRENT points to the live copy):
+            terms.json, term_offsets.npy, post_docs.npy, post_tfs.npy, doc_lengths.npy, doc_keys.npy, deleted.npy
+    """
+    def __init__(self,k1:float=None,b:float=None):
+        self.k1 = k1 if k1 is not None else lexical_index_config['k1']
+        self.b = b if b is not None else lexical_index_config['b']
+        self.vocab = {}
+        self._post_docs = []
+        self._post_tfs = []
+        self._pending_docs = []
+        self._pending_tfs = []
+        self.doc_lengths = np.empty(0,dtype=np.int32)
+        self.doc_keys = []
+        self.deleted = np.empty(0,dtype=bool)
+        self._key_to_doc = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return int(len(self.doc_keys) - self.deleted.sum())
+
+    def add_documents(self,keys:list[str],texts:list[str]):
+        """
+            Indexes new documents. A key that is already indexed is skipped, which keeps re-runs idempotent;
+            a removed key is restored (keys are content derived, so its postings are still right).
+        """
+        with self._lock:
+            new_lengths = []
+            per_term = {}
+            for key,text in zip(keys,texts):
+                if key in self._key_to_doc:
+                    self.deleted[self._key_to_doc[key]] = False
+                    continue
+                doc = len(self.doc_keys)
+                self.doc_keys.append(key)
+                self._key_to_doc[key] = doc
+                counts = Counter(tokenize(text))
+                new_lengths.append(sum(counts.values()))
+                for term,tf in counts.items():
+                    per_term.setdefault(term,[]).append((doc,tf))
+            for term,postings in per_term.items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    term_id = len(self.vocab)
+                    self.vocab[term] = term_id
+                    self._post_docs.append(np.empty(0,dtype=np.int32))
+                    self._post_tfs.append(np.empty(0,dtype=np.int32))
+                    self._pending_docs.append([])
+                    self._pending_tfs.append([])
+                docs,tfs = zip(*postings)
+                self._pending_docs[term_id].append(np.asarray(docs,dtype=np.int32))
+                self._pending_tfs[term_id].append(np.asarray(tfs,dtype=np.int32))
+            self.doc_lengths = np.concatenate([self.doc_lengths,np.asarray(new_lengths,dtype=np.int32)])
+            self.deleted = np.concatenate([self.deleted,np.zeros(len(new_lengths),dtype=bool)])
+
+    def remove(self,keys:list[str]):
+        with self._lock:
+            for key in keys:
+                doc = self._key_to_doc.get(key)
+                if doc is not None:
+                    self.deleted[doc] = True
+
+    def _postings(self,term_id:int):
+        if self._pending_docs[term_id]:
+            self._post_docs[term_id] = np.concatenate([self._post_docs[term_id]] + self._pending_docs[term_id])
+            self._post_tfs[term_id] = np.concatenate([self._post_tfs[term_id]] + self._pending_tfs[term_id])
+            self._pending_docs[term_id],self._pending_tfs[term_id] = [],[]
+        return self._post_docs[term_id],self._post_tfs[term_id]
+
+    def score(self,query:str) -> np.ndarray:
+        """
+            BM25 scores of every document for the query, 0 for documents that share no term with it.
+        """
+        with self._lock:
+            n_docs = len(self.doc_keys)
+            scores = np.zeros(n_docs,dtype=np.float32)
+            live = n_docs - int(self.deleted.sum())
+            if live == 0:
+                return scores
+            lengths = self.doc_lengths.astype(np.float32)
+            avg_len = float(lengths[~self.deleted].mean()) or 1.0
+            for term,q_tf in Counter(tokenize(query)).items():
+                term_id = self.vocab.get(term)
+                if term_id is None:
+                    continue
+                docs,tfs = self._postings(term_id)
+                df = len(docs)
+                idf = np.log(1.0 + (live - df + 0.5) / (df + 0.5))
+                tfs = tfs.astype(np.float32)
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / avg_len)
+                # Postings hold each document once per term, so a plain fancy-index add is safe.
+                scores[docs] += q_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+            scores[self.deleted] = 0.0
+            return scores
+
+    def search(self,query:str,k:int=10,allowed_keys:Optional[Iterable[str]]=None) -> list[tuple[str,float]]:
+        """
+            Top-k documents for the query as (key, bm25 score), best first, optionally only among allowed_keys.
+        """
+        scores = self.score(query)
+        if allowed_keys is not None:
+            allowed = np.zeros(len(scores),dtype=bool)
+            docs = [self._key_to_doc.get(key) for key in allowed_keys]
+            allowed[[doc for doc in docs if doc is not None and doc < len(scores)]] = True
+            scores[~allowed] = 0.0
+        n_hits = int((scores > 0).sum())
+        if n_hits == 0:
+            return []
+        kk = min(k,n_hits)
+        top = np.argpartition(-scores,kk-1)[:kk]
+        top = top[np.argsort(-scores[top],kind="stable")]
+        return [(self.doc_keys[doc],float(scores[doc])) for doc in top]
+
+    def save(self,path:str):
+        """
+            Persists the index in a fresh directory and atomically repoints path/CURRENT to it.
+        """
+        root = Path(path)
+        root.mkdir(parents=True,exist_ok=True)
+        name = f"index_{len(self.doc_keys)}_{uuid.uuid4().hex[:8]}"
+        tmp_dir = root/f".tmp_{name}"
+        tmp_dir.mkdir()
+        with self._lock:
+            terms = sorted(self.vocab,key=self.vocab.get)
+            postings = [self._postings(self.vocab[term]) for term in terms]
+            lengths = np.array([len(docs) for docs,_ in postings],dtype=np.int64)
+            with open(tmp_dir/"terms.json","w",encoding="utf-8") as f:
+                json.dump({"terms":terms,"k1":self.k1,"b":self.b},f,ensure_ascii=False)
+            np.save(tmp_dir/"term_offsets.npy",np.concatenate([[0],np.cumsum(lengths)]))
+            np.save(tmp_dir/"post_docs.npy",np.concatenate([docs for docs,_ in postings]) if postings else np.empty(0,dtype=np.int32))
+            np.save(tmp_dir/"post_tfs.npy",np.concatenate([tfs for _,tfs in postings]) if postings else np.empty(0,dtype=np.int32))
+            np.save(tmp_dir/"doc_lengths.npy",self.doc_lengths)
+            np.save(tmp_dir/"doc_keys.npy",np.asarray(self.doc_keys,dtype=np.str_))
+            np.save(tmp_dir/"deleted.npy",self.deleted)
+        os.rename(tmp_dir,root/name)
+        tmp_pointer = root/"CURRENT.tmp"
+        tmp_pointer.write_text(name,encoding="utf-8")
+        os.replace(tmp_pointer,root/"CURRENT")
+        for old in root.glob("index_*"):
+            if old.name != name:
+                shutil.rmtree(old,ignore_errors=True)
+
+    @classmethod
+    def load(cls,path:str) -> "InvertedIndex":
+        """
+            Loads the index path/CURRENT points to, or returns an empty index.
+        """
+        root = Path(path)
+        if not (root/"CURRENT").exists():
+            return cls()
+        index_dir = root/(root/"CURRENT").read_text(encoding="utf-8").strip()
+        with open(index_dir/"terms.json","r",encoding="utf-8") as f:
+            meta = json.load(f)
+        index = cls(meta['k1'],meta['b'])
+        offsets = np.load(index_dir/"term_offsets.npy")
+        post_docs = np.load(index_dir/"post_docs.npy")
+        post_tfs = np.load(index_dir/"post_tfs.npy")
+        index.vocab = {term:i for i,term in enumerate(meta['terms'])}
+        index._post_docs = [post_docs[offsets[i]:offsets[i+1]] for i in range(len(meta['terms']))]
+        index._post_tfs = [post_tfs[offsets[i]:offsets[i+1]] for i in range(len(meta['terms']))]
+        index._pending_docs = [[] for _ in meta['terms']]
+        index._pending_tfs = [[] for _ in meta['terms']]
+        index.doc_lengths = np.load(index_dir/"doc_lengths.npy")
+        index.doc_keys = np.load(index_dir/"doc_keys.npy").tolist()
+        index.deleted = np.load(index_dir/"deleted.npy")
+        index._key_to_doc = {key:doc for doc,key in enumerate(index.doc_keys)}
+        return index
+
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> InvertedIndex:
+    """
+        Returns the process wide lexical index loaded from lexical_index_config['path'].
+    """
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = InvertedIndex.load(lexical_index_config['path'])
+    return _lexical_index
+
+
+def reload_lexical_index() -> InvertedIndex:
+    """
+        Replaces the process wide lexical index with the copy saved on disk, e.g. after another process ingested documents.
+    """
+    global _lexical_index
+    index = InvertedIndex.load(lexical_index_config['path'])
+    with _lexical_index_lock:
+        _lexical_index = index
+    return index
@@ -0,0 +1,280 @@
+import json
+import math
+import os
+import threading
+from pathlib import Path
+from typing import Iterable,Optional
+import numpy as np
+from common.vector_db_config import metadata_filter_config,vector_db_config
+from common.vector_db_connection import META_COLUMNS,LocalVectorStore,Snapshot
+
+PLAN_BRUTE_FORCE = "brute_force"
+PLAN_ANN = "ann"
+
+# Metadata columns a filter may use. document_id is left out: it is a per-run position, not a stable document key
+# (filter on document_name or document_hash instead).
+FILTER_COLUMNS = [col for col in META_COLUMNS if col != "document_id"]
+
+
+class DocumentSessions(object):
+    """
+        Which sessions uploaded which documents, kept next to the vector store as one JSON file:
+            {"version": n, "sessions": {session_id: [document_name, ...]}}
+        Ownership is mutable (a later session can upload the same document), so it is not a segment column: a session_id
+        filter is resolved here to document names and then answered by the document_name postings.
+        Updates replace the file atomically and bump version; readers reload it when its mtime changes.
+    """
+    def __init__(self,path:str):
+        self.path = Path(path)
+        self.version = 0
+        self.sessions = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            with open(self.path,"r",encoding="utf-8") as f:
+                stored = json.load(f)
+            self.version = stored['version']
+            self.sessions = {session_id:set(names) for session_id,names in stored['sessions'].items()}
+            self._mtime = mtime
+
+    def add(self,session_ids:Iterable[str],document_names:Iterable[str]):
+        document_names = set(document_names)
+        if not document_names:
+            return
+        with self._lock:
+            self.refresh()
+            for session_id in session_ids:
+                self.sessions.setdefault(session_id,set()).update(document_names)
+            self.version += 1
+            _write_json(self.path,{"version":self.version,"sessions":{sid:sorted(names) for sid,names in self.sessions.items()}})
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def documents(self,session_ids:Iterable[str]) -> set[str]:
+        self.refresh()
+        return set().union(*(self.sessions.get(session_id,set()) for session_id in session_ids))
+
+
+class DuplicateAliases(object):
+    """
+        Chunks the dedup stage did not embed, kept next to the vector store as one JSON file:
+            {"version": n, "documents": {document_name: [{"canonical": unique_id, <FILTER_COLUMNS of the dropped chunk>}, ...]}}
+        A dropped chunk is answered by its canonical row, which belongs to another document; filter_rows uses these aliases so a
+        document_name, session_id or page filter on the dropped chunk's own document still reaches that row.
+        A document's aliases are replaced as a whole every time it is deduplicated. Same file handling as DocumentSessions.
+    """
+    def __init__(self,path:str):
+        self.path = Path(path)
+        self.version = 0
+        self.documents = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            with open(self.path,"r",encoding="utf-8") as f:
+                stored = json.load(f)
+            self.version = stored['version']
+            self.documents = stored['documents']
+            self._mtime = mtime
+
+    def set_document(self,document_name:str,aliases:list[dict]):
+        with self._lock:
+            self.refresh()
+            if not aliases and document_name not in self.documents:
+                return
+            if aliases:
+                self.documents[document_name] = aliases
+            else:
+                del self.documents[document_name]
+            self.version += 1
+            _write_json(self.path,{"version":self.version,"documents":self.documents})
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def canonical_ids(self,clauses:dict) -> list[str]:
+        """
+            unique_ids of the canonical rows of the dropped chunks matching every resolved filter clause.
+        """
+        self.refresh()
+        names = clauses.get("document_name")
+        documents = self.documents.values() if names is None else [self.documents.get(str(name),[]) for name in names]
+        return [alias['canonical'] for aliases in documents for alias in aliases if _alias_matches(alias,clauses)]
+
+
+def _write_json(path:Path,data:dict):
+    path.parent.mkdir(parents=True,exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path,"w",encoding="utf-8") as f:
+        json.dump(data,f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path,path)
+
+
+def _alias_matches(alias:dict,clauses:dict) -> bool:
+    for field,value in clauses.items():
+        if field == "page_range":
+            if alias['page_start'] > value[1] or alias['page_end'] < value[0]:
+                return False
+        elif str(alias[field]) not in {str(item) for item in value}:
+            return False
+    return True
+
+
+def _as_list(value) -> list:
+    return list(value) if isinstance(value,(list,tuple,set)) else [value]
+
+
+def _segment_clause_rows(segment,field:str,value) -> np.ndarray:
+    """
+        Local rows of one segment matching one filter clause, sorted.
+    """
+    if field == "page_range":
+        lo,hi = value
+        starts,start_rows = segment.postings("page_start")
+        ends,end_rows = segment.postings("page_end")
+        # Chunks overlapping [lo, hi]: page_start <= hi and page_end >= lo.
+        rows = np.intersect1d(
+            start_rows[:np.searchsorted(starts,hi,side='right')],
+            end_rows[np.searchsorted(ends,lo,side='left'):],
+            assume_unique=True
+        )
+        return rows
+    values,order = segment.postings(field)
+    parts = []
+    for item in _as_list(value):
+        item = np.asarray(item,dtype=values.dtype) if values.dtype.kind != 'U' else str(item)
+        parts.append(order[np.searchsorted(values,item,side='left'):np.searchsorted(values,item,side='right')])
+    return np.sort(np.concatenate(parts)) if parts else np.empty(0,dtype=np.int64)
+
+
+def resolve_filters(filters:dict,sessions:DocumentSessions=None) -> dict:
+    """
+        Validates filters and rewrites session_id into the document_name clause it stands for.
+        Supported fields: any FILTER_COLUMNS column (value or list of values), page_range ([first, last] page, overlap),
+        session_id (value or list; documents uploaded by those sessions).
+        Raises:
+            ValueError : On an unknown field or a malformed page_range.
+    """
+    resolved = {}
+    for field,value in filters.items():
+        if field == "session_id":
+            names = (sessions or get_document_sessions()).documents(_as_list(value))
+            if "document_name" in resolved:
+                names &= set(_as_list(resolved['document_name']))
+            resolved['document_name'] = sorted(names)
+        elif field == "page_range":
+            if len(_as_list(value)) != 2:
+                raise ValueError(f"page_range expects [first, last], got {value!r}.")
+            resolved[field] = [int(page) for page in value]
+        elif field in FILTER_COLUMNS:
+            if field == "document_name" and "document_name" in resolved:
+                resolved[field] = sorted(set(resolved[field]) & set(_as_list(value)))
+            else:
+                resolved[field] = _as_list(value)
+        else:
+            raise ValueError(f"Unknown filter field '{field}', expected page_range, session_id or one of {FILTER_COLUMNS}.")
+    return resolved
+
+
+def filter_rows(snapshot:Snapshot,filters:dict,sessions:DocumentSessions=None,aliases:DuplicateAliases=None,with_aliases:bool=True) -> np.ndarray:
+    """
+        Global rows of the snapshot matching every filter clause, sorted, without the tombstoned ones.
+        Each clause is a slice of a per-segment posting index; clauses are intersected smallest first, so a selective clause
+        bounds the work of the others. No vector is read.
+        With with_aliases, the canonical rows of deduplicated chunks matching the clauses are added (see DuplicateAliases);
+        callers that act on the rows a document owns (e.g. retiring superseded rows) pass with_aliases=False.
+    """
+    clauses = resolve_filters(filters,sessions)
+    matched = []
+    for segment,offset in zip(snapshot.segments,snapshot.offsets):
+        clause_rows = sorted((_segment_clause_rows(segment,field,value) for field,value in clauses.items()),key=len)
+        rows = clause_rows[0] if clause_rows else np.arange(len(segment),dtype=np.int64)
+        for other in clause_rows[1:]:
+            if rows.size == 0:
+                break
+            rows = np.intersect1d(rows,other,assume_unique=True)
+        matched.append(rows + int(offset))
+    rows = np.concatenate(matched) if matched else np.empty(0,dtype=np.int64)
+    rows = rows[~snapshot.is_deleted(rows)]
+    if with_aliases and clauses:
+        canonical_ids = (aliases or get_duplicate_aliases()).canonical_ids(clauses)
+        if canonical_ids:
+            alias_rows = snapshot.find_rows(canonical_ids)
+            rows = np.union1d(rows,alias_rows[alias_rows >= 0])
+    return rows
+
+
+def plan_filtered_search(store:LocalVectorStore,snapshot:Snapshot,n_candidates:int) -> str:
+    """
+        Brute force over the candidates when they are few (or there is no ANN index), else the ANN index with oversampling.
+    """
+    if store.ann_index is None or store.ann_index.n_indexed == 0:
+        return PLAN_BRUTE_FORCE
+    selectivity = n_candidates / max(1,snapshot.count)
+    if n_candidates <= metadata_filter_config['brute_force_max_rows'] or selectivity <= metadata_filter_config['brute_force_selectivity']:
+        return PLAN_BRUTE_FORCE
+    return PLAN_ANN
+
+
+def filtered_search_rows(store:LocalVectorStore,query_vector:np.ndarray,k:int,candidate_rows:np.ndarray,snapshot:Snapshot):
+    """
+        Top-k dense search of one query restricted to candidate_rows (from filter_rows), using the plan_filtered_search plan.
+        The ANN plan asks the index for k / selectivity * ann_oversample results and keeps the candidates; when fewer than
+        k survive it falls back to brute force, so a filtered search never returns less than the candidates allow.
+        Returns:
+            tuple[np.ndarray,np.ndarray] : (scores, rows) of the query, best first.
+    """
+    queries = np.asarray(query_vector,dtype=np.float32)[None,:]
+    if candidate_rows.size == 0:
+        return np.empty(0,dtype=np.float32),np.empty(0,dtype=np.int64)
+    if plan_filtered_search(store,snapshot,candidate_rows.size) == PLAN_ANN:
+        selectivity = candidate_rows.size / snapshot.count
+        kk = min(snapshot.count,math.ceil(k / selectivity * metadata_filter_config['ann_oversample']))
+        scores,rows = store.search_rows(queries,kk,snapshot)
+        keep = np.isin(rows[0],candidate_rows,assume_unique=True)
+        if int(keep.sum()) >= min(k,candidate_rows.size):
+            return scores[0][keep][:k],rows[0][keep][:k]
+    scores,rows = store.search_subset(queries,k,candidate_rows,snapshot)
+    return scores[0],rows[0]
+
+
+_document_sessions = None
+_document_sessions_lock = threading.Lock()
+
+
+def get_document_sessions() -> DocumentSessions:
+    """
+        Returns the process wide session -> documents map stored in the vector store directory.
+    """
+    global _document_sessions
+    with _document_sessions_lock:
+        if _document_sessions is None:
+            _document_sessions = DocumentSessions(Path(vector_db_config['path'])/metadata_filter_config['sessions_file'])
+    return _document_sessions
+
+
+_duplicate_aliases = None
+_duplicate_aliases_lock = threading.Lock()
+
+
+def get_duplicate_aliases() -> DuplicateAliases:
+    """
+        Returns the process wide map of deduplicated chunks stored in the vector store directory.
+    """
+    global _duplicate_aliases
+    with _duplicate_aliases_lock:
+        if _duplicate_aliases is None:
+            _duplicate_aliases = DuplicateAliases(Path(vector_db_config['path'])/metadata_filter_config['aliases_file'])
+    return _duplicate_aliases
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable,Optional
+import numpy as np
+from common.vector_db_config import query_cache_config
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(query_text:str) -> str:
+    """
+        Canonical form of a user query for cache lookups: NFKC, case folded, whitespace collapsed, trailing ?!. dropped.
+    """
+    text = unicodedata.normalize("NFKC",query_text).casefold()
+    return _TRAILING_PUNCTUATION.sub("",_WHITESPACE.sub(" ",text).strip())
+
+
+class TTLCache(object):
+    """
+        Thread safe LRU cache whose entries also expire ttl seconds after they were stored.
+    """
+    def __init__(self,max_entries:int,ttl:float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self,key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self,key,value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl,value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries":len(self),"hits":self.hits,"misses":self.misses,"hit_rate":round(self.hits / lookups,4) if lookups else 0.0}
+
+
+class QueryCache(object):
+    """
+        Two-level cache in front of query embedding and retrieval:
+            1. (embedding model, normalized query text)              -> query embedding
+            2. (query embedding, k, filters, store snapshot version) -> top-k snapshot rows with their scores
+        The snapshot version is part of the level 2 key, so a publish (in this or another process) makes every cached result
+        unreachable; the first lookup that sees a new version also clears level 2 to free the memory.
+        Only snapshot row ids and scores are cached (rows are stable within a version), metadata is read from the snapshot on every hit.
+    """
+    def __init__(self,config:dict=None):
+        self.config = config or query_cache_config
+        self.embeddings = TTLCache(self.config['embedding_max_entries'],self.config['embedding_ttl'])
+        self.results = TTLCache(self.config['result_max_entries'],self.config['result_ttl'])
+        self._version = None
+        self._version_lock = threading.Lock()
+
+    def query_embedding(self,query_text:str,model_name:str,embed:Callable[[str],np.ndarray]) -> np.ndarray:
+        key = (model_name,normalize_query(query_text))
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = np.asarray(embed(query_text),dtype=np.float32)
+            vector.setflags(write=False)
+            self.embeddings.put(key,vector)
+        return vector
+
+    def _sync_version(self,version:int):
+        with self._version_lock:
+            if version != self._version:
+                if self._version is not None:
+                    self.results.clear()
+                self._version = version
+
+    @staticmethod
+    def result_key(query_vector:np.ndarray,k:int,filters:Optional[dict],version:int) -> tuple:
+        vector_hash = hashlib.sha1(np.ascontiguousarray(query_vector,dtype=np.float32).tobytes()).hexdigest()
+        return (vector_hash,k,json.dumps(filters or {},sort_keys=True,default=str),version)
+
+    def get_results(self,query_vector:np.ndarray,k:int,filters:Optional[dict],version:int) -> Optional[list[dict]]:
+        """
+            Cached hits ({'row', scores...}) for the query, or None.
+        """
+        self._sync_version(version)
+        return self.results.get(self.result_key(query_vector,k,filters,version))
+
+    def put_results(self,query_vector:np.ndarray,k:int,filters:Optional[dict],version:int,hits:list[dict]):
+        self._sync_version(version)
+        self.results.put(self.result_key(query_vector,k,filters,version),hits)
+
+    def stats(self) -> dict:
+        return {"embeddings":self.embeddings.stats(),"results":self.results.stats(),"version":self._version}
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """
+        Returns the process wide query cache, or None when query_cache_config['enabled'] is off.
+    """
+    global _query_cache
+    if not query_cache_config['enabled']:
+        return None
+    with _query_cache_lock:
+        if _query_cache is None:
+            _query_cache = QueryCache()
+    return _query_cache
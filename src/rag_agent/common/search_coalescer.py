@@ -0,0 +1,103 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from common.vector_db_config import search_coalescer_config
+from common.vector_db_connection import LocalVectorStore,Snapshot,get_vector_store
+
+
+class SearchCoalescer(object):
+    """
+        Gathers the dense searches of concurrent requests and scores them as one batch.
+
+        A query waits at most window_ms for others to arrive (or until max_batch are waiting); the batch is then stacked into a
+        (n_queries, dimension) matrix and scored with one store.search_rows call, i.e. one matrix-matrix product per block and a
+        batched top-k, instead of n matrix-vector products that each stream the whole store through the cache.
+        Scoring runs on a small thread pool (numpy releases the GIL), so the event loop keeps accepting requests meanwhile, and
+        every query of a batch is answered from the same snapshot, returned alongside its results.
+        The scoring tasks are held in _tasks until they finish (the event loop only keeps weak references to tasks), and any
+        failure of a batch is set on every future of that batch.
+        Must be used from a single event loop.
+    """
+    def __init__(self,store:LocalVectorStore=None,window_ms:float=None,max_batch:int=None,workers:int=None):
+        self.store = get_vector_store() if store is None else store
+        self.window = (search_coalescer_config['window_ms'] if window_ms is None else window_ms) / 1000
+        self.max_batch = max_batch or search_coalescer_config['max_batch']
+        self.executor = ThreadPoolExecutor(max_workers=workers or search_coalescer_config['workers'],thread_name_prefix="search")
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self.batches = 0
+        self.queries = 0
+
+    async def search(self,query_vector:np.ndarray,k:int) -> tuple[np.ndarray,np.ndarray,Snapshot]:
+        """
+            Top-k dense search of one query, scored together with the other queries waiting at the same time.
+            Returns:
+                tuple[np.ndarray,np.ndarray,Snapshot] : (scores, rows) of this query, -1 padded like search_rows,
+                                                        and the snapshot the rows refer to.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((np.asarray(query_vector,dtype=np.float32),k,future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window,self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch,self._pending = self._pending,[]
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._score(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _score_batch(self,queries:np.ndarray,k:int):
+        snapshot = self.store.refresh()
+        scores,rows = self.store.search_rows(queries,k,snapshot)
+        return scores,rows,snapshot
+
+    async def _score(self,batch:list):
+        self.batches += 1
+        self.queries += len(batch)
+        try:
+            queries = np.stack([vector for vector,_,_ in batch])
+            k = max(k for _,k,_ in batch)
+            scores,rows,snapshot = await asyncio.get_running_loop().run_in_executor(self.executor,self._score_batch,queries,k)
+        except asyncio.CancelledError:
+            for _,_,future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _,_,future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for idx,(_,query_k,future) in enumerate(batch):
+            if not future.done():
+                future.set_result((scores[idx,:query_k],rows[idx,:query_k],snapshot))
+
+    def stats(self) -> dict:
+        return {"batches":self.batches,"queries":self.queries,"mean_batch":round(self.queries / self.batches,2) if self.batches else 0.0}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False,cancel_futures=True)
+
+
+_search_coalescer = None
+_search_coalescer_lock = threading.Lock()
+
+
+def get_search_coalescer() -> SearchCoalescer:
+    """
+        Returns the process wide coalescer over get_vector_store().
+    """
+    global _search_coalescer
+    with _search_coalescer_lock:
+        if _search_coalescer is None:
+            _search_coalescer = SearchCoalescer()
+    return _search_coalescer
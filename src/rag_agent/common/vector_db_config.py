@@ -0,0 +1,82 @@
+from utils.config import embedding_config
+
+# path : directory of the local vector store (segments + CURRENT snapshot pointer).
+# dtype : on-disk vector dtype, 'float32' or 'float16' (half the disk and page cache, upcast block by block at search time).
+# search_block_rows : rows scored per matrix product, bounds the temporary score matrix during brute-force search.
+# upsert_rows_per_segment : rows buffered by the upsert stage before a segment is written.
+# compact_deleted_fraction : share of tombstoned rows at which publish() rewrites a segment without them.
+# ann : IVF-PQ index settings. The index is built once the store reaches min_rows and kept in sync on every upsert;
+#       below min_rows search stays exact. nprobe / refine_factor are the default search-time recall knobs.
+vector_db_config = {
+    "path" : "intermediate/final/vector_store",
+    "dimension" : embedding_config['dimension'],
+    "dtype" : "float32",
+    "search_block_rows" : 262144,
+    "upsert_rows_per_segment" : 100000,
+    "compact_deleted_fraction" : 0.2,
+    "ann" : {
+        "enabled" : True,
+        "min_rows" : 200000,
+        "n_lists" : 1024,
+        "pq_m" : 16,
+        "nprobe" : 16,
+        "refine_factor" : 10,
+        "train_sample" : 100000
+    }
+}
+
+# path : directory of the BM25 inverted index built alongside the embedded batches (CURRENT points to the live copy).
+# k1, b : BM25 term-frequency saturation and length normalisation.
+lexical_index_config = {
+    "path" : "intermediate/final/lexical_index",
+    "k1" : 1.2,
+    "b" : 0.75
+}
+
+# top_k : results returned to process_document_search.
+# candidates : results taken from each retriever before fusion.
+# rrf_k : reciprocal-rank fusion constant, score = sum over retrievers of weight / (rrf_k + rank).
+# weights : per-retriever fusion weights.
+hybrid_search_config = {
+    "top_k" : 5,
+    "candidates" : 50,
+    "rrf_k" : 60,
+    "weights" : {"dense" : 1.0, "lexical" : 1.0}
+}
+
+# Two-level cache in front of search_documents (common/query_cache.py), entries evicted least recently used or after ttl seconds.
+# embedding_* : normalized query text -> query embedding, keyed by embedding model.
+# result_* : (query embedding, k, filters, snapshot version) -> top-k chunk ids; a new published snapshot invalidates them all.
+query_cache_config = {
+    "enabled" : True,
+    "embedding_max_entries" : 10000,
+    "embedding_ttl" : 86400,
+    "result_max_entries" : 5000,
+    "result_ttl" : 900
+}
+
+# Micro-batching of concurrent dense searches (common/search_coalescer.py), used by the async search path.
+# window_ms : longest a query waits for others before its batch is scored.
+# max_batch : queries that trigger scoring without waiting for the window.
+# workers : threads scoring batches; numpy releases the GIL, so more than one lets batches overlap.
+search_coalescer_config = {
+    "enabled" : True,
+    "window_ms" : 2,
+    "max_batch" : 64,
+    "workers" : 2
+}
+
+# Metadata pre-filtering (common/metadata_index.py): filters are answered from per-segment posting indexes before scoring.
+# brute_force_max_rows / brute_force_selectivity : below either, the candidates are scored exactly instead of through ANN.
+# ann_oversample : with ANN, results requested = k / selectivity * ann_oversample, filtered to the candidates.
+# lexical_oversample : BM25 candidates multiplier for filters too broad to restrict the BM25 scoring directly.
+# sessions_file : session -> uploaded documents map, inside the vector store directory.
+# aliases_file : chunks dropped by dedup -> their canonical row, inside the vector store directory (see DuplicateAliases).
+metadata_filter_config = {
+    "brute_force_max_rows" : 50000,
+    "brute_force_selectivity" : 0.02,
+    "ann_oversample" : 2.0,
+    "lexical_oversample" : 4,
+    "sessions_file" : "document_sessions.json",
+    "aliases_file" : "duplicate_aliases.json"
+}
@@ -0,0 +1,583 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from common.vector_db_config import vector_db_config
+from common.ann_index import IVFPQIndex
+from common.vector_search import block_top_k,merge_top_k,normalize_rows,sort_top_k
+
+# Compact per-row metadata kept next to the vectors, one .npy column per field.
+# document_id is the position of the document in the embedding run that wrote the row, so it is not stable across runs;
+# document_hash (content hash prefix of the source document, also part of unique_id) identifies a document version.
+META_COLUMNS = {
+    "document_id": np.int64,
+    "document_name": np.str_,
+    "document_hash": np.str_,
+    "chunk_id": np.int64,
+    "page_start": np.int32,
+    "page_end": np.int32,
+    "unique_id": np.str_,
+}
+
+
+def document_hash_of(unique_id:str) -> str:
+    """
+        The source document hash part of a chunk unique_id (see generate_hybrid_unique_id), '' for ids of another shape.
+    """
+    parts = unique_id.rsplit("_",3)
+    return parts[1] if len(parts) == 4 else ""
+
+
+class Segment(object):
+    """
+        An immutable block of vectors plus their metadata columns, memory mapped from disk.
+        Columns added to META_COLUMNS after a segment was written read as empty strings / zeros, except document_hash,
+        which is recovered from unique_id.
+    """
+    def __init__(self,path:Path):
+        self.path = path
+        self.name = path.name
+        self.vectors = np.load(path/"vectors.npy",mmap_mode='r')
+        self.meta = {
+            col:np.load(path/f"{col}.npy",mmap_mode='r') if (path/f"{col}.npy").exists() else np.zeros(len(self),dtype=dtype)
+            for col,dtype in META_COLUMNS.items()
+        }
+        if not (path/"document_hash.npy").exists():
+            self.meta['document_hash'] = np.asarray([document_hash_of(str(uid)) for uid in self.meta['unique_id']],dtype=np.str_)
+        self._postings = {}
+        self._postings_lock = threading.Lock()
+
+    def __len__(self):
+        return self.vectors.shape[0]
+
+    def postings(self,col:str) -> tuple[np.ndarray,np.ndarray]:
+        """
+            Posting index of a metadata column: (sorted values, local rows in that order), built on first use.
+            The rows of one value, or of a value range, are a contiguous slice found with two binary searches.
+        """
+        with self._postings_lock:
+            if col not in self._postings:
+                values = np.asarray(self.meta[col])
+                order = np.argsort(values,kind="stable")
+                self._postings[col] = (values[order],order.astype(np.int64))
+            return self._postings[col]
+
+
+class Snapshot(object):
+    """
+        A published, read-only view of the store: an ordered list of segments.
+        Rows are numbered globally in segment order, which is the row id used by the search results and the index layers.
+        Deleted (tombstoned) rows keep their row id but are never returned by find_rows or the searches, until a compaction
+        rewrites their segment; generation counts compactions, i.e. how often row ids were renumbered.
+        retired lists the segments the previous snapshot used and this one no longer does.
+    """
+    def __init__(self,version:int,segments:list[Segment],sources:list[str],tombstones:Optional[Path]=None,generation:int=0,retired:list[str]=()):
+        self.version = version
+        self.segments = segments
+        self.sources = set(sources)
+        self.tombstones = tombstones
+        self.generation = generation
+        self.retired = list(retired)
+        self.deleted = np.load(tombstones) if tombstones is not None else np.empty(0,dtype=np.int64)
+        self.offsets = np.cumsum([0]+[len(seg) for seg in segments])
+        self.count = int(self.offsets[-1])
+        self.live_count = self.count - len(self.deleted)
+        self._sorted_ids = None
+        self._sorted_rows = None
+
+    def find_rows(self,unique_ids:list[str]) -> np.ndarray:
+        """
+            Maps chunk unique_ids to global row ids, -1 where the id is not in the snapshot.
+            The sorted id column is built on first use and kept for the lifetime of the snapshot.
+        """
+        if self._sorted_ids is None:
+            ids = self.column("unique_id")
+            self._sorted_rows = np.argsort(ids,kind="stable")
+            self._sorted_ids = ids[self._sorted_rows]
+        unique_ids = np.asarray(unique_ids,dtype=np.str_)
+        if self._sorted_ids.size == 0 or unique_ids.size == 0:
+            return np.full(unique_ids.shape,-1,dtype=np.int64)
+        pos = np.searchsorted(self._sorted_ids,unique_ids)
+        pos = np.minimum(pos,self._sorted_ids.size-1)
+        found = self._sorted_ids[pos] == unique_ids
+        rows = np.where(found,self._sorted_rows[pos],-1).astype(np.int64)
+        return np.where(self.is_deleted(rows),-1,rows)
+
+    def is_deleted(self,rows:np.ndarray) -> np.ndarray:
+        """
+            True for the global rows that are tombstoned in this snapshot.
+        """
+        rows = np.asarray(rows,dtype=np.int64)
+        if self.deleted.size == 0:
+            return np.zeros(rows.shape,dtype=bool)
+        return np.isin(rows,self.deleted)
+
+    def segment_deleted(self,seg_idx:int) -> np.ndarray:
+        """
+            Local rows of one segment that are tombstoned, sorted.
+        """
+        lo,hi = np.searchsorted(self.deleted,[self.offsets[seg_idx],self.offsets[seg_idx+1]])
+        return self.deleted[lo:hi] - self.offsets[seg_idx]
+
+    def locate(self,rows:np.ndarray):
+        """
+            Maps global row ids to (segment index, local row) pairs.
+        """
+        seg_idx = np.searchsorted(self.offsets,rows,side='right') - 1
+        return seg_idx,rows - self.offsets[seg_idx]
+
+    def column(self,col:str) -> np.ndarray:
+        """
+            Materialises one metadata column across all segments, in global row order.
+        """
+        if not self.segments:
+            return np.empty(0,dtype=META_COLUMNS[col])
+        return np.concatenate([np.asarray(seg.meta[col]) for seg in self.segments])
+
+    def vectors(self,rows:np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows,dtype=np.int64)
+        out = np.empty((len(rows),self.segments[0].vectors.shape[1]),dtype=np.float32) if self.segments else np.empty((0,0),dtype=np.float32)
+        seg_idx,local = self.locate(rows)
+        for s in np.unique(seg_idx):
+            mask = seg_idx == s
+            out[mask] = self.segments[s].vectors[local[mask]]
+        return out
+
+    def column_values(self,col:str,rows:np.ndarray) -> np.ndarray:
+        """
+            Values of one metadata column at the given global rows.
+        """
+        rows = np.asarray(rows,dtype=np.int64)
+        out = np.empty(len(rows),dtype=object)
+        seg_idx,local = self.locate(rows)
+        for s in np.unique(seg_idx):
+            mask = seg_idx == s
+            out[mask] = self.segments[s].meta[col][local[mask]]
+        return out
+
+    def row_metadata(self,rows) -> list[dict]:
+        rows = np.asarray(rows,dtype=np.int64)
+        seg_idx,local = self.locate(rows)
+        return [
+            {col:self.segments[s].meta[col][r].item() for col in META_COLUMNS}
+            for s,r in zip(seg_idx,local)
+        ]
+
+
+class LocalVectorStore(object):
+    """
+        File-backed vector store that runs fully offline.
+
+        Layout under path:
+            segments/<name>/vectors.npy      (n, dim) L2 normalised vectors in the configured dtype
+            segments/<name>/<column>.npy     one metadata column per META_COLUMNS entry
+            tombstones/deleted_<version>.npy sorted global rows deleted as of that version
+            CURRENT                          JSON snapshot pointer: version, segment names, ingested sources, tombstone file,
+                                             compaction generation and retired segments
+
+        append() stages rows in memory and spills them to new segments; nothing is visible to readers until publish(),
+        which atomically swaps CURRENT (write to a temp file, then os.replace). Searches always run against one consistent snapshot.
+        Segments are memory mapped, so opening the store is cheap and the OS page cache holds the hot vectors.
+        Rows are never rewritten in place: delete_rows() tombstones them in the next snapshot instead. Once the tombstoned
+        share of a segment reaches compact_deleted_fraction, publish() also compacts it (see compact()).
+    """
+    def __init__(self,path:str=None,dimension:int=None,dtype:str=None,block_rows:int=None,rows_per_segment:int=None):
+        self.path = Path(path or vector_db_config['path'])
+        self.dimension = dimension or vector_db_config['dimension']
+        self.dtype = np.dtype(dtype or vector_db_config['dtype'])
+        self.block_rows = block_rows or vector_db_config['search_block_rows']
+        self.rows_per_segment = rows_per_segment or vector_db_config['upsert_rows_per_segment']
+        self.compact_deleted_fraction = vector_db_config['compact_deleted_fraction']
+        self.segments_dir = self.path/"segments"
+        self.current_path = self.path/"CURRENT"
+        self.tombstones_dir = self.path/"tombstones"
+        self.segments_dir.mkdir(parents=True,exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending_vectors = []
+        self._pending_meta = []
+        self._pending_rows = 0
+        self._staged_segments = []
+        self._staged_sources = []
+        self._staged_deleted = []
+        self._current_mtime = None
+        self.snapshot = Snapshot(0,[],[])
+        self.ann_config = vector_db_config['ann']
+        self.ann_path = self.path/"ann"
+        self.ann_index = IVFPQIndex.load(self.ann_path) if self.ann_config['enabled'] else None
+        self.refresh()
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    def __len__(self):
+        return self.snapshot.live_count
+
+    def refresh(self) -> Snapshot:
+        """
+            Reloads the snapshot if CURRENT changed on disk, e.g. after another process published.
+        """
+        try:
+            mtime = os.stat(self.current_path).st_mtime_ns
+        except FileNotFoundError:
+            return self.snapshot
+        if mtime != self._current_mtime:
+            with open(self.current_path,"r",encoding="utf-8") as f:
+                current = json.load(f)
+            # Segments are immutable, so the ones already open (with their posting indexes) are carried over.
+            open_segments = {seg.name:seg for seg in self.snapshot.segments}
+            segments = [open_segments.get(name) or Segment(self.segments_dir/name) for name in current['segments']]
+            tombstones = self.tombstones_dir/current['deleted'] if current.get('deleted') else None
+            self.snapshot = Snapshot(
+                current['version'],segments,current.get('sources',[]),tombstones,current.get('generation',0),current.get('retired',[])
+            )
+            self._current_mtime = mtime
+            # A compaction renumbered the rows; the index saved with it is remapped to the new ones.
+            if self.ann_index is not None and self.ann_index.generation != self.snapshot.generation:
+                self.reload_ann_index()
+        return self.snapshot
+
+    def append(self,vectors:np.ndarray,metadata:list[dict],source:Optional[str]=None):
+        """
+            Stages rows for the next publish. Vectors are normalised here, metadata must hold every META_COLUMNS key.
+            Args:
+                vectors(np.ndarray) : (n, dimension) embeddings.
+                metadata(list[dict]) : One dict per row.
+                source(str) : Optional name of the input (e.g. an embedded batch file) recorded in the snapshot.
+        """
+        vectors = normalize_rows(vectors)
+        if vectors.shape[0] != len(metadata):
+            raise ValueError(f"Got {vectors.shape[0]} vectors for {len(metadata)} metadata rows.")
+        if vectors.shape[0] and vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}.")
+        with self._lock:
+            self._pending_vectors.append(vectors.astype(self.dtype))
+            self._pending_meta.extend(metadata)
+            self._pending_rows += vectors.shape[0]
+            if source is not None:
+                self._staged_sources.append(str(source))
+            if self._pending_rows >= self.rows_per_segment:
+                self._flush_segment()
+
+    def _flush_segment(self):
+        if self._pending_rows == 0:
+            return
+        name = f"seg_{self.version+1:06d}_{len(self._staged_segments):04d}_{uuid.uuid4().hex[:8]}"
+        self._write_segment(name,np.vstack(self._pending_vectors),{
+            col:np.asarray([row[col] for row in self._pending_meta],dtype=dtype) for col,dtype in META_COLUMNS.items()
+        })
+        self._staged_segments.append(name)
+        self._pending_vectors,self._pending_meta,self._pending_rows = [],[],0
+
+    def _write_segment(self,name:str,vectors:np.ndarray,columns:dict[str,np.ndarray]):
+        tmp_dir = self.segments_dir/f".tmp_{name}"
+        tmp_dir.mkdir(parents=True)
+        np.save(tmp_dir/"vectors.npy",vectors)
+        for col,values in columns.items():
+            np.save(tmp_dir/f"{col}.npy",values)
+        os.rename(tmp_dir,self.segments_dir/name)
+
+    def _write_current(self,current:dict):
+        tmp_path = self.current_path.with_suffix(".tmp")
+        with open(tmp_path,"w",encoding="utf-8") as f:
+            json.dump(current,f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path,self.current_path)
+
+    def publish(self) -> int:
+        """
+            Writes the staged rows and atomically publishes a new snapshot containing them.
+            Returns:
+                int : The published snapshot version (unchanged when nothing was staged).
+        """
+        with self._lock:
+            self._flush_segment()
+            if not self._staged_segments and not self._staged_sources and not self._staged_deleted:
+                return self.version
+            snapshot = self.refresh()
+            current = {
+                "version": snapshot.version + 1,
+                "dimension": self.dimension,
+                "dtype": self.dtype.name,
+                "segments": [seg.name for seg in snapshot.segments] + self._staged_segments,
+                "sources": sorted(snapshot.sources | set(self._staged_sources)),
+                "deleted": self._write_tombstones(snapshot,snapshot.version + 1),
+                "generation": snapshot.generation,
+                "retired": [],
+                "published_datetime": datetime.now().isoformat(),
+            }
+            self._write_current(current)
+            self._staged_segments,self._staged_sources,self._staged_deleted = [],[],[]
+            self.refresh()
+            self._prune(current['deleted'],snapshot)
+            print(f"Published vector store snapshot {self.version} with {len(self)} rows.")
+            if self.snapshot.deleted.size:
+                self._compact(self.compact_deleted_fraction)
+            return self.version
+
+    def compact(self,min_deleted_fraction:float=None) -> int:
+        """
+            Rewrites the segments whose tombstoned share reaches min_deleted_fraction (compact_deleted_fraction by default)
+            without their deleted rows and publishes the result.
+            Returns:
+                int : The published snapshot version (unchanged when no segment qualified).
+        """
+        with self._lock:
+            self._compact(self.compact_deleted_fraction if min_deleted_fraction is None else min_deleted_fraction)
+            return self.version
+
+    def _compact(self,min_deleted_fraction:float):
+        """
+            Compaction renumbers every row after the first compacted segment, so the snapshot gets a new generation and the
+            ANN index is remapped (and saved) before CURRENT is swapped; readers only use an index of their snapshot's generation.
+        """
+        snapshot = self.refresh()
+        targets = {
+            seg_idx for seg_idx,seg in enumerate(snapshot.segments)
+            if len(seg) and snapshot.segment_deleted(seg_idx).size >= min_deleted_fraction * len(seg)
+        }
+        if not targets:
+            return
+        keep = np.ones(snapshot.count,dtype=bool)
+        segments = []
+        for seg_idx,seg in enumerate(snapshot.segments):
+            if seg_idx not in targets:
+                segments.append(seg.name)
+                continue
+            deleted = snapshot.segment_deleted(seg_idx)
+            keep[deleted + snapshot.offsets[seg_idx]] = False
+            live = np.setdiff1d(np.arange(len(seg)),deleted)
+            if live.size:
+                name = f"seg_{snapshot.version+1:06d}_c{len(segments):04d}_{uuid.uuid4().hex[:8]}"
+                self._write_segment(name,np.asarray(seg.vectors[live]),{col:np.asarray(seg.meta[col][live]) for col in META_COLUMNS})
+                segments.append(name)
+        mapping = np.where(keep,np.cumsum(keep) - 1,-1)
+        remaining = snapshot.deleted[keep[snapshot.deleted]]
+        generation = snapshot.generation + 1
+        index = self.ann_index if self.ann_index is not None else (IVFPQIndex.load(self.ann_path) if self.ann_config['enabled'] else None)
+        if index is not None and index.generation == snapshot.generation:
+            index.remap(mapping)
+            index.generation = generation
+            index.save(self.ann_path)
+            self.ann_index = index
+        current = {
+            "version": snapshot.version + 1,
+            "dimension": self.dimension,
+            "dtype": self.dtype.name,
+            "segments": segments,
+            "sources": sorted(snapshot.sources),
+            "deleted": self._save_tombstones(mapping[remaining],snapshot.version + 1) if remaining.size else None,
+            "generation": generation,
+            "retired": [snapshot.segments[seg_idx].name for seg_idx in sorted(targets)],
+            "published_datetime": datetime.now().isoformat(),
+        }
+        self._write_current(current)
+        self.refresh()
+        self._prune(current['deleted'],snapshot)
+        print(f"Compacted {len(targets)} vector store segments, dropped {int((~keep).sum())} deleted rows at snapshot {self.version}.")
+
+    def _write_tombstones(self,snapshot:Snapshot,version:int) -> Optional[str]:
+        """
+            Returns the tombstone file of the next snapshot, written when deletions were staged (current ones plus staged ones).
+        """
+        if not self._staged_deleted:
+            return snapshot.tombstones.name if snapshot.tombstones is not None else None
+        return self._save_tombstones(np.union1d(snapshot.deleted,np.concatenate(self._staged_deleted)),version)
+
+    def _save_tombstones(self,deleted:np.ndarray,version:int) -> str:
+        deleted = np.asarray(deleted,dtype=np.int64)
+        name = f"deleted_{version:06d}.npy"
+        self.tombstones_dir.mkdir(parents=True,exist_ok=True)
+        tmp_path = self.tombstones_dir/f".tmp_{name}"
+        with open(tmp_path,"wb") as f:
+            np.save(f,deleted)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path,self.tombstones_dir/name)
+        return name
+
+    def _prune(self,current_tombstones:Optional[str],previous:Snapshot):
+        # The files of the previous snapshot are kept for readers that are loading the snapshot just replaced:
+        # its tombstones, and the segments it still used (the ones it retired go now).
+        keep = {current_tombstones,previous.tombstones.name if previous.tombstones is not None else None}
+        for path in self.tombstones_dir.glob("deleted_*.npy"):
+            if path.name not in keep:
+                path.unlink(missing_ok=True)
+        for name in previous.retired:
+            shutil.rmtree(self.segments_dir/name,ignore_errors=True)
+
+    def delete_rows(self,rows:np.ndarray):
+        """
+            Stages tombstones for global rows of the current snapshot; they disappear from lookups and searches at the next publish.
+        """
+        rows = np.asarray(rows,dtype=np.int64)
+        if rows.size:
+            with self._lock:
+                self._staged_deleted.append(rows)
+
+    def discard_staged(self):
+        """
+            Drops rows staged since the last publish and removes their unpublished segment files.
+        """
+        with self._lock:
+            for name in self._staged_segments:
+                shutil.rmtree(self.segments_dir/name,ignore_errors=True)
+            self._pending_vectors,self._pending_meta,self._pending_rows = [],[],0
+            self._staged_segments,self._staged_sources,self._staged_deleted = [],[],[]
+
+    def search_exact(self,queries:np.ndarray,k:int,snapshot:Snapshot=None,start_row:int=0):
+        """
+            Exact, vectorised top-k cosine search over a snapshot (the current one by default).
+            Args:
+                queries(np.ndarray) : (n_queries, dimension) or (dimension,) query embeddings.
+                k(int) : Results per query.
+                snapshot(Snapshot) : Snapshot to search, so callers can pin one across several calls.
+                start_row(int) : Only rows from this global row id onwards are scored.
+            Returns:
+                tuple[np.ndarray,np.ndarray] : (scores, rows) sorted by descending score, each (n_queries, <=k).
+        """
+        snapshot = self.refresh() if snapshot is None else snapshot
+        queries = normalize_rows(queries)
+        best_scores = np.empty((queries.shape[0],0),dtype=np.float32)
+        best_rows = np.empty((queries.shape[0],0),dtype=np.int64)
+        for seg_idx,(seg,offset) in enumerate(zip(snapshot.segments,snapshot.offsets)):
+            skip = max(0,start_row - int(offset))
+            if skip >= len(seg):
+                continue
+            deleted = snapshot.segment_deleted(seg_idx)
+            exclude = deleted[deleted >= skip] - skip if deleted.size else None
+            scores,rows = block_top_k(queries,seg.vectors[skip:],k,int(offset)+skip,self.block_rows,exclude)
+            best_scores,best_rows = merge_top_k(best_scores,best_rows,scores,rows,k)
+        best_scores,best_rows = sort_top_k(best_scores,best_rows)
+        return best_scores,np.where(np.isneginf(best_scores),-1,best_rows)
+
+    def search_subset(self,queries:np.ndarray,k:int,rows:np.ndarray,snapshot:Snapshot=None):
+        """
+            Exact top-k cosine search restricted to the given global rows, e.g. the candidates of a metadata filter.
+            The candidate vectors are gathered and scored search_block_rows at a time.
+            Returns:
+                tuple[np.ndarray,np.ndarray] : (scores, rows) sorted by descending score, each (n_queries, <=k).
+        """
+        snapshot = self.refresh() if snapshot is None else snapshot
+        queries = normalize_rows(queries)
+        rows = np.asarray(rows,dtype=np.int64)
+        rows = rows[~snapshot.is_deleted(rows)]
+        best_scores = np.empty((queries.shape[0],0),dtype=np.float32)
+        best_rows = np.empty((queries.shape[0],0),dtype=np.int64)
+        for start in range(0,len(rows),self.block_rows):
+            block_rows = rows[start:start+self.block_rows]
+            scores,idx = block_top_k(queries,snapshot.vectors(block_rows),k,0,self.block_rows)
+            best_scores,best_rows = merge_top_k(best_scores,best_rows,scores,block_rows[idx],k)
+        return sort_top_k(best_scores,best_rows)
+
+    def search_rows(self,queries:np.ndarray,k:int,snapshot:Snapshot=None,exact:bool=False,nprobe:int=None):
+        """
+            Top-k cosine search, approximate through the IVF-PQ index when one is loaded.
+            Rows appended after the index was last synced are scored exactly and merged in, so new rows are never missed.
+            Tombstoned rows stay in the index until their segment is compacted; the index masks them before its candidate cut.
+            An index of another generation (rows renumbered by a compaction it has not followed yet) is not used.
+            Args:
+                queries(np.ndarray) : (n_queries, dimension) or (dimension,) query embeddings.
+                k(int) : Results per query.
+                snapshot(Snapshot) : Snapshot to search, defaults to the current one.
+                exact(bool) : Force brute-force search.
+                nprobe(int) : Override of the index nprobe.
+            Returns:
+                tuple[np.ndarray,np.ndarray] : (scores, rows) sorted by descending score.
+        """
+        snapshot = self.refresh() if snapshot is None else snapshot
+        index = self.ann_index
+        if exact or index is None or index.n_indexed == 0 or index.generation != snapshot.generation:
+            return self.search_exact(queries,k,snapshot)
+        n_indexed = min(index.n_indexed,snapshot.count)
+        scores,rows = index.search(queries,min(snapshot.count,k),nprobe=nprobe,refine=snapshot.vectors,exclude=snapshot.deleted)
+        if n_indexed < snapshot.count:
+            tail_scores,tail_rows = self.search_exact(queries,k,snapshot,start_row=n_indexed)
+            scores,rows = merge_top_k(scores,rows,tail_scores,tail_rows,k)
+            scores,rows = sort_top_k(scores,rows)
+        keep = min(k,int((rows >= 0).sum(axis=1).max(initial=0)))
+        return scores[:,:keep],rows[:,:keep]
+
+    def reload_ann_index(self) -> Optional[IVFPQIndex]:
+        """
+            Reloads the IVF-PQ index saved next to the segments, e.g. after another process synced it.
+        """
+        if self.ann_config['enabled']:
+            self.ann_index = IVFPQIndex.load(self.ann_path)
+        return self.ann_index
+
+    def update_ann_index(self,force_build:bool=False) -> Optional[IVFPQIndex]:
+        """
+            Keeps the IVF-PQ index in line with the current snapshot.
+            Builds it (train on a random sample, then add every row) once the store reaches ann.min_rows, afterwards only the rows
+            published since the last sync are inserted. The index is saved next to the segments.
+        """
+        if not self.ann_config['enabled']:
+            return None
+        snapshot = self.refresh()
+        if self.ann_index is not None and self.ann_index.generation != snapshot.generation:
+            # Saved before a compaction that could not remap it (e.g. an interrupted one): rebuilt for the current rows.
+            print("ANN index does not match the compacted vector store, rebuilding it.")
+            self.ann_index = None
+        if self.ann_index is None:
+            if snapshot.count < self.ann_config['min_rows'] and not force_build:
+                return None
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(snapshot.count,min(snapshot.count,self.ann_config['train_sample']),replace=False))
+            index = IVFPQIndex(
+                self.dimension,
+                n_lists=self.ann_config['n_lists'],
+                pq_m=self.ann_config['pq_m'],
+                nprobe=self.ann_config['nprobe'],
+                refine_factor=self.ann_config['refine_factor']
+            )
+            index.generation = snapshot.generation
+            print(f"Training ANN index on {len(sample_rows)} of {snapshot.count} rows.")
+            index.train(snapshot.vectors(sample_rows))
+        else:
+            index = self.ann_index
+        if index.n_indexed < snapshot.count:
+            for start in range(index.n_indexed,snapshot.count,self.block_rows):
+                rows = np.arange(start,min(start+self.block_rows,snapshot.count))
+                index.add(snapshot.vectors(rows),rows)
+            index.save(self.ann_path)
+            print(f"ANN index now covers {index.n_indexed} rows.")
+        self.ann_index = index
+        return index
+
+    def search(self,queries:np.ndarray,k:int=5) -> list[list[dict]]:
+        """
+            Top-k cosine search returning, per query, the metadata of the matching chunks with their score.
+        """
+        snapshot = self.refresh()
+        scores,rows = self.search_rows(queries,k,snapshot)
+        results = []
+        for q_scores,q_rows in zip(scores,rows):
+            found = q_rows >= 0
+            q_scores,q_rows = q_scores[found],q_rows[found]
+            hits = snapshot.row_metadata(q_rows)
+            for hit,score,row in zip(hits,q_scores,q_rows):
+                hit.update({"score":float(score),"row":int(row)})
+            results.append(hits)
+        return results
+
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store() -> LocalVectorStore:
+    """
+        Returns the process wide vector store opened from vector_db_config.
+    """
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = LocalVectorStore()
+    return _vector_store
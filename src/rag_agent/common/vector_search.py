@@ -0,0 +1,60 @@
+import numpy as np
+
+
+def normalize_rows(vectors:np.ndarray) -> np.ndarray:
+    """
+        L2 normalises the rows of a matrix so cosine similarity becomes a dot product.
+    """
+    vectors = np.atleast_2d(np.asarray(vectors,dtype=np.float32))
+    norms = np.linalg.norm(vectors,axis=1,keepdims=True)
+    return vectors / np.maximum(norms,1e-12)
+
+
+def merge_top_k(scores_a:np.ndarray,rows_a:np.ndarray,scores_b:np.ndarray,rows_b:np.ndarray,k:int):
+    """
+        Merges two per-query candidate lists and keeps the k best, unsorted.
+    """
+    scores = np.concatenate([scores_a,scores_b],axis=1)
+    rows = np.concatenate([rows_a,rows_b],axis=1)
+    if scores.shape[1] <= k:
+        return scores,rows
+    keep = np.argpartition(-scores,k-1,axis=1)[:,:k]
+    return np.take_along_axis(scores,keep,axis=1),np.take_along_axis(rows,keep,axis=1)
+
+
+def block_top_k(queries:np.ndarray,vectors:np.ndarray,k:int,row_offset:int=0,block_rows:int=262144,exclude:np.ndarray=None):
+    """
+        Exact top-k inner product search of queries against vectors, scored block by block.
+        Blocks are upcast to float32 before the matrix product, so float16 storage still uses the BLAS path.
+        Args:
+            queries(np.ndarray) : (n_queries, dim) float32, already normalised.
+            vectors(np.ndarray) : (n_rows, dim) matrix, possibly memory mapped.
+            k(int) : Results per query.
+            row_offset(int) : Added to the returned row numbers.
+            block_rows(int) : Rows scored per matrix product.
+            exclude(np.ndarray) : Sorted rows of vectors (before row_offset) that score -inf, e.g. tombstoned rows.
+        Returns:
+            tuple[np.ndarray,np.ndarray] : Unsorted (scores, rows), each (n_queries, <=k).
+    """
+    n_queries = queries.shape[0]
+    best_scores = np.empty((n_queries,0),dtype=np.float32)
+    best_rows = np.empty((n_queries,0),dtype=np.int64)
+    for start in range(0,vectors.shape[0],block_rows):
+        block = np.asarray(vectors[start:start+block_rows],dtype=np.float32)
+        scores = queries @ block.T
+        if exclude is not None:
+            lo,hi = np.searchsorted(exclude,[start,start + block.shape[0]])
+            scores[:,exclude[lo:hi] - start] = -np.inf
+        kk = min(k,scores.shape[1])
+        idx = np.argpartition(-scores,kk-1,axis=1)[:,:kk]
+        best_scores,best_rows = merge_top_k(
+            best_scores,best_rows,
+            np.take_along_axis(scores,idx,axis=1),idx.astype(np.int64) + (row_offset + start),
+            k
+        )
+    return best_scores,best_rows
+
+
+def sort_top_k(scores:np.ndarray,rows:np.ndarray):
+    order = np.argsort(-scores,axis=1,kind="stable")
+    return np.take_along_axis(scores,order,axis=1),np.take_along_axis(rows,order,axis=1)
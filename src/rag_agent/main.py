@@ -1,9 +1,12 @@
 from fastapi import FastAPI, HTTPException , Request , status # type: ignore
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Any,Dict,Optional
 import uvicorn
-from app.app import process_document_search,process_document_upload
+from common.search_coalescer import get_search_coalescer
+from app.app import get_document_upload_status,get_ingestion_jobs,process_document_search,process_document_upload
 INVALID_JSON_ERROR = "Invalid JSON input"
+JOB_NOT_FOUND_ERROR = "Unknown ingestion job"
 
 app = FastAPI()
 
@@ -19,11 +22,12 @@ class QueryPayload(BaseModel):
     session_id : str
     user_query : str
     chat_id : str
+    filters : Optional[Dict[str,Any]] = None
 
 class DocumentPayload(BaseModel):
     session_id : str
 
-@app.post("/document_upload")
+@app.post("/document_upload",status_code=status.HTTP_202_ACCEPTED)
 async def document_upload(request:DocumentPayload):
     try:
 
@@ -31,14 +35,32 @@ async def document_upload(request:DocumentPayload):
         print("Recieved request for document upload.")
         print("Processing document upload with payload : %s",req)
         result = process_document_upload(req)
-        if 'error' in result.keys():
-            print("Error processing request: %s",str(result['error']))
-            raise HTTPException(status_code = 400 , detail=INVALID_JSON_ERROR)
-        else:
-            print("Document upload process successfully.")
     except Exception as e:
         raise HTTPException(status_code = 400,detail = INVALID_JSON_ERROR)
-    
+    if 'error' in result.keys():
+        print("Error processing request: %s",str(result['error']))
+        raise HTTPException(status_code = 400 , detail=INVALID_JSON_ERROR)
+    print(f"Document upload queued as ingestion job {result['job_id']}.")
+    return result
+
+@app.get("/document_upload/{job_id}")
+async def document_upload_status(job_id:str):
+    result = get_document_upload_status(job_id)
+    if result is None:
+        raise HTTPException(status_code = 404,detail = JOB_NOT_FOUND_ERROR)
+    return result
+
+@app.post("/document_search")
+async def document_search(request:QueryPayload):
+    req = request.dict()
+    print("Recieved request for document search.")
+    return await process_document_search(req)
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    get_ingestion_jobs().shutdown()
+    get_search_coalescer().shutdown()
+
 if __name__ == "__main__":
     uvicorn.run(app,host="0.0.0.0",port=8000)
 
@@ -47,3 +69,5 @@ if __name__ == "__main__":
 # curl -X POST http://127.0.0.1:8000/document_upload \
 #      -H "Content-Type: application/json" \
 #      -d '{"session_id": "1234", "file_name": "kpi_data_report.pdf"}'
+
+# curl http://127.0.0.1:8000/document_upload/<job_id>
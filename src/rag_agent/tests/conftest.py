@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+import pytest
+
+RAG_AGENT_DIR = Path(__file__).resolve().parents[1]
+if str(RAG_AGENT_DIR) not in sys.path:
+    sys.path.insert(0,str(RAG_AGENT_DIR))
+
+SINGLETONS = [
+    ("agent.embedding_log","_embedding_log"),
+    ("common.embedding_connection","_embedder"),
+    ("common.embedding_cache","_embedding_cache"),
+    ("common.lexical_index","_lexical_index"),
+    ("common.vector_db_connection","_vector_store"),
+    ("common.query_cache","_query_cache"),
+    ("common.search_coalescer","_search_coalescer"),
+    ("common.metadata_index","_document_sessions"),
+    ("common.metadata_index","_duplicate_aliases"),
+    ("app.app","_ingestion_jobs"),
+]
+
+
+@pytest.fixture
+def offline_env(tmp_path,monkeypatch):
+    """
+        Runs the test from an empty working directory, so every relative intermediate/ and storage/ path of the config
+        lands under tmp_path, with the offline hashing embedder, no embedding cache and fresh process wide singletons.
+    """
+    from utils.config import embedding_cache_config,embedding_config
+    from common.vector_db_config import vector_db_config
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(embedding_config,"backend","hashing")
+    monkeypatch.setitem(embedding_config,"dimension",64)
+    monkeypatch.setitem(embedding_config,"retry_backoff",0.0)
+    monkeypatch.setitem(embedding_cache_config,"enabled",False)
+    monkeypatch.setitem(vector_db_config,"dimension",64)
+    for module_name,attr in SINGLETONS:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            monkeypatch.setattr(module,attr,None)
+    (tmp_path/"storage").mkdir()
+    yield tmp_path
+    embedding_log = sys.modules.get("agent.embedding_log")
+    if embedding_log is not None and embedding_log._embedding_log is not None:
+        embedding_log._embedding_log.close()
@@ -0,0 +1,29 @@
+FILING = (
+    "Net revenue for the fiscal year ended December 31 was ${revenue} million, driven by higher subscription volume in "
+    "North America and Europe, partly offset by unfavorable foreign exchange movements and lower hardware sales. "
+    "Gross margin improved as the company completed the migration of its hosting contracts, while operating expenses "
+    "grew on continued investment in research and development, sales capacity and compliance programs. Management "
+    "expects these trends to continue into the next fiscal year, subject to the risks described in Item 1A of this report."
+)
+
+
+def test_chunks_differing_in_a_number_are_not_duplicates():
+    from agent.document_dedup import DedupIndex
+
+    index = DedupIndex()
+    old = FILING.format(revenue="4,512")
+    assert index.canonical("10k_2022.pdf_aaaaaaaaaaaaaaaa_1-1_0000000000000001",old) is None
+    assert index.canonical("10k_2023.pdf_bbbbbbbbbbbbbbbb_1-1_0000000000000002",FILING.format(revenue="3,981")) is None
+    assert len(index) == 2
+    # The same paragraph with the same figures is still collapsed.
+    assert index.canonical("10k_copy.pdf_cccccccccccccccc_1-1_0000000000000003",old) == "10k_2022.pdf_aaaaaaaaaaaaaaaa_1-1_0000000000000001"
+
+
+def test_numbers_survive_save_and_load(tmp_path):
+    from agent.document_dedup import DedupIndex
+
+    index = DedupIndex()
+    index.canonical("10k_2022.pdf_aaaaaaaaaaaaaaaa_1-1_0000000000000001",FILING.format(revenue="4,512"))
+    index.save(tmp_path/"dedup_index")
+    loaded = DedupIndex.load(tmp_path/"dedup_index")
+    assert loaded.canonical("10k_2023.pdf_bbbbbbbbbbbbbbbb_1-1_0000000000000002",FILING.format(revenue="3,981")) is None
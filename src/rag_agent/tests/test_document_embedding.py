@@ -0,0 +1,38 @@
+from datetime import datetime
+import numpy as np
+import pytest
+
+pytest.importorskip("dotenv")
+
+
+def test_embedded_rows_stay_numpy_until_the_vector_block(offline_env):
+    from agent.document_embedding import embed_batch,save_batch
+    from agent.embedded_batch import load_embedded_batch
+    from common.embedding_connection import get_embedder
+
+    texts = [f"revenue grew {idx} percent on pricing" for idx in range(5)]
+    batch = embed_batch([{"document_text":text,"unique_id":f"chunk_{idx}"} for idx,text in enumerate(texts)])
+    assert all(isinstance(chunk['embedding'],np.ndarray) and chunk['embedding'].dtype == np.float32 for chunk in batch)
+
+    path = save_batch(batch,datetime.now(),0,str(offline_env/"embedded"))
+    vectors,metadata = load_embedded_batch(path)
+    assert [row['unique_id'] for row in metadata] == [f"chunk_{idx}" for idx in range(5)]
+    np.testing.assert_allclose(np.asarray(vectors,dtype=np.float32),get_embedder().embed(texts),atol=1e-3)
+
+
+def test_embedding_cache_keeps_a_running_entry_count(tmp_path):
+    from common.embedding_cache import EmbeddingCache
+
+    cache = EmbeddingCache(str(tmp_path/"cache.sqlite"),max_entries=3)
+    statements = []
+    cache.conn.set_trace_callback(statements.append)
+    vectors = np.eye(4,dtype=np.float32)
+    cache.put_many("model",["a","b"],vectors[:2])
+    cache.put_many("model",["b","c","d"],vectors[1:])
+    assert not any("COUNT" in statement for statement in statements)
+    assert cache.n_entries == 3 and cache.evictions == 1
+    assert cache.conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0] == 3
+    # "a" was the least recently used entry; "b" was refreshed by the second insert.
+    assert [vector is not None for vector in cache.get_many("model",["a","b","c","d"])] == [False,True,True,True]
+    cache.close()
+    assert EmbeddingCache(str(tmp_path/"cache.sqlite"),max_entries=3).n_entries == 3
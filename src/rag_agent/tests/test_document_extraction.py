@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("bs4")
+
+
+def write_inputs(folder):
+    folder.mkdir(parents=True,exist_ok=True)
+    (folder/"broken.pdf").write_bytes(b"%PDF-1.7\nthis is not a pdf body")
+    (folder/"notes.txt").write_text("Quarterly revenue grew on pricing.\n\nMargins held steady.",encoding="utf-8")
+    return sorted(folder.iterdir())
+
+
+@pytest.mark.parametrize("parallel",[False,True])
+def test_corrupt_file_is_reported_as_failed(tmp_path,parallel):
+    from agent.document_extraction import DocumentExtractor
+
+    files = write_inputs(tmp_path/"input")
+    extractor = DocumentExtractor(files,str(tmp_path/"extracted"),parallel=parallel,max_workers=2)
+    extracted = extractor.run()
+
+    assert [fn.name for fn in extractor.failed_files] == ["broken.pdf"]
+    assert [fn.name for fn in extracted] == ["notes.txt.jsonl"]
+    assert not (tmp_path/"extracted"/"broken.pdf.jsonl").exists()
+
+
+def test_pdf_text_is_split_across_page_breaks(tmp_path):
+    import fitz
+    from agent.document_embedding import format_chunk
+    from agent.document_reader import iter_pdf_records
+    from agent.text_splitter import FastTextSplitter
+
+    pages = [
+        "Annual report of the Example Group for the shareholders meeting, prepared by the board.",
+        "Operating revenue for the year rose to 4,512 million, driven by",
+        "higher volumes in the retail segment.\n\nThe board proposes a dividend of 1.20 per share.",
+    ]
+    pdf = fitz.open()
+    for text in pages:
+        pdf.new_page().insert_text((72,72),text)
+    pdf.save(str(tmp_path/"report.pdf"))
+    pdf.close()
+
+    splitter = FastTextSplitter(chunk_size=120,chunk_overlap=0)
+    records = [record for record in iter_pdf_records(tmp_path/"report.pdf",splitter) if record['type'] == "text"]
+
+    spanning = [record for record in records if record['page'] != record['page_end']]
+    assert len(spanning) == 1
+    record = spanning[0]
+    assert (record['page'],record['page_end']) == (1,2)
+    assert "driven by" in record['content'] and "retail segment" in record['content']
+    assert [r['chunk_index'] for r in records] == list(range(len(records)))
+    page_text = fitz.open(str(tmp_path/"report.pdf"))[1].get_text()
+    assert page_text[record['start_index']:].startswith("Operating revenue")
+
+    row = format_chunk(record,"report.pdf.jsonl","file:///report.pdf",0,0,"0"*64)
+    assert (row['page_start'],row['page_end']) == (1,2)
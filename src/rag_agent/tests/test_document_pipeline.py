@@ -0,0 +1,252 @@
+from pathlib import Path
+import numpy as np
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("bs4")
+
+
+def write_text_inputs(storage,names:list[str]):
+    for idx,name in enumerate(names):
+        paragraphs = [f"{name} segment {idx} revenue grew {p} percent in quarter {p % 4 + 1} on pricing." for p in range(40)]
+        (storage/name).write_text("\n\n".join(paragraphs),encoding="utf-8")
+
+
+def run_batch_pipeline(process_files:bool=False):
+    from agent.Document_Pipeline import DocumentPipeline
+
+    DocumentPipeline().run(True,process_files,True,True,streaming=False)
+
+
+def load_manifest():
+    from agent.ingestion_manifest import IngestionManifest
+    from utils.config import folders
+
+    return IngestionManifest(folders['manifest'])
+
+
+def test_failed_embedding_batches_leave_their_files_pending(offline_env,monkeypatch):
+    import agent.document_embedding as document_embedding
+    from utils.config import embedding_config
+
+    storage = offline_env/"storage"
+    write_text_inputs(storage,["good.txt","bad.txt"])
+    monkeypatch.setitem(embedding_config,"max_retries",0)
+    monkeypatch.setitem(embedding_config,"batch_size",1)
+    embed_batch = document_embedding.embed_batch
+
+    def failing_embed_batch(batch):
+        if any(chunk['document_name'].startswith("bad") for chunk in batch):
+            raise RuntimeError("embedding service unavailable")
+        return embed_batch(batch)
+
+    monkeypatch.setattr(document_embedding,"embed_batch",failing_embed_batch)
+    run_batch_pipeline()
+    manifest = load_manifest()
+    assert manifest.is_done('embedded',storage/"good.txt")
+    assert not manifest.is_done('embedded',storage/"bad.txt")
+
+    monkeypatch.setattr(document_embedding,"embed_batch",embed_batch)
+    run_batch_pipeline()
+    assert load_manifest().is_done('embedded',storage/"bad.txt")
+
+
+def test_failed_extraction_is_not_marked_done(offline_env):
+    storage = offline_env/"storage"
+    write_text_inputs(storage,["notes.txt"])
+    (storage/"broken.pdf").write_bytes(b"%PDF-1.7\nthis is not a pdf body")
+    run_batch_pipeline()
+    manifest = load_manifest()
+    assert manifest.is_done('extracted',storage/"notes.txt")
+    assert not manifest.is_done('extracted',storage/"broken.pdf")
+    assert not manifest.is_done('embedded',storage/"broken.pdf")
+
+    # Replacing the file with a readable one gets it extracted on the next run.
+    import fitz
+
+    (storage/"broken.pdf").unlink()
+    with fitz.open() as pdf:
+        pdf.new_page().insert_text((72,72),"Revenue grew on pricing.")
+        pdf.save(str(storage/"broken.pdf"))
+    run_batch_pipeline()
+    assert load_manifest().is_done('embedded',storage/"broken.pdf")
+
+
+def test_modified_document_replaces_its_previous_rows(offline_env):
+    from common.lexical_index import get_lexical_index
+    from common.vector_db_connection import get_vector_store
+
+    storage = offline_env/"storage"
+    (storage/"report.txt").write_text("\n\n".join(f"Old figures for quarter {p}, revenue flat." for p in range(20)),encoding="utf-8")
+    run_batch_pipeline()
+    store = get_vector_store()
+    old_ids = set(store.refresh().column("unique_id"))
+    assert old_ids and "report" in get_lexical_index().search("old figures flat")[0][0]
+
+    (storage/"report.txt").write_text("\n\n".join(f"New figures for quarter {p}, revenue grew." for p in range(20)),encoding="utf-8")
+    run_batch_pipeline()
+    snapshot = store.refresh()
+    live = snapshot.column("unique_id")[~snapshot.is_deleted(np.arange(snapshot.count))]
+    assert len(live) and not old_ids & set(live)
+    assert (snapshot.find_rows(sorted(old_ids)) == -1).all()
+    _,rows = store.search_rows(np.ones(64,dtype=np.float32),snapshot.count,snapshot)
+    rows = rows[0][rows[0] >= 0]
+    assert set(snapshot.column_values("unique_id",rows)) == set(live)
+
+    from common.lexical_index import InvertedIndex
+    from common.vector_db_config import lexical_index_config
+
+    for index in (get_lexical_index(),InvertedIndex.load(lexical_index_config['path'])):
+        assert not {key for key,_ in index.search("old figures flat",k=50)} & old_ids
+
+
+def test_inputs_sharing_a_stem_keep_separate_outputs(offline_env):
+    from common.vector_db_connection import get_vector_store
+    from utils.config import folders
+
+    storage = offline_env/"storage"
+    write_text_inputs(storage,["report.txt"])
+    (storage/"report.csv").write_text("quarter,revenue\n" + "\n".join(f"Q{q},{100 + q}" for q in range(1,5)),encoding="utf-8")
+    run_batch_pipeline(process_files=True)
+    manifest = load_manifest()
+    outputs = {manifest.stage_output('extracted',storage/name) for name in ("report.txt","report.csv")}
+    assert {Path(output).name for output in outputs} == {"report.txt.jsonl","report.csv.jsonl"}
+    assert all(manifest.is_done(stage,storage/name) for stage in ('processed','embedded') for name in ("report.txt","report.csv"))
+    assert Path(manifest.stage_output('processed',storage/"report.csv")).name == "report.csv.jsonl"
+    assert sorted(p.name for p in Path(folders['extracted']).glob("*.jsonl")) == ["report.csv.jsonl","report.txt.jsonl"]
+    assert set(get_vector_store().refresh().column("document_name")) == {"report.txt","report.csv"}
+
+
+def test_duplicates_point_at_store_rows_and_follow_a_modified_canonical(offline_env,monkeypatch):
+    from agent.document_dedup import DedupIndex,key_document
+    from common.vector_db_connection import get_vector_store
+    from utils.config import dedup_config
+    from utils.utils import iter_records
+
+    monkeypatch.setitem(dedup_config,"enabled",True)
+
+    def paragraphs(word:str) -> str:
+        return "\n\n".join(
+            f"Paragraph {p} of the {word} annual filing: segment revenue grew {p} percent on pricing, volume and mix "
+            f"while operating costs in region {p % 7} stayed flat against the prior year plan."
+            for p in range(20)
+        )
+
+    def marks(name:str) -> list:
+        extracted = load_manifest().stage_output('extracted',storage/name)
+        return [record.get('duplicate_of') for record in iter_records(extracted) if isinstance(record.get('content'),str)]
+
+    storage = offline_env/"storage"
+    (storage/"source.txt").write_text(paragraphs("original"),encoding="utf-8")
+    run_batch_pipeline()
+    (storage/"copy.txt").write_text(paragraphs("original") + "\n\nAppendix: signed by the auditor.",encoding="utf-8")
+    run_batch_pipeline()
+    pointers = [mark for mark in marks("copy.txt") if mark]
+    assert pointers
+    snapshot = get_vector_store().refresh()
+    assert (snapshot.find_rows(pointers) >= 0).all()
+    assert set(snapshot.column("document_name")) == {"source.txt"}
+
+    # The canonical document changes: its old index entries are evicted and the copy is deduplicated and embedded again.
+    (storage/"source.txt").write_text(paragraphs("restated"),encoding="utf-8")
+    run_batch_pipeline()
+    assert not any(marks("copy.txt"))
+    assert load_manifest().is_done('upserted',storage/"copy.txt")
+    snapshot = get_vector_store().refresh()
+    live = snapshot.column("unique_id")[~snapshot.is_deleted(np.arange(snapshot.count))]
+    assert {key_document(uid)[0] for uid in live} == {"source.txt","copy.txt"}
+    index = DedupIndex.load(dedup_config['index_path'])
+    source_hashes = {key_document(key)[1] for key in index.keys if key_document(key)[0] == "source.txt"}
+    assert source_hashes == {key_document(uid)[1] for uid in live if key_document(uid)[0] == "source.txt"}
+
+
+def failing_ocr(image_bytes:bytes,lang:str) -> str:
+    raise RuntimeError("tesseract crashed")
+
+
+def working_ocr(image_bytes:bytes,lang:str) -> str:
+    return "Scanned appendix: revenue by region grew eight percent on pricing and volume."
+
+
+def test_failed_image_ocr_leaves_the_file_pending(offline_env,monkeypatch):
+    import fitz
+    import agent.document_ocr as document_ocr
+    from utils.config import ocr_config
+    from utils.utils import iter_records
+
+    storage = offline_env/"storage"
+    with fitz.open() as pdf:
+        page = pdf.new_page()
+        page.insert_text((72,72),"Scan")
+        page.insert_image(fitz.Rect(72,100,272,300),pixmap=fitz.Pixmap(fitz.csRGB,fitz.IRect(0,0,200,200),0))
+        pdf.save(str(storage/"scan.pdf"))
+    monkeypatch.setitem(ocr_config,"enabled",True)
+    monkeypatch.setattr(document_ocr,"_ocr_image",failing_ocr)
+    run_batch_pipeline()
+    manifest = load_manifest()
+    assert manifest.is_done('extracted',storage/"scan.pdf")
+    assert not manifest.is_done('ocr',storage/"scan.pdf")
+
+    monkeypatch.setattr(document_ocr,"_ocr_image",working_ocr)
+    run_batch_pipeline()
+    manifest = load_manifest()
+    assert manifest.is_done('ocr',storage/"scan.pdf") and manifest.is_done('upserted',storage/"scan.pdf")
+    records = iter_records(manifest.stage_output('extracted',storage/"scan.pdf"))
+    assert any(record.get('type') == "image_ocr" for record in records)
+
+
+def test_ocr_reads_scanned_pages_in_bounded_windows(offline_env,monkeypatch):
+    import fitz
+    import agent.document_ocr as document_ocr
+    from utils.config import ocr_config
+
+    def pixmap(shade:int):
+        pix = fitz.Pixmap(fitz.csRGB,fitz.IRect(0,0,200,200),0)
+        pix.set_rect(pix.irect,(shade,shade,shade))
+        return pix
+
+    path = offline_env/"storage"/"scan.pdf"
+    with fitz.open() as pdf:
+        for page_number in range(7):
+            page = pdf.new_page()
+            page.insert_image(fitz.Rect(72,100,272,300),pixmap=pixmap(page_number * 30))
+            page.insert_image(fitz.Rect(300,100,500,300),pixmap=pixmap(255))
+        pdf.save(str(path))
+    monkeypatch.setitem(ocr_config,"window_pages",3)
+    monkeypatch.setattr(document_ocr,"_ocr_image",working_ocr)
+    windows = []
+    ocr_images = document_ocr.OcrStage.ocr_images
+
+    def recording_ocr_images(self,images):
+        windows.append(len(images))
+        return ocr_images(self,images)
+
+    monkeypatch.setattr(document_ocr.OcrStage,"ocr_images",recording_ocr_images)
+    with document_ocr.OcrStage() as stage:
+        records,n_failed = stage.ocr_records(path)
+    # 7 distinct page images plus a logo repeated on every page, read 3 pages at a time.
+    assert n_failed == 0 and windows == [4,3,1]
+    assert [record['page'] for record in records] == [0,0,1,2,3,4,5,6]
+    assert sum(record['chunk_index'] == 2 for record in records) == 1
+
+
+def test_processing_reports_skipped_item_types_once(offline_env,capsys):
+    from agent.document_processing import DocumentProcessor
+    from utils.utils import JsonlWriter
+
+    files = []
+    for name in ["a.pdf","b.pdf"]:
+        records = [{"type":"text","content":f"{name} revenue grew on pricing.","page":0}]
+        records += [{"type":"hyperlinks","content":["https://example.com"],"page":page} for page in range(3)]
+        files.append(offline_env/f"{name}.jsonl")
+        with JsonlWriter(files[-1]) as writer:
+            writer.write_many(records)
+
+    processor = DocumentProcessor(files,str(offline_env/"processed"))
+    assert len(processor.run()) == 2
+
+    out = capsys.readouterr().out
+    assert "not processed." not in out
+    assert out.count("Items not processed by type: {'hyperlinks': 6}") == 1
+    assert out.count("Process usage counts") == 1
+    assert processor.type_counts == {"text":2,"hyperlinks":6}
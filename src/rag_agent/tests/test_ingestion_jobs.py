@@ -0,0 +1,105 @@
+import os
+import time
+from pathlib import Path
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("bs4")
+
+
+def ingest_then_wait(job):
+    """
+        Job body of the tests: runs the pipeline, records the process it ran in and holds the job open until released.
+    """
+    from agent.Document_Pipeline import DocumentPipeline
+
+    DocumentPipeline(progress=job).run(True,False,True,True,streaming=False)
+    Path("job_pid").write_text(str(os.getpid()),encoding="utf-8")
+    deadline = time.monotonic() + 30
+    while not Path("release").exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def failing_job(job):
+    raise ValueError("no documents to read")
+
+
+def poll(manager,job_id:str,until,timeout:float=30.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = manager.get(job_id).to_dict()
+        if until(status):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Job did not reach the expected state, last status {status}")
+
+
+def test_job_runs_in_its_own_process_and_reports_progress(offline_env):
+    from app.ingestion_jobs import JOB_RUNNING,JOB_SUCCEEDED,FILE_DONE,IngestionJobManager
+
+    for name in ("alpha.txt","beta.txt"):
+        (offline_env/"storage"/name).write_text(f"{name} revenue grew on pricing.\n\nMargins held.",encoding="utf-8")
+    finished = []
+    manager = IngestionJobManager(ingest_then_wait,after_job=finished.append,start_method="fork")
+    job = manager.submit("session-1")
+    try:
+        # Every stage of both files is reported done while the job process is still running.
+        status = poll(manager,job.job_id,lambda s:s['progress']['done'].get('upserted') == 2)
+        assert status['status'] == JOB_RUNNING
+        assert set(status['files']['alpha.txt'].values()) == {FILE_DONE}
+        assert not finished
+        (offline_env/"release").touch()
+        status = poll(manager,job.job_id,lambda s:s['status'] != JOB_RUNNING)
+    finally:
+        (offline_env/"release").touch()
+        manager.shutdown()
+    assert status['status'] == JOB_SUCCEEDED
+    assert int((offline_env/"job_pid").read_text()) != os.getpid()
+    assert finished == [job]
+    assert sorted(job.new_files) == ["alpha.txt","beta.txt"]
+
+
+def test_job_failure_in_the_job_process_fails_the_job(offline_env):
+    from app.ingestion_jobs import JOB_FAILED,IngestionJobManager
+
+    manager = IngestionJobManager(failing_job,start_method="fork")
+    job = manager.submit("session-1")
+    try:
+        status = poll(manager,job.job_id,lambda s:s['status'] == JOB_FAILED)
+    finally:
+        manager.shutdown()
+    assert status['error'] == "no documents to read"
+
+
+def test_status_endpoint_answers_while_the_job_runs(offline_env,monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("pandas")
+    from fastapi.testclient import TestClient
+    from utils.config import ingestion_jobs_config
+    import app.app as app_module
+    import main
+
+    # fork, so the job process inherits the offline configuration of the test.
+    monkeypatch.setitem(ingestion_jobs_config,"start_method","fork")
+    monkeypatch.setattr(app_module,"run_document_ingestion",ingest_then_wait)
+    (offline_env/"storage"/"alpha.txt").write_text("Revenue grew on pricing.\n\nMargins held.",encoding="utf-8")
+    client = TestClient(main.app)
+    job_id = client.post("/document_upload",json={"session_id":"session-1"}).json()['job_id']
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            start = time.monotonic()
+            status = client.get(f"/document_upload/{job_id}").json()
+            assert time.monotonic() - start < 1.0
+            if status['status'] == "running" and status['progress']['done'].get('upserted') == 1:
+                break
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        (offline_env/"release").touch()
+        while status['status'] == "running" and time.monotonic() < deadline:
+            time.sleep(0.02)
+            status = client.get(f"/document_upload/{job_id}").json()
+    finally:
+        (offline_env/"release").touch()
+        app_module.get_ingestion_jobs().shutdown()
+    assert status['status'] == "succeeded"
@@ -0,0 +1,28 @@
+import pytest
+
+
+@pytest.mark.parametrize("config_name,key,value",[
+    ("splitter_config","chunk_size",500),
+    ("splitter_config","chunk_overlap",50),
+    ("splitter_config","length","tokens"),
+    ("table_config","storage","json"),
+    ("reader_config","csv_max_rows",10),
+    ("dedup_config","threshold",0.9),
+    ("processor_config","chunk_method","by_type"),
+])
+def test_output_shaping_settings_change_the_config_version(monkeypatch,config_name,key,value):
+    import utils.config
+    from agent.ingestion_manifest import pipeline_config_version
+
+    before = pipeline_config_version()
+    monkeypatch.setitem(getattr(utils.config,config_name),key,value)
+    assert pipeline_config_version() != before
+
+
+def test_paths_do_not_change_the_config_version(monkeypatch):
+    from agent.ingestion_manifest import pipeline_config_version
+    from utils.config import dedup_config
+
+    before = pipeline_config_version()
+    monkeypatch.setitem(dedup_config,"index_path","elsewhere/dedup_index")
+    assert pipeline_config_version() == before
@@ -0,0 +1,90 @@
+import time
+import numpy as np
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("bs4")
+
+from tests.test_document_pipeline import run_batch_pipeline,write_text_inputs
+
+
+def test_document_hash_is_a_stable_filter_key(offline_env):
+    from common.metadata_index import filter_rows
+    from common.vector_db_connection import get_vector_store
+    from utils.utils import file_content_hash
+
+    storage = offline_env/"storage"
+    write_text_inputs(storage,["alpha.txt","beta.txt"])
+    run_batch_pipeline()
+    alpha_hash = file_content_hash(storage/"alpha.txt")[:16]
+    snapshot = get_vector_store().refresh()
+    rows = filter_rows(snapshot,{"document_hash":alpha_hash})
+    assert rows.size and set(snapshot.column_values("document_name",rows)) == {"alpha.txt"}
+    alpha_ids = set(snapshot.column_values("unique_id",rows))
+
+    # The next run embeds only beta, which then gets document_id 0 like alpha did; the hash still selects alpha alone.
+    (storage/"beta.txt").write_text("Beta was rewritten.\n\nCosts fell.",encoding="utf-8")
+    run_batch_pipeline()
+    # Row ids may be renumbered by a compaction of beta's old rows, the selected chunks stay the same.
+    snapshot = get_vector_store().refresh()
+    assert set(snapshot.column_values("unique_id",filter_rows(snapshot,{"document_hash":alpha_hash}))) == alpha_ids
+    with pytest.raises(ValueError):
+        filter_rows(snapshot,{"document_id":0})
+
+
+def test_every_file_of_an_upload_is_recorded_for_its_session(offline_env,monkeypatch):
+    pytest.importorskip("pandas")
+    import app.app as app_module
+    from app.ingestion_jobs import JOB_SUCCEEDED
+    from common.metadata_index import get_document_sessions
+    from utils.config import ingestion_jobs_config
+
+    monkeypatch.setitem(ingestion_jobs_config,"start_method","fork")
+    write_text_inputs(offline_env/"storage",["alpha.txt"])
+    for session_id in ("session-1","session-2"):
+        job = app_module.get_ingestion_jobs().submit(session_id)
+        while job.status not in (JOB_SUCCEEDED,"failed"):
+            time.sleep(0.02)
+        assert job.status == JOB_SUCCEEDED
+    # The second upload ingested nothing new, the document is still recorded for its session.
+    assert get_document_sessions().documents(["session-2"]) == {"alpha.txt"}
+    app_module.get_ingestion_jobs().shutdown()
+
+
+def test_document_filter_reaches_the_canonical_rows_of_deduplicated_chunks(offline_env,monkeypatch):
+    from common.hybrid_retrieval import hybrid_search
+    from common.metadata_index import filter_rows
+    from common.vector_db_connection import get_vector_store
+    from tests.test_document_pipeline import load_manifest
+    from utils.config import dedup_config
+    from utils.utils import iter_records
+
+    monkeypatch.setitem(dedup_config,"enabled",True)
+    filing = "\n\n".join(
+        f"Item {p}: segment revenue grew {p} percent on pricing, volume and mix while operating costs in region {p % 7} "
+        f"stayed flat against the prior year plan and the outlook was unchanged by management."
+        for p in range(20)
+    )
+    storage = offline_env/"storage"
+    (storage/"10k_2022.txt").write_text(filing,encoding="utf-8")
+    run_batch_pipeline()
+    (storage/"10k_2023.txt").write_text(filing + "\n\nItem 21: the auditor signed without qualification.",encoding="utf-8")
+    run_batch_pipeline()
+    extracted = load_manifest().stage_output('extracted',storage/"10k_2023.txt")
+    pointers = {record['duplicate_of'] for record in iter_records(extracted) if record.get('duplicate_of')}
+    assert pointers
+
+    snapshot = get_vector_store().refresh()
+    rows = filter_rows(snapshot,{"document_name":"10k_2023.txt"})
+    assert pointers <= set(snapshot.column_values("unique_id",rows))
+    assert set(snapshot.column_values("document_name",filter_rows(snapshot,{"document_name":"10k_2022.txt"}))) == {"10k_2022.txt"}
+    assert not filter_rows(snapshot,{"document_name":"10k_2023.txt","page_range":[50,60]}).size
+    hits = hybrid_search("segment revenue grew on pricing",k=5,filters={"document_name":"10k_2023.txt"})
+    assert hits and {hit['unique_id'] for hit in hits} <= set(snapshot.column_values("unique_id",rows))
+
+    # Once the 2022 filing changes, the 2023 chunks are embedded themselves and the aliases are dropped.
+    (storage/"10k_2022.txt").write_text(filing.replace("flat","lower"),encoding="utf-8")
+    run_batch_pipeline()
+    snapshot = get_vector_store().refresh()
+    rows = filter_rows(snapshot,{"document_name":"10k_2023.txt"})
+    assert set(snapshot.column_values("document_name",rows)) == {"10k_2023.txt"}
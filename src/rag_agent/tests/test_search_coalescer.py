@@ -0,0 +1,50 @@
+import asyncio
+import gc
+import numpy as np
+import pytest
+
+
+def build_store(path,dimension:int=16):
+    from common.vector_db_connection import LocalVectorStore
+
+    store = LocalVectorStore(path=str(path),dimension=dimension)
+    vectors = np.random.default_rng(0).standard_normal((50,dimension),dtype=np.float32)
+    store.append(vectors,[
+        {"document_id":0,"document_name":"doc","document_hash":"0"*16,"chunk_id":idx,"page_start":1,"page_end":1,"unique_id":f"doc_{idx}"}
+        for idx in range(50)
+    ])
+    store.publish()
+    return store,vectors
+
+
+def test_coalesced_searches_resolve_while_tasks_are_collected(tmp_path):
+    from common.search_coalescer import SearchCoalescer
+
+    store,vectors = build_store(tmp_path/"store")
+    coalescer = SearchCoalescer(store,window_ms=1,max_batch=4,workers=1)
+
+    async def run():
+        searches = [asyncio.ensure_future(coalescer.search(vectors[idx],3)) for idx in range(10)]
+        gc.collect()
+        return await asyncio.wait_for(asyncio.gather(*searches),timeout=5)
+
+    results = asyncio.run(run())
+    assert [int(rows[0]) for _,rows,_ in results] == list(range(10))
+    assert not coalescer._tasks and coalescer.stats()['queries'] == 10
+    coalescer.shutdown()
+
+
+def test_a_failing_batch_fails_every_waiting_search(tmp_path):
+    from common.search_coalescer import SearchCoalescer
+
+    store,vectors = build_store(tmp_path/"store")
+    coalescer = SearchCoalescer(store,window_ms=1,max_batch=4,workers=1)
+
+    async def run():
+        # Vectors of different lengths cannot be stacked into one batch.
+        searches = [coalescer.search(vectors[0],3),coalescer.search(vectors[1][:8],3)]
+        return await asyncio.wait_for(asyncio.gather(*searches,return_exceptions=True),timeout=5)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result,ValueError) for result in results)
+    coalescer.shutdown()
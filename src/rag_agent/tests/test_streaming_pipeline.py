@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("bs4")
+
+
+def write_inputs(storage,n_files:int=3):
+    for idx in range(n_files):
+        paragraphs = [f"Segment {idx} revenue grew {p} percent in quarter {p % 4 + 1} driven by pricing and volume." for p in range(40)]
+        (storage/f"report_{idx}.txt").write_text("\n\n".join(paragraphs),encoding="utf-8")
+
+
+def test_streaming_run_embeds_and_upserts(offline_env):
+    from agent.Document_Pipeline import DocumentPipeline
+    from agent.ingestion_manifest import IngestionManifest
+    from common.vector_db_connection import get_vector_store
+    from utils.config import folders
+
+    write_inputs(offline_env/"storage")
+    DocumentPipeline().run(True,False,True,True,streaming=True)
+
+    store = get_vector_store()
+    n_rows = store.refresh().count
+    assert n_rows > 0
+    manifest = IngestionManifest(folders['manifest'])
+    for fn in sorted((offline_env/"storage").iterdir()):
+        assert manifest.is_done('embedded',fn)
+        assert manifest.is_done('upserted',fn)
+
+    # A second run finds every file done and adds nothing.
+    DocumentPipeline().run(True,False,True,True,streaming=True)
+    assert store.refresh().count == n_rows
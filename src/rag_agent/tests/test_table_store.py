@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.fixture(params=["json","parquet"])
+def storage(request):
+    if request.param == "parquet":
+        pytest.importorskip("pyarrow")
+    return request.param
+
+
+def add_tables(store,n_tables:int,n_rows:int=3):
+    return [store.add(table_id + 1,["quarter","revenue"],[[f"Q{row}",str(row * table_id)] for row in range(n_rows)]) for table_id in range(n_tables)]
+
+
+def test_cells_are_written_in_row_groups(tmp_path,storage):
+    from agent.table_store import TableStore,load_tables
+
+    with TableStore(tmp_path/"report.pdf.tables",storage,row_group_cells=10) as store:
+        pointers = add_tables(store,20)
+        # 6 cells per table: the buffer never holds more than one row group.
+        assert len(store.columns["value"]) < 10 + 6
+    path = tmp_path/pointers[0]['table_file']
+    assert path.exists() and not list(tmp_path.glob("*.tmp"))
+    assert len(load_tables(path)["value"]) == 20 * 6
+    table = load_tables(path,table_id=7)
+    assert table["value"] == ["Q0","0","Q1","7","Q2","14"] and set(table["page"]) == {8}
+
+
+def test_reextraction_without_tables_removes_the_old_file(tmp_path,storage):
+    from agent.table_store import TableStore
+
+    with TableStore(tmp_path/"report.pdf.tables",storage) as store:
+        add_tables(store,2)
+    assert store.path.exists()
+    with TableStore(tmp_path/"report.pdf.tables",storage):
+        pass
+    assert not store.path.exists()
+
+
+def test_failed_extraction_keeps_the_previous_file(tmp_path,storage):
+    from agent.table_store import TableStore,load_tables
+
+    with TableStore(tmp_path/"report.pdf.tables",storage) as store:
+        add_tables(store,2)
+    with pytest.raises(RuntimeError):
+        with TableStore(tmp_path/"report.pdf.tables",storage,row_group_cells=4) as failed:
+            add_tables(failed,5)
+            raise RuntimeError("page 3 could not be read")
+    assert len(load_tables(store.path)["value"]) == 2 * 6
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def metadata(start:int,n:int,document:str) -> list[dict]:
+    return [
+        {"document_id":0,"document_name":document,"document_hash":"0"*16,"chunk_id":idx,"page_start":1,"page_end":1,"unique_id":f"{document}_{idx}"}
+        for idx in range(start,start + n)
+    ]
+
+
+def build_store(path,n_docs:int=4,rows_per_doc:int=200,dimension:int=16):
+    from common.vector_db_connection import LocalVectorStore
+
+    store = LocalVectorStore(path=str(path),dimension=dimension,rows_per_segment=rows_per_doc)
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((n_docs * rows_per_doc,dimension),dtype=np.float32)
+    for doc in range(n_docs):
+        rows = slice(doc * rows_per_doc,(doc + 1) * rows_per_doc)
+        store.append(vectors[rows],metadata(doc * rows_per_doc,rows_per_doc,f"doc{doc}"))
+    store.publish()
+    return store,vectors
+
+
+def test_ann_search_masks_tombstones_before_the_candidate_cut(tmp_path,monkeypatch):
+    from common.ann_index import IVFPQIndex
+    from common.vector_db_config import vector_db_config
+
+    monkeypatch.setitem(vector_db_config,"compact_deleted_fraction",1.1)
+    monkeypatch.setitem(vector_db_config,"ann",{**vector_db_config['ann'],"n_lists":8,"pq_m":0,"nprobe":8,"train_sample":1000})
+    store,vectors = build_store(tmp_path/"store")
+    store.update_ann_index(force_build=True)
+    store.delete_rows(np.arange(0,400))
+    store.publish()
+
+    asked = []
+    search = IVFPQIndex.search
+
+    def recording_search(self,queries,k,**kwargs):
+        asked.append(k)
+        return search(self,queries,k,**kwargs)
+
+    monkeypatch.setattr(IVFPQIndex,"search",recording_search)
+    scores,rows = store.search_rows(vectors[:3],5)
+    assert asked == [5]
+    assert (rows >= 400).all() and rows.shape == (3,5)
+
+
+def test_publish_compacts_mostly_deleted_segments(tmp_path,monkeypatch):
+    from common.vector_db_config import vector_db_config
+    from common.vector_db_connection import LocalVectorStore
+
+    monkeypatch.setitem(vector_db_config,"ann",{**vector_db_config['ann'],"n_lists":8,"pq_m":0,"nprobe":8,"train_sample":1000})
+    store,vectors = build_store(tmp_path/"store")
+    store.update_ann_index(force_build=True)
+    old_segments = [seg.name for seg in store.snapshot.segments]
+    # All of doc1 and a few rows of doc2 go; only doc1's segment passes the threshold.
+    store.delete_rows(np.concatenate([np.arange(200,400),np.arange(400,410)]))
+    store.publish()
+    snapshot = store.refresh()
+    assert snapshot.generation == 1 and snapshot.count == 600 and len(store) == 590
+    assert snapshot.find_rows(["doc1_250"])[0] == -1 and snapshot.find_rows(["doc2_405"])[0] == -1
+    assert snapshot.column_values("unique_id",snapshot.find_rows(["doc3_799"])).tolist() == ["doc3_799"]
+    assert store.ann_index.generation == 1 and store.ann_index.n_indexed == 600
+
+    # Rows are renumbered but every search still returns the right chunk, through the remapped index and after a reopen.
+    for opened in (store,LocalVectorStore(path=str(tmp_path/"store"),dimension=16)):
+        _,rows = opened.search_rows(vectors[[0,650,799]],1)
+        assert opened.refresh().column_values("unique_id",rows[:,0]).tolist() == ["doc0_0","doc3_650","doc3_799"]
+
+    # The retired segment is kept for readers of the previous snapshot until the next publish.
+    assert (tmp_path/"store"/"segments"/old_segments[1]).exists()
+    store.append(vectors[:1],metadata(1000,1,"doc4"))
+    store.publish()
+    assert not (tmp_path/"store"/"segments"/old_segments[1]).exists()
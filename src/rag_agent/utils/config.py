@@ -3,7 +3,8 @@ document_pipeline_config = {
     "extracting_on" : False,
     "processing_on" : False,
     "embedding_on" : True,
-    "upserting_on" : False
+    "upserting_on" : False,
+    "streaming_on" : False
 }
 
 folders = {
@@ -11,13 +12,140 @@ folders = {
     "extracted":"intermediate/extracted",
     "processed":"intermediate/processed",
     "embedded":"intermediate/embedded",
-    "final":"intermediate/final"
+    "final":"intermediate/final",
+    "manifest":"intermediate/manifest.json"
 }
 
+# Bump when a change to extraction/processing/embedding code or to an intermediate artifact format should invalidate the ingestion manifest.
+# The settings of the stages are fingerprinted separately (agent.ingestion_manifest.pipeline_config_version).
+# 2 : content derived chunk ids, .npy embedded batches, columnar table files, txt/csv/docx readers.
+# 3 : intermediates and document_name keyed on the full source file name (report.pdf.jsonl), not its stem.
+# 4 : dedup duplicate_of pointers are the vector store unique_id of the canonical chunk.
+# 5 : PDF text is split across page breaks, text records carry page_end.
+PIPELINE_VERSION = "5"
+
 allowed_extentions = ['.pdf', '.txt', '.csv', '.docx']
 
+extraction_config = {
+    "parallel" : True,
+    "max_workers" : 4,
+    "file_timeout" : 600
+}
+
+# Streaming readers for non-PDF inputs (agent.document_reader), memory stays bounded whatever the file size.
+# text_window_chars : .txt files are read and split in windows of about this many characters, cut at a paragraph break when possible.
+# csv_chunk_chars : CSV rows are grouped until the rendered group reaches this many characters, the header is repeated in every group.
+# csv_max_rows : Upper bound on rows per CSV group.
+reader_config = {
+    "text_window_chars" : 200000,
+    "csv_chunk_chars" : 1000,
+    "csv_max_rows" : 200
+}
+
+# Text splitter shared by the extraction and OCR stages (agent.text_splitter), same chunks as RecursiveCharacterTextSplitter.
+# length : 'chars' or 'tokens' (utils.utils.count_tokens); chunk_size and chunk_overlap are in that unit.
+splitter_config = {
+    "chunk_size" : 1000,
+    "chunk_overlap" : 200,
+    "length" : "chars"
+}
+
+# prefilter : skip find_tables() on pages without at least min_ruling_lines horizontal and min_ruling_lines vertical ruling lines.
+#             find_tables() builds cells from ruling lines, so such pages cannot yield a table.
+# storage : 'parquet' (needs pyarrow, falls back to columnar JSON without it) or 'json'. Tables are written to <name>.tables.<ext>
+#           next to the extracted records, which keep a text rendering and a pointer to the table.
+table_config = {
+    "prefilter" : True,
+    "min_ruling_lines" : 2,
+    "storage" : "parquet"
+}
+
+# Opt-in OCR of scanned pages. Only pages with fewer than min_text_chars characters of extracted text are OCR'd, images smaller than
+# min_image_pixels are ignored. Images are deduplicated by byte hash and their text cached in cache_path, so re-ingests never OCR an image twice.
+# window_pages : low-text pages whose images are read, looked up in the cache and sent to the pool together; bounds the image bytes in memory.
+ocr_config = {
+    "enabled" : False,
+    "min_text_chars" : 50,
+    "min_image_pixels" : 10000,
+    "window_pages" : 16,
+    "max_workers" : 2,
+    "lang" : "eng",
+    "cache_path" : "intermediate/cache/ocr_cache.sqlite"
+}
+
+# Near-duplicate chunk elimination between extraction and embedding (MinHash + LSH over word shingles).
+# Chunks whose estimated Jaccard similarity to an earlier chunk of the corpus reaches threshold are marked duplicate_of it and not embedded.
+# num_perm = bands * rows per band; more bands catch lower similarities. Chunks under min_tokens words are never collapsed,
+# nor are chunks whose numbers differ. Off by default: a dropped chunk is only reachable through the canonical one.
+dedup_config = {
+    "enabled" : False,
+    "num_perm" : 128,
+    "bands" : 16,
+    "threshold" : 0.8,
+    "shingle_size" : 5,
+    "min_tokens" : 20,
+    "index_path" : "intermediate/cache/dedup_index"
+}
+
+# Streaming mode overlaps extraction, embedding and upsert. Stages are connected by bounded queues:
+# file_queue_size extracted files wait for embedding, upsert_queue_size embedded batch files wait for upsert.
+# Stage throughput and queue depth are printed every report_interval seconds.
+streaming_pipeline_config = {
+    "file_queue_size" : 4,
+    "upsert_queue_size" : 16,
+    "report_interval" : 10
+}
+
+# /document_upload queues a background ingestion job and returns its id; GET /document_upload/{job_id} reports its progress.
+# Jobs run one at a time, each in its own process, so ingestion never competes with requests for the API process GIL.
+# Finished jobs stay pollable until more than max_finished_jobs have finished.
+# start_method : multiprocessing start method of the job process. 'spawn' starts a fresh interpreter, which is safe from a
+#                threaded server; 'fork' inherits the parent's in-memory state (and its locks) and starts faster.
+ingestion_jobs_config = {
+    "max_finished_jobs" : 200,
+    "start_method" : "spawn"
+}
+
+# backend : 'nomic' (remote API), 'sentence_transformer' (local CPU model, set "model" to a local path or cached model name) or 'hashing' (offline, deterministic).
+embedding_config = {
+    "backend" : "nomic",
+    "model" : "nomic-embed-text-v1",
+    "dimension" : 768,
+    "batch_size" : 64,
+    "num_threads" : 4,
+    "max_in_flight" : 4,
+    "max_retries" : 3,
+    "retry_backoff" : 1.0
+}
+
+# Embedded batches (agent.embedded_batch) are stored as a vectors.npy block plus a columnar metadata file, so vectors can be
+# memory mapped instead of parsed. dtype : 'float32' or 'float16' for the vector block. metadata_storage : 'parquet' (needs pyarrow) or 'json'.
+# The number of chunks per batch is embedding_config['batch_size'].
+embedded_batch_config = {
+    "dtype" : "float32",
+    "metadata_storage" : "parquet"
+}
+
+# Write-ahead log of embedded batches (agent.embedding_log). A batch is logged once its file is on disk, and logged chunks are never embedded again.
+# The upsert stage replays the log from its last committed batch, publishing a store snapshot every commit_rows rows
+# and then committing the log up to the last published batch. Committed entries are compacted away once the log exceeds compact_bytes.
+embedding_log_config = {
+    "path" : "intermediate/embedded/embedding_wal.log",
+    "commit_rows" : 50000,
+    "compact_bytes" : 16 * 1024 * 1024
+}
+
+embedding_cache_config = {
+    "enabled" : True,
+    "path" : "intermediate/cache/embedding_cache.sqlite",
+    "max_entries" : 500000
+}
+
+# chunk_method : 'use_existing' (one block per record), 'by_type' (new block at every 'page_text' record) or 'by_page' / 'page_number' (new block when the page changes).
+# max_block_tokens : a block is closed before it would grow past this many tokens (utils.utils.count_tokens), whatever the chunk_method.
 processor_config = {
     "chunk_method":"page_number",
+    "max_block_tokens":2000,
     "type_lowercase_match" : ['listitem','image','table','title','compositeelement'],
     "type_word_within":['text'],
     "type_table" : ['table'],
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator
+
+
+def file_content_hash(path:Path,block_size:int=1<<20) -> str:
+    """
+        Computes the sha256 hex digest of a file, reading it in fixed size blocks.
+        Args:
+            path(Path) : File to hash.
+            block_size(int) : Bytes read per iteration.
+        Returns:
+            str : Hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path,"rb") as f:
+        for block in iter(lambda: f.read(block_size),b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class JsonlWriter(object):
+    """
+        Streams records to a line-delimited JSON (.jsonl) file, one compact record per line.
+        Records go to a temporary file that is renamed into place on a clean exit, so readers never see a half written file.
+        With fsync the data is flushed to disk before the rename, for files other state (e.g. a write-ahead log) will point to.
+        Usage:
+            with JsonlWriter(path) as writer:
+                writer.write(record)
+    """
+    def __init__(self,path:Path,fsync:bool=False):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        self.fsync = fsync
+        self.n_records = 0
+        self._f = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True,exist_ok=True)
+        self._f = open(self.tmp_path,"w",encoding="utf-8")
+        return self
+
+    def write(self,record:dict):
+        self._f.write(json.dumps(record,ensure_ascii=False,separators=(",",":")))
+        self._f.write("\n")
+        self.n_records += 1
+
+    def write_many(self,records):
+        for record in records:
+            self.write(record)
+
+    def __exit__(self,exc_type,exc,tb):
+        if exc_type is None and self.fsync:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+        self._f.close()
+        if exc_type is None:
+            os.replace(self.tmp_path,self.path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+        return False
+
+
+def iter_records(path:Path) -> Iterator[dict]:
+    """
+        Yields the records of an intermediate file one at a time.
+        Line-delimited files are streamed at constant memory. Legacy files holding a single JSON list (the format the stages wrote before .jsonl)
+        are detected from their first character and loaded whole for backwards compatibility.
+        Args:
+            path(Path) : .jsonl or legacy .json file.
+        Yields:
+            dict : One record.
+    """
+    with open(path,"r",encoding="utf-8") as f:
+        first = f.read(1)
+        while first and first.isspace():
+            first = f.read(1)
+        if first == "[":
+            f.seek(0)
+            yield from json.load(f)
+            return
+        f.seek(0)
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+# Words and individual punctuation marks; roughly one BPE token each for English prose.
+_APPROX_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=None)
+def _tiktoken_encoding(encoding_name:str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding(encoding_name)
+
+
+def count_tokens(text:str,encoding_name:str="cl100k_base") -> int:
+    """
+        Counts the tokens of a text with tiktoken when it is installed.
+        Without tiktoken, words and punctuation marks are counted instead, which is close enough for sizing blocks and chunks.
+        Args:
+            text(str) : Text to measure.
+            encoding_name(str) : tiktoken encoding.
+        Returns:
+            int : Token count.
+    """
+    encoding = _tiktoken_encoding(encoding_name)
+    if encoding is not None:
+        return len(encoding.encode(text,disallowed_special=()))
+    return sum(1 for _ in _APPROX_TOKEN_PATTERN.finditer(text))